@@ -1,6 +1,7 @@
+import atexit
 import os
 import logging
-from flask import Flask
+from flask import Flask, g, request
 from flask_login import LoginManager
 from flask_pymongo import PyMongo
 
@@ -12,6 +13,10 @@ logger = logging.getLogger(__name__)
 app = Flask(__name__)
 app.secret_key = os.environ.get("SESSION_SECRET", "dev-secret-key")
 
+# How the analyzer page delivers results: 'jobs' queues the analysis and polls
+# for it, 'stream' runs it in the request and streams tokens as they arrive
+app.config["ANALYZER_DELIVERY"] = os.environ.get("ANALYZER_DELIVERY", "jobs")
+
 # Configure MongoDB
 app.config["MONGO_URI"] = os.environ.get("MONGO_URI", "mongodb://localhost:27017/financial_analyzer")
 mongo = PyMongo(app)
@@ -21,6 +26,48 @@ login_manager = LoginManager()
 login_manager.init_app(app)
 login_manager.login_view = 'auth.login'
 
+# Configure tracing; while it is off every span is a shared no-op
+from services import tracing
+
+if os.environ.get("TRACING_ENABLED", "false").lower() == "true":
+    if os.environ.get("TRACING_EXPORTER", "file") == "otlp":
+        trace_exporter = tracing.OTLPHttpExporter(os.environ.get("TRACING_OTLP_ENDPOINT", "http://localhost:4318"))
+    else:
+        trace_exporter = tracing.FileExporter(
+            os.environ.get("TRACING_FILE_PATH", os.path.join(app.instance_path, "traces.jsonl"))
+        )
+    tracer = tracing.configure(
+        trace_exporter,
+        service_name=os.environ.get("TRACING_SERVICE_NAME", "financial-analyzer"),
+        sample_rate=float(os.environ.get("TRACING_SAMPLE_RATE", 1.0))
+    )
+    atexit.register(tracer.flush)
+
+    @app.before_request
+    def start_request_span():
+        # One server span per request, joined to the caller's trace when it sends a traceparent
+        route = request.url_rule.rule if request.url_rule else "unmatched"
+        g.request_span = tracing.span(
+            f"{request.method} {route}",
+            kind=tracing.KIND_SERVER,
+            parent=tracing.parent_from_traceparent(request.headers.get("traceparent")),
+            **{"http.request.method": request.method, "http.route": route, "url.path": request.path}
+        )
+        g.request_span.__enter__()
+
+    @app.after_request
+    def record_response_status(response):
+        if "request_span" in g:
+            g.request_span.set_attribute("http.response.status_code", response.status_code)
+        return response
+
+    @app.teardown_request
+    def end_request_span(exc):
+        # Streamed responses tear down once the stream is finished
+        span = g.pop("request_span", None)
+        if span is not None:
+            span.__exit__(type(exc) if exc else None, exc, None)
+
 # Import and register blueprints
 from routes.auth_routes import auth_bp
 from routes.analyzer_routes import analyzer_bp
@@ -33,32 +80,210 @@ from models import User
 
 @login_manager.user_loader
 def load_user(user_id):
-    from bson import ObjectId
-    try:
-        # Convert string ID to ObjectId
-        user_data = mongo.db.users.find_one({"_id": ObjectId(user_id)})
-        if user_data:
-            return User(user_data)
-        return None
-    except Exception as e:
-        logger.error(f"Error loading user: {str(e)}")
-        return None
+    # Served from the user cache, so most requests skip the users collection
+    return mongodb_service.get_session_user(user_id)
 
 # Initialize services
+from services.cache import create_cache_backend
+from services.resilience import CircuitBreaker
 from services.tavily_service import TavilyService
 from services.groq_service import GroqService
-from services.mongodb_service import MongoDBService
+from services.knowledge_index import KnowledgeIndex
+from services.model_router import ModelRouter, ModelTier
+from services.mongodb_service import MongoDBService, QueryPlanError
 from services.yfinance_service import YFinanceService
+from services.context_service import FinancialContextService
+from services.market_data_cache import MarketDataCache
+from services.symbol_extractor import SymbolExtractor
+from services.response_cache import ResponseCache
+
+tavily_service = TavilyService(
+    api_key=os.environ.get("TAVILY_API_KEY"),
+    pool_size=int(os.environ.get("HTTP_POOL_SIZE", 10)),
+    connect_timeout=float(os.environ.get("TAVILY_CONNECT_TIMEOUT", 5)),
+    read_timeout=float(os.environ.get("TAVILY_READ_TIMEOUT", 20)),
+    cache=create_cache_backend(
+        os.environ.get("TAVILY_CACHE_BACKEND", "memory"),
+        "tavily",
+        path=os.environ.get("TAVILY_CACHE_PATH"),
+        max_entries=int(os.environ.get("TAVILY_CACHE_MAX_ENTRIES", 500)),
+        max_bytes=int(os.environ.get("TAVILY_CACHE_MAX_BYTES", 32 * 1024 * 1024))
+    ),
+    cache_ttl=float(os.environ.get("TAVILY_CACHE_TTL_SECONDS", 120)),
+    stale_ttl=float(os.environ.get("TAVILY_STALE_TTL_SECONDS", 600)),
+    max_sync_backoff=float(os.environ.get("TAVILY_MAX_SYNC_BACKOFF_SECONDS", 2)),
+    circuit_breaker=CircuitBreaker(
+        "tavily",
+        failure_rate_threshold=float(os.environ.get("TAVILY_BREAKER_FAILURE_RATE", 0.5)),
+        min_calls=int(os.environ.get("TAVILY_BREAKER_MIN_CALLS", 5)),
+        window_seconds=float(os.environ.get("TAVILY_BREAKER_WINDOW_SECONDS", 60)),
+        cooldown_seconds=float(os.environ.get("TAVILY_BREAKER_COOLDOWN_SECONDS", 30))
+    )
+)
+knowledge_index = KnowledgeIndex.load_or_build(
+    os.environ.get("KNOWLEDGE_SOURCE_DIR", os.path.join(app.root_path, "data", "finance_wisdom")),
+    os.environ.get("KNOWLEDGE_INDEX_PATH", os.path.join(app.instance_path, "knowledge.idx")),
+    auto_build=os.environ.get("KNOWLEDGE_INDEX_AUTO_BUILD", "true").lower() == "true"
+)
+groq_service = GroqService(
+    api_key=os.environ.get("GROQ_API_KEY"),
+    pool_size=int(os.environ.get("HTTP_POOL_SIZE", 10)),
+    connect_timeout=float(os.environ.get("GROQ_CONNECT_TIMEOUT", 5)),
+    read_timeout=float(os.environ.get("GROQ_READ_TIMEOUT", 60)),
+    prompt_budget=int(os.environ.get("GROQ_PROMPT_TOKEN_BUDGET", 3000)),
+    max_article_tokens=int(os.environ.get("GROQ_MAX_ARTICLE_TOKENS", 400)),
+    knowledge_index=knowledge_index,
+    knowledge_top_k=int(os.environ.get("KNOWLEDGE_TOP_K", 3)),
+    router=ModelRouter(
+        [
+            ModelTier(
+                "deep",
+                os.environ.get("GROQ_DEEP_MODEL", "llama-3.3-70b-versatile"),
+                max_tokens=int(os.environ.get("GROQ_DEEP_MAX_TOKENS", 1000)),
+                latency_slo=float(os.environ.get("GROQ_DEEP_LATENCY_SLO_SECONDS", 20))
+            ),
+            ModelTier(
+                "fast",
+                os.environ.get("GROQ_FAST_MODEL", "llama-3.1-8b-instant"),
+                max_tokens=int(os.environ.get("GROQ_FAST_MAX_TOKENS", 600)),
+                latency_slo=float(os.environ.get("GROQ_FAST_LATENCY_SLO_SECONDS", 5))
+            ),
+        ],
+        degraded_seconds=float(os.environ.get("GROQ_DEGRADED_SECONDS", 60))
+    )
+)
+mongodb_service = MongoDBService(
+    mongo.db,
+    compression=os.environ.get("MONGO_COMPRESSION", "auto"),
+    compression_level=int(os.environ.get("MONGO_COMPRESSION_LEVEL", 6)),
+    user_cache=create_cache_backend(
+        os.environ.get("USER_CACHE_BACKEND", "memory"),
+        "user",
+        path=os.environ.get("USER_CACHE_PATH"),
+        max_entries=int(os.environ.get("USER_CACHE_MAX_ENTRIES", 10000)),
+        max_bytes=int(os.environ.get("USER_CACHE_MAX_BYTES", 4 * 1024 * 1024))
+    ),
+    user_cache_ttl=float(os.environ.get("USER_CACHE_TTL_SECONDS", 300))
+)
+if os.environ.get("MONGO_ENSURE_INDEXES", "true").lower() in ("1", "true", "yes"):
+    try:
+        mongodb_service.ensure_indexes()
+        if os.environ.get("MONGO_VERIFY_QUERY_PLANS", "false").lower() in ("1", "true", "yes"):
+            # Raises QueryPlanError and stops startup if a hot query would scan a collection
+            mongodb_service.verify_query_plans()
+    except QueryPlanError:
+        raise
+    except Exception as e:
+        logger.error(f"Could not ensure MongoDB indexes: {str(e)}")
+market_data_cache = MarketDataCache(
+    create_cache_backend(
+        os.environ.get("MARKET_CACHE_BACKEND", "memory"),
+        "market_data",
+        path=os.environ.get("MARKET_CACHE_PATH"),
+        max_entries=int(os.environ.get("MARKET_CACHE_MAX_ENTRIES", 2048)),
+        max_bytes=int(os.environ.get("MARKET_CACHE_MAX_BYTES", 16 * 1024 * 1024))
+    ),
+    quote_ttl=float(os.environ.get("QUOTE_TTL_SECONDS", 15)),
+    fundamentals_ttl=float(os.environ.get("FUNDAMENTALS_TTL_SECONDS", 86400))
+)
+yfinance_service = YFinanceService(cache=market_data_cache)
+symbol_extractor = SymbolExtractor.from_csv(
+    os.environ.get("SYMBOL_LIST_PATH", os.path.join(app.root_path, "data", "symbols", "nse_equity.csv")),
+    aliases_path=os.environ.get("SYMBOL_ALIASES_PATH", os.path.join(app.root_path, "data", "symbols", "nse_aliases.csv"))
+)
+context_service = FinancialContextService(
+    tavily_service,
+    yfinance_service,
+    max_workers=int(os.environ.get("CONTEXT_MAX_WORKERS", 8)),
+    news_workers=int(os.environ.get("CONTEXT_NEWS_WORKERS", 4)),
+    max_lookups_per_request=int(os.environ.get("CONTEXT_MAX_LOOKUPS_PER_REQUEST", 3)),
+    news_timeout=float(os.environ.get("NEWS_TIMEOUT_SECONDS", 25)),
+    stock_timeout=float(os.environ.get("STOCK_TIMEOUT_SECONDS", 10))
+)
+response_cache = ResponseCache(
+    create_cache_backend(
+        os.environ.get("RESPONSE_CACHE_BACKEND", "memory"),
+        "response",
+        path=os.environ.get("RESPONSE_CACHE_PATH"),
+        max_entries=int(os.environ.get("RESPONSE_CACHE_MAX_ENTRIES", 1000)),
+        max_bytes=int(os.environ.get("RESPONSE_CACHE_MAX_BYTES", 64 * 1024 * 1024))
+    ),
+    ttl=float(os.environ.get("RESPONSE_CACHE_TTL_SECONDS", 900)),
+    bucket_seconds=float(os.environ.get("RESPONSE_CACHE_BUCKET_SECONDS", 900)),
+    similarity_threshold=float(os.environ.get("RESPONSE_CACHE_SIMILARITY", 0.8)),
+    min_near_tokens=int(os.environ.get("RESPONSE_CACHE_MIN_NEAR_TOKENS", 4))
+)
+
+# Optional asyncio service layer: analysis jobs run on one event loop that holds
+# the upstream I/O of every in-flight analysis instead of a thread per job
+async_runtime = None
+if os.environ.get("ASYNC_SERVICES", "false").lower() in ("1", "true", "yes"):
+    from motor.motor_asyncio import AsyncIOMotorClient
+    from services.async_services import (
+        AsyncRuntime, AsyncTavilyService, AsyncGroqService, AsyncYFinanceService,
+        AsyncMongoDBService, AsyncFinancialContextService
+    )
+
+    async_runtime = AsyncRuntime(offload_workers=int(os.environ.get("ASYNC_OFFLOAD_WORKERS", 16)))
+    async_pool_size = int(os.environ.get("ASYNC_HTTP_POOL_SIZE", 200))
+    async_tavily_service = AsyncTavilyService(tavily_service, pool_size=async_pool_size)
+    app.async_groq_service = AsyncGroqService(groq_service, pool_size=async_pool_size)
+    app.async_mongodb_service = AsyncMongoDBService(
+        AsyncIOMotorClient(app.config["MONGO_URI"], io_loop=async_runtime.loop).get_default_database(),
+        mongodb_service.compressor
+    )
+    app.async_context_service = AsyncFinancialContextService(
+        async_tavily_service,
+        AsyncYFinanceService(yfinance_service),
+        news_timeout=float(os.environ.get("NEWS_TIMEOUT_SECONDS", 25)),
+        stock_timeout=float(os.environ.get("STOCK_TIMEOUT_SECONDS", 10))
+    )
+
+# Analyses run on a local worker pool; the web tier only queues them. With the
+# async layer they run as tasks on its event loop instead, so a job waiting on
+# an upstream holds no thread and the defaults allow hundreds in flight.
+from services.job_queue import AnalysisJobQueue
+from routes.analyzer_routes import run_analysis, run_analysis_async
 
-tavily_service = TavilyService(api_key=os.environ.get("TAVILY_API_KEY"))
-groq_service = GroqService(api_key=os.environ.get("GROQ_API_KEY"))
-mongodb_service = MongoDBService(mongo.db)
+if async_runtime is not None:
+    async def run_analysis_job(job, limiter, progress):
+        return (await run_analysis_async(app, job.user_id, job.query, limiter, progress))[2]
+
+    queue_defaults = {"workers": 200, "max_pending": 1000, "context": 200, "groq": async_pool_size}
+else:
+    def run_analysis_job(job, limiter, progress):
+        return run_analysis(app, job.user_id, job.query, limiter, progress)[2]
+
+    queue_defaults = {"workers": 4, "max_pending": 100, "context": 4, "groq": 2}
+
+analysis_jobs = AnalysisJobQueue(
+    run_analysis_job,
+    workers=int(os.environ.get("ANALYSIS_WORKERS", queue_defaults["workers"])),
+    max_pending=int(os.environ.get("ANALYSIS_QUEUE_MAX_PENDING", queue_defaults["max_pending"])),
+    max_pending_per_user=int(os.environ.get("ANALYSIS_QUEUE_MAX_PER_USER", 3)),
+    upstream_limits={
+        "context": int(os.environ.get("ANALYSIS_CONTEXT_CONCURRENCY", queue_defaults["context"])),
+        "groq": int(os.environ.get("ANALYSIS_GROQ_CONCURRENCY", queue_defaults["groq"]))
+    },
+    store=mongodb_service,
+    runtime=async_runtime
+)
 # alpha_vantage_service = AlphaVantageService(api_key=os.environ.get("ALPHA_VANTAGE_API_KEY"))
 
 # Make services available to the app context
 app.tavily_service = tavily_service
 app.groq_service = groq_service
 app.mongodb_service = mongodb_service
-app.yfinance_service = YFinanceService()
+app.yfinance_service = yfinance_service
+app.context_service = context_service
+app.symbol_extractor = symbol_extractor
+app.knowledge_index = knowledge_index
+app.response_cache = response_cache
+app.async_runtime = async_runtime
+app.analysis_jobs = analysis_jobs
+
+# Maintenance commands (flask --app main ensure-indexes, check-query-plans, ...)
+from commands import register_commands
+register_commands(app)
 
 logger.info("Application initialized successfully")
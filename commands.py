@@ -0,0 +1,112 @@
+"""
+Flask CLI commands for database and index maintenance.
+
+Run with `flask --app main <command>`.
+"""
+
+import os
+import click
+from flask import current_app
+from services.data_transfer import FORMATS, export_collection, import_collection
+from services.knowledge_index import KnowledgeIndex
+from services.mongodb_service import QueryPlanError, TRANSFER_COLLECTIONS
+
+def register_commands(app):
+    """Attach the maintenance commands to the app's CLI."""
+
+    @app.cli.command("ensure-indexes")
+    def ensure_indexes():
+        """Create the MongoDB indexes the app's queries rely on."""
+        names = current_app.mongodb_service.ensure_indexes()
+        click.echo(f"Ensured {len(names)} indexes: {', '.join(names)}")
+
+    @app.cli.command("check-query-plans")
+    def check_query_plans():
+        """Explain the hot queries and fail if any of them scans a collection."""
+        try:
+            plans = current_app.mongodb_service.verify_query_plans()
+        except QueryPlanError as e:
+            raise click.ClickException(str(e))
+        for description, stages in plans.items():
+            click.echo(f"{description}: {' > '.join(stages)}")
+
+    @app.cli.command("train-compression-dictionary")
+    @click.option("--samples", default=500, show_default=True, help="Analyses and articles to sample.")
+    def train_compression_dictionary(samples):
+        """Train the compression dictionary on stored analyses and articles."""
+        dictionary_id, size, count = current_app.mongodb_service.train_compression_dictionary(samples)
+        click.echo(f"Dictionary {dictionary_id}: {size} bytes from {count} samples")
+
+    @app.cli.command("dedupe-stored-contexts")
+    @click.option("--batch-size", default=500, show_default=True, help="Analyses per bulk write.")
+    def dedupe_stored_contexts(batch_size):
+        """Move articles and stock data embedded in older analyses into the shared content store."""
+        converted = current_app.mongodb_service.dedupe_stored_contexts(
+            batch_size,
+            progress=lambda count: click.echo(f"financial_analyses: {count} converted")
+        )
+        click.echo(f"financial_analyses: done, {converted} analyses converted")
+
+    @app.cli.command("compress-stored-fields")
+    @click.option("--batch-size", default=500, show_default=True, help="Documents per bulk write.")
+    def compress_stored_fields(batch_size):
+        """Compress analysis HTML and article bodies still stored as plain text, embedded ones included."""
+        updated = current_app.mongodb_service.compress_stored_fields(
+            batch_size,
+            progress=lambda collection, count: click.echo(f"{collection}: {count} compressed")
+        )
+        for collection, count in updated.items():
+            click.echo(f"{collection}: done, {count} documents compressed")
+
+
+    @app.cli.command("export-data")
+    @click.argument("collection", type=click.Choice(TRANSFER_COLLECTIONS))
+    @click.argument("path", type=click.Path(dir_okay=False, writable=True))
+    @click.option("--format", "file_format", type=click.Choice(FORMATS),
+                  help="File format (default: parquet for .parquet paths, otherwise NDJSON).")
+    @click.option("--batch-size", default=1000, show_default=True, help="Documents per cursor batch.")
+    def export_data(collection, path, file_format, batch_size):
+        """Stream a collection to an NDJSON (optionally .gz) or Parquet file."""
+        try:
+            exported = export_collection(
+                current_app.mongodb_service, collection, path, file_format, batch_size,
+                progress=lambda count: click.echo(f"{collection}: {count} exported")
+            )
+        except RuntimeError as e:
+            raise click.ClickException(str(e))
+        click.echo(f"{collection}: done, {exported} documents written to {path}")
+
+    @app.cli.command("import-data")
+    @click.argument("collection", type=click.Choice(TRANSFER_COLLECTIONS))
+    @click.argument("path", type=click.Path(exists=True, dir_okay=False))
+    @click.option("--format", "file_format", type=click.Choice(FORMATS),
+                  help="File format (default: parquet for .parquet paths, otherwise NDJSON).")
+    @click.option("--batch-size", default=1000, show_default=True, help="Documents per bulk insert.")
+    def import_data(collection, path, file_format, batch_size):
+        """Bulk insert a file written by export-data; documents already present are skipped."""
+        try:
+            inserted, skipped = import_collection(
+                current_app.mongodb_service, collection, path, file_format, batch_size,
+                progress=lambda inserted, skipped: click.echo(f"{collection}: {inserted} imported, {skipped} skipped")
+            )
+        except RuntimeError as e:
+            raise click.ClickException(str(e))
+        click.echo(f"{collection}: done, {inserted} documents imported, {skipped} already present")
+
+
+    @app.cli.command("build-knowledge-index")
+    @click.option("--source-dir", default=lambda: os.environ.get(
+        "KNOWLEDGE_SOURCE_DIR", os.path.join(current_app.root_path, "data", "finance_wisdom")
+    ), help="Directory of knowledge documents.")
+    @click.option("--index-path", default=lambda: os.environ.get(
+        "KNOWLEDGE_INDEX_PATH", os.path.join(current_app.instance_path, "knowledge.idx")
+    ), help="Index file to write.")
+    @click.option("--force", is_flag=True, help="Rebuild even if the sources are unchanged.")
+    def build_knowledge_index(source_dir, index_path, force):
+        """Compile the knowledge documents into the memory-mapped index file."""
+        if not KnowledgeIndex.compile(source_dir, index_path, force=force):
+            click.echo(f"{index_path} is up to date")
+            return
+        index = KnowledgeIndex.load(index_path)
+        click.echo(f"{index_path}: {len(index)} passages, {len(index.terms)} terms, "
+                   f"checksum {index.checksum.hex()[:12]}")
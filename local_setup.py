@@ -17,7 +17,7 @@ def check_python_version():
     print(f"Using Python {sys.version_info.major}.{sys.version_info.minor}.{sys.version_info.micro}")
 
 def check_mongodb():
-    """Check if MongoDB is running"""
+    """Check if MongoDB is running and create the indexes the app relies on"""
     print("Checking MongoDB connection...")
     try:
         import pymongo
@@ -27,6 +27,17 @@ def check_mongodb():
     except Exception as e:
         print(f"Warning: Could not connect to MongoDB: {e}")
         print("Please make sure MongoDB is running on localhost:27017")
+        return
+
+    from services.mongodb_service import MongoDBService
+    mongodb_service = MongoDBService(client["financial_analyzer"])
+    print("Creating MongoDB indexes...")
+    names = mongodb_service.ensure_indexes()
+    print(f"Indexes ready: {', '.join(names)}")
+    print("Checking query plans...")
+    # Raises QueryPlanError if a hot query would scan a whole collection
+    mongodb_service.verify_query_plans()
+    print("All hot queries use indexes")
 
 def create_env_file():
     """Create .env file if it doesn't exist"""
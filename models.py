@@ -50,3 +50,96 @@ class FinancialAnalysis:
             'analysis': self.analysis,
             'created_at': self.created_at
         }
+
+class AnalysisContext(dict):
+    """
+    Saved analysis context whose articles and stock snapshots load on first use.
+
+    Saved contexts hold only 'article_refs' and 'stock_refs'. Reading
+    'articles' or 'stock_data' (as a key, via get(), or as a template
+    attribute) calls the matching loader once and keeps the result.
+    Contexts saved before refs existed already contain both keys.
+    """
+
+    def __init__(self, context_data, load_articles, load_stock_snapshots):
+        super().__init__(context_data)
+        self._load_articles = load_articles
+        self._load_stock_snapshots = load_stock_snapshots
+
+    def __missing__(self, key):
+        if key == 'articles' and 'article_refs' in self:
+            value = self._load_articles(self['article_refs'])
+        elif key == 'stock_data' and 'stock_refs' in self:
+            value = self._load_stock_snapshots(self['stock_refs'])
+        else:
+            raise KeyError(key)
+        self[key] = value
+        return value
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+class FinancialAnalysisSummary:
+    """The few fields of an analysis shown in listings, read with a projection."""
+
+    # Projection for financial_analyses queries that build summaries
+    PROJECTION = {'query': 1, 'created_at': 1}
+
+    def __init__(self, analysis_data):
+        self.id = str(analysis_data.get('_id')) if analysis_data.get('_id') else None
+        self.query = analysis_data.get('query')
+        self.created_at = analysis_data.get('created_at')
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'query': self.query,
+            'created_at': self.created_at
+        }
+
+class AnalysisJob:
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+
+    def __init__(self, job_data=None):
+        job_data = job_data or {}
+        self.id = job_data.get('_id')
+        self.user_id = job_data.get('user_id')
+        self.query = job_data.get('query')
+        self.priority = job_data.get('priority')
+        self.status = job_data.get('status', self.QUEUED)
+        self.stage = job_data.get('stage')
+        self.analysis_id = job_data.get('analysis_id')
+        self.error = job_data.get('error')
+        self.created_at = job_data.get('created_at')
+        self.started_at = job_data.get('started_at')
+        self.finished_at = job_data.get('finished_at')
+        # Queue process that holds the job, and when that process last reported it alive
+        self.owner = job_data.get('owner')
+        self.heartbeat_at = job_data.get('heartbeat_at')
+
+    @property
+    def finished(self):
+        return self.status in (self.DONE, self.FAILED)
+
+    def to_dict(self):
+        return {
+            '_id': self.id,
+            'user_id': self.user_id,
+            'query': self.query,
+            'priority': self.priority,
+            'status': self.status,
+            'stage': self.stage,
+            'analysis_id': self.analysis_id,
+            'error': self.error,
+            'created_at': self.created_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+            'owner': self.owner,
+            'heartbeat_at': self.heartbeat_at
+        }
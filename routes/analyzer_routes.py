@@ -1,16 +1,29 @@
+import json
 import logging
-import re
-from flask import Blueprint, render_template, request, redirect, url_for, flash, current_app, jsonify
+from contextlib import nullcontext
+from flask import Blueprint, render_template, request, redirect, url_for, flash, current_app, jsonify, Response, stream_with_context
 from flask_login import login_required, current_user
-from datetime import datetime
+from models import AnalysisJob
+from services import tracing
+from services.job_queue import QueueFullError, UserQueueFullError
 
 logger = logging.getLogger(__name__)
 
 analyzer_bp = Blueprint('analyzer', __name__)
 
+# Upper bound on symbols accepted by the batch snapshot endpoint
+MAX_SNAPSHOT_SYMBOLS = 100
+
+# Analyses per history page, and the largest page /api/history serves
+HISTORY_PAGE_SIZE = 20
+MAX_HISTORY_PAGE_SIZE = 100
+
 def extract_stock_symbol(query):
     """
     Extract potential stock symbols from a query.
+
+    Uses the app's precompiled SymbolExtractor, which only returns symbols
+    listed in data/symbols/nse_equity.csv.
     
     Args:
         query (str): The financial query
@@ -18,60 +31,7 @@ def extract_stock_symbol(query):
     Returns:
         list: Extracted stock symbols
     """
-    # Look for common patterns like "INFY", "RELIANCE", "TCS" in the query
-    # This is a simple approach and can be improved with more sophisticated methods
-    
-    # Pattern for Indian stocks (typically uppercase letters, can include .BSE or .NSE)
-    patterns = [
-        r'\b([A-Z]{2,10})\b',                # General stock symbol pattern
-        r'\b([A-Z]{2,10})\.BSE\b',           # BSE specific
-        r'\b([A-Z]{2,10})\.NSE\b',           # NSE specific
-        r'\b([A-Z]{2,10})(?:\.INDIAIDX)?\b'  # Indian indices
-    ]
-    
-    # Common Indian stock names to look for
-    common_stocks = {
-        'RELIANCE': 'RELIANCE',
-        'INFY': 'INFY',
-        'TCS': 'TCS',
-        'WIPRO': 'WIPRO', 
-        'HDFCBANK': 'HDFCBANK',
-        'ICICIBANK': 'ICICIBANK',
-        'SBIN': 'SBIN',
-        'TATAMOTORS': 'TATAMOTORS',
-        'ONGC': 'ONGC',
-        'ITC': 'ITC',
-        'BHARTIARTL': 'BHARTIARTL',
-        'SUNPHARMA': 'SUNPHARMA',
-        'TECHM': 'TECHM',
-        'KOTAKBANK': 'KOTAKBANK',
-        'HINDUNILVR': 'HINDUNILVR',
-        'MARUTI': 'MARUTI',
-        'AXISBANK': 'AXISBANK',
-        'BAJAJFINSV': 'BAJAJFINSV',
-        'COALINDIA': 'COALINDIA',
-        'HCLTECH': 'HCLTECH',
-        'ZOMATO': 'ZOMATO',
-        'PAYTM': 'PAYTM',
-        'NYKAA': 'NYKAA'
-    }
-    
-    stock_symbols = []
-    
-    # First check for exact stock name mentions
-    query_upper = query.upper()
-    for stock_name, symbol in common_stocks.items():
-        if stock_name in query_upper:
-            stock_symbols.append(symbol)
-    
-    # Try regex patterns if no exact match is found
-    for pattern in patterns:
-        matches = re.findall(pattern, query_upper)
-        if matches:
-            # Add matches to stock symbols
-            stock_symbols.extend(matches)
-    
-    return list(set(stock_symbols))  # Return unique stock symbols
+    return current_app.symbol_extractor.extract(query)
 
 @analyzer_bp.route('/')
 def home():
@@ -91,95 +51,332 @@ def analyzer():
             return render_template('analyzer.html')
             
         try:
-            # Extract stock symbols if present in the query
-            stock_symbols = extract_stock_symbol(financial_query)
-            stock_data = []
-
-            # Get stock data if symbols were found and are relevant
-            stock_data = []
-            if stock_symbols and hasattr(current_app, 'yfinance_service'):
-
-                for stock_symbol in stock_symbols:
-                    logger.info(f"Extracting stock data for symbol: {stock_symbol}")
-                    data = current_app.yfinance_service.get_stock_data(stock_symbol)
-                    if data and data.get('error'):
-                        logger.warning(f"Error getting stock data: {data.get('error')}")
-                    else:
-                        stock_data.append(data)
-
-            # Get financial context from Tavily
-            logger.info(f"Getting financial context for query: {financial_query}")
-            context = current_app.tavily_service.get_financial_context(financial_query)
+            # Queue the analysis; the job page refreshes until it is done
+            job = current_app.analysis_jobs.submit(current_user.id, financial_query)
+            return redirect(url_for('analyzer.analysis_job', job_id=job.id), code=303)
             
-            # Ensure both Groq and Tavily are called, and stock data is displayed
-            context['stock_data'] = {}
-            if stock_symbols:
-                for symbol in stock_symbols:
-                    data = current_app.yfinance_service.get_stock_data(symbol)
-                    if data and data.get('error'):
-                        logger.warning(f"Error getting stock data for {symbol}: {data.get('error')}")
-                    else:
-                        context['stock_data'][symbol] = data  # Store data in a dictionary with symbol as key
+        except QueueFullError as e:
+            flash(str(e), 'warning')
+            return render_template('analyzer.html', query=financial_query)
+        except Exception as e:
+            logger.error(f"Error queueing financial query: {str(e)}")
+            flash('An error occurred while processing your query. Please try again.', 'danger')
+            return render_template('analyzer.html')
+    
+    # GET request - just show the form
+    return render_template('analyzer.html')
 
+@analyzer_bp.route('/analyzer/jobs', methods=['POST'])
+@login_required
+def create_analysis_job():
+    """
+    Queue an analysis and return its job id right away (202).
 
-            # Always call Groq service with the context
+    Refused with 503 when the queue is full and 429 when the user already
+    has too many unfinished jobs, both with a Retry-After header.
+    """
+    financial_query = request.form.get('query')
 
+    if not financial_query or len(financial_query.strip()) < 5:
+        return jsonify({"error": "Please enter a valid financial query (at least 5 characters)"}), 400
 
+    try:
+        job = current_app.analysis_jobs.submit(current_user.id, financial_query)
+    except QueueFullError as e:
+        status = 429 if isinstance(e, UserQueueFullError) else 503
+        return jsonify({"error": str(e)}), status, {"Retry-After": str(e.retry_after)}
 
+    return jsonify(_job_status(job)), 202
 
+@analyzer_bp.route('/analyzer/jobs/<job_id>')
+@login_required
+def analysis_job(job_id):
+    """
+    Status of a queued analysis.
 
-            context['has_stock_data'] = True if stock_data else False
-            
-            # Get analysis from Groq, ensuring the context is correct
-            logger.info(f"Analyzing financial query: {financial_query}")
-            analysis_result = current_app.groq_service.analyze_financial_query(financial_query, context)
+    Returns JSON to clients that ask for it. Browsers get a page that
+    refreshes until the job finishes and then redirects to the analysis.
+    """
+    job = current_app.analysis_jobs.get(job_id)
+    wants_json = request.accept_mimetypes.best_match(['application/json', 'text/html']) == 'application/json'
 
-            
-            # Save the analysis to the database
-            analysis_id = current_app.mongodb_service.save_financial_analysis(
-                current_user.id,
-                financial_query,
-                context,
-                analysis_result
-            )
-            
-            if analysis_id:
-                logger.info(f"Analysis saved with ID: {analysis_id}")
-            else:
-                logger.warning("Failed to save analysis to database")
-            
-            # Render the template with the analysis results
-            return render_template(
-                'analyzer.html',
-                query=financial_query,
-                context=context,
-                analysis=analysis_result,
-                timestamp=datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            )
-            
-        except Exception as e:
-            logger.error(f"Error processing financial query: {str(e)}")
-            flash('An error occurred while processing your query. Please try again.', 'danger')
-            return render_template('analyzer.html')
-    
-    # GET request - just show the form
-    return render_template('analyzer.html')
+    if not job or job.user_id != current_user.id:
+        if wants_json:
+            return jsonify({"error": "Job not found"}), 404
+        flash('Analysis not found or you do not have permission to view it', 'danger')
+        return redirect(url_for('analyzer.analyzer'))
+
+    if wants_json:
+        return jsonify(_job_status(job))
+
+    if job.status == AnalysisJob.DONE:
+        return redirect(url_for('analyzer.view_analysis', analysis_id=job.analysis_id))
+    if job.status == AnalysisJob.FAILED:
+        flash(job.error, 'danger')
+        return render_template('analyzer.html', query=job.query)
+    return render_template('analyzer.html', query=job.query, job=job)
+
+def run_analysis(app, user_id, financial_query, limiter=None, progress=None):
+    """
+    Run the analysis pipeline for a query and save the result.
+
+    Runs outside any request (in the job workers), so it takes the app
+    explicitly. Each upstream stage holds a limiter slot while it runs.
+
+    Args:
+        app (Flask): The application with its services attached
+        user_id (str): ID of the user who made the query
+        financial_query (str): The financial query
+        limiter (UpstreamLimiter): Optional per-upstream concurrency limits
+        progress (callable): Optional progress(stage) callback
+
+    Returns:
+        tuple: (context, analysis_result, analysis_id)
+    """
+    slot = limiter.slot if limiter is not None else (lambda name: nullcontext())
+    progress = progress or (lambda stage: None)
+
+    stock_symbols, cached = _lookup_response(app, financial_query)
+    if cached:
+        context, analysis_result = cached['context'], cached['analysis']
+    else:
+        # Fetch news and stock data for every symbol concurrently
+        progress("Gathering market data and news...")
+        logger.info(f"Getting financial context for query: {financial_query}")
+        # Stage spans include the wait for a limiter slot
+        with tracing.span("analysis.context"), slot("context"):
+            context = app.context_service.get_financial_context(financial_query, stock_symbols)
+
+        # Get analysis from Groq, ensuring the context is correct
+        progress("Generating analysis...")
+        logger.info(f"Analyzing financial query: {financial_query}")
+        with tracing.span("analysis.groq"), slot("groq"):
+            analysis_result = app.groq_service.analyze_financial_query(financial_query, context)
+        _cache_response(app.response_cache, financial_query, stock_symbols, context, analysis_result)
+
+    # Save the analysis to the database
+    progress("Saving analysis...")
+    with tracing.span("analysis.save"):
+        analysis_id = app.mongodb_service.save_financial_analysis(user_id, financial_query, context, analysis_result)
+    _log_saved(analysis_id)
+    return context, analysis_result, analysis_id
+
+async def run_analysis_async(app, user_id, financial_query, limiter=None, progress=None):
+    """
+    Coroutine version of run_analysis on the async services (ASYNC_SERVICES).
+
+    Runs as a task on the AsyncRuntime's loop and awaits every upstream
+    call, so a waiting analysis holds no thread.
+
+    Args:
+        app (Flask): The application with its async services attached
+        user_id (str): ID of the user who made the query
+        financial_query (str): The financial query
+        limiter (UpstreamLimiter): Optional per-upstream concurrency limits
+        progress (callable): Optional coroutine function progress(stage)
+
+    Returns:
+        tuple: (context, analysis_result, analysis_id)
+    """
+    slot = limiter.async_slot if limiter is not None else (lambda name: nullcontext())
+
+    stock_symbols, cached = _lookup_response(app, financial_query)
+    if cached:
+        context, analysis_result = cached['context'], cached['analysis']
+    else:
+        if progress:
+            await progress("Gathering market data and news...")
+        logger.info(f"Getting financial context for query: {financial_query}")
+        with tracing.span("analysis.context"):
+            async with slot("context"):
+                context = await app.async_context_service.get_financial_context(financial_query, stock_symbols)
+
+        if progress:
+            await progress("Generating analysis...")
+        logger.info(f"Analyzing financial query: {financial_query}")
+        with tracing.span("analysis.groq"):
+            async with slot("groq"):
+                analysis_result = await app.async_groq_service.analyze_financial_query(financial_query, context)
+        _cache_response(app.response_cache, financial_query, stock_symbols, context, analysis_result)
+
+    if progress:
+        await progress("Saving analysis...")
+    with tracing.span("analysis.save"):
+        analysis_id = await app.async_mongodb_service.save_financial_analysis(
+            user_id, financial_query, context, analysis_result
+        )
+    _log_saved(analysis_id)
+    return context, analysis_result, analysis_id
+
+@analyzer_bp.route('/analyzer/stream', methods=['POST'])
+@login_required
+def analyzer_stream():
+    """
+    Run an analysis and stream it to the page as server-sent events.
+
+    Events, in order: 'status' right away, 'context' once news and stock
+    data are in, one 'token' per chunk of generated text, then 'done'
+    with the saved analysis id (or 'error').
+    """
+    financial_query = request.form.get('query')
+
+    if not financial_query or len(financial_query.strip()) < 5:
+        return jsonify({"error": "Please enter a valid financial query (at least 5 characters)"}), 400
+
+    app = current_app._get_current_object()
+    user_id = current_user.id
+    request_span = tracing.current_span() or None
+
+    def generate():
+        yield _sse_event('status', {"message": "Gathering market data and news..."})
+        with tracing.span("analysis.stream", parent=request_span) as span:
+            try:
+                stock_symbols = extract_stock_symbol(financial_query)
+                cached = app.response_cache.lookup(financial_query, stock_symbols)
+                span.set_attributes({"analysis.symbols": len(stock_symbols), "cache.hit": bool(cached)})
+                if cached:
+                    context = cached['context']
+                else:
+                    logger.info(f"Getting financial context for query: {financial_query}")
+                    context = app.context_service.get_financial_context(financial_query, stock_symbols)
+
+                yield _sse_event('context', {
+                    "news_summary": context.get("news_summary"),
+                    "articles": context.get("articles", []),
+                    "stock_data": context.get("stock_data", {})
+                })
+
+                if cached:
+                    analysis_result = cached['analysis']
+                    yield _sse_event('token', {"text": analysis_result.get("analysis", "")})
+                else:
+                    logger.info(f"Streaming analysis for financial query: {financial_query}")
+                    analysis_result = yield from _relay_tokens(app.groq_service.stream_financial_query(financial_query, context))
+                    _cache_response(app.response_cache, financial_query, stock_symbols, context, analysis_result)
+
+                analysis_id = app.mongodb_service.save_financial_analysis(user_id, financial_query, context, analysis_result)
+                if analysis_id:
+                    logger.info(f"Analysis saved with ID: {analysis_id}")
+                else:
+                    logger.warning("Failed to save analysis to database")
+
+                yield _sse_event('done', {
+                    "analysis_id": analysis_id,
+                    "model": analysis_result.get("model"),
+                    "timestamp": analysis_result.get("timestamp"),
+                    "url": url_for('analyzer.view_analysis', analysis_id=analysis_id) if analysis_id else None
+                })
+            except Exception as e:
+                logger.error(f"Error streaming financial query: {str(e)}")
+                span.set_error(str(e))
+                yield _sse_event('error', {"message": "An error occurred while processing your query. Please try again."})
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+def _lookup_response(app, financial_query):
+    """Extract the query's stock symbols and look up a cached answer for it."""
+    with tracing.span("analysis.symbol_extraction") as span:
+        stock_symbols = app.symbol_extractor.extract(financial_query)
+        span.set_attribute("analysis.symbols", len(stock_symbols))
+
+    # Reuse a recent answer to the same (or a near-identical) question
+    with tracing.span("analysis.response_cache") as span:
+        cached = app.response_cache.lookup(financial_query, stock_symbols)
+        span.set_attribute("cache.hit", bool(cached))
+    return stock_symbols, cached
+
+def _log_saved(analysis_id):
+    if analysis_id:
+        logger.info(f"Analysis saved with ID: {analysis_id}")
+    else:
+        logger.warning("Failed to save analysis to database")
+
+def _job_status(job):
+    """JSON view of an analysis job for polling clients."""
+    return {
+        "job_id": job.id,
+        "status": job.status,
+        "stage": job.stage,
+        "error": job.error,
+        "status_url": url_for('analyzer.analysis_job', job_id=job.id),
+        "url": url_for('analyzer.view_analysis', analysis_id=job.analysis_id) if job.analysis_id else None
+    }
+
+def _sse_event(event, data):
+    """Format one server-sent event with a JSON payload."""
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+def _cache_response(response_cache, financial_query, stock_symbols, context, analysis_result):
+    """Cache a finished analysis unless it is degraded by an upstream failure (news or any stock lookup)."""
+    if analysis_result.get('error') or context.get('unavailable_sources'):
+        return
+    response_cache.store(financial_query, stock_symbols, context, analysis_result)
+
+def _relay_tokens(stream):
+    """Relay text chunks from a GroqService stream as 'token' events and return its final result."""
+    while True:
+        try:
+            chunk = next(stream)
+        except StopIteration as stop:
+            return stop.value
+        yield _sse_event('token', {"text": chunk})
 
 @analyzer_bp.route('/history')
 @login_required
 def history():
     """View analysis history"""
     try:
-        # Get the user's analysis history
-        analyses = current_app.mongodb_service.get_user_financial_analyses(current_user.id)
+        # Get one page of the user's analysis history (id, query and date only);
+        # main.js loads the following pages from /api/history as the user scrolls
+        analyses, next_cursor = current_app.mongodb_service.get_user_analysis_page(
+            current_user.id, limit=HISTORY_PAGE_SIZE, cursor=request.args.get('cursor')
+        )
         
-        return render_template('history.html', analyses=analyses)
+        return render_template('history.html', analyses=analyses, next_cursor=next_cursor)
         
+    except ValueError:
+        return redirect(url_for('analyzer.history'))
     except Exception as e:
         logger.error(f"Error retrieving analysis history: {str(e)}")
         flash('An error occurred while retrieving your analysis history.', 'danger')
         return redirect(url_for('analyzer.home'))
 
+@analyzer_bp.route('/api/history')
+@login_required
+def history_page():
+    """
+    One page of the user's analysis history as JSON.
+
+    Takes an optional `cursor` (from the previous page's next_cursor) and
+    `limit` (at most MAX_HISTORY_PAGE_SIZE).
+    """
+    limit = min(max(request.args.get('limit', HISTORY_PAGE_SIZE, type=int), 1), MAX_HISTORY_PAGE_SIZE)
+    try:
+        analyses, next_cursor = current_app.mongodb_service.get_user_analysis_page(
+            current_user.id, limit=limit, cursor=request.args.get('cursor')
+        )
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    return jsonify({
+        "analyses": [
+            {
+                "id": analysis.id,
+                "query": analysis.query,
+                "created_at": analysis.created_at.strftime('%Y-%m-%d %H:%M') if analysis.created_at else 'Unknown',
+                "url": url_for('analyzer.view_analysis', analysis_id=analysis.id),
+                "delete_url": url_for('analyzer.delete_analysis', analysis_id=analysis.id)
+            }
+            for analysis in analyses
+        ],
+        "next_cursor": next_cursor,
+        "next_url": url_for('analyzer.history_page', cursor=next_cursor, limit=limit) if next_cursor else None
+    })
+
 @analyzer_bp.route('/analysis/<analysis_id>')
 @login_required
 def view_analysis(analysis_id):
@@ -228,6 +425,46 @@ def delete_analysis(analysis_id):
         flash('An error occurred while deleting the analysis.', 'danger')
         return redirect(url_for('analyzer.history'))
 
+@analyzer_bp.route('/api/stocks/snapshot')
+@login_required
+def stock_snapshot():
+    """
+    Price snapshot for many symbols as a columnar JSON frame.
+
+    Takes a comma-separated `symbols` query parameter and defaults to the
+    Nifty 50 list. The response uses pandas' 'split' orientation:
+    {"columns": [...], "index": [...], "data": [[...], ...]}.
+    """
+    symbols_param = request.args.get('symbols', '')
+    symbols = [symbol.strip().upper() for symbol in symbols_param.split(',') if symbol.strip()]
+    if not symbols:
+        symbols = list(nifty_50_stocks.values())
+
+    if len(symbols) > MAX_SNAPSHOT_SYMBOLS:
+        return jsonify({"error": f"At most {MAX_SNAPSHOT_SYMBOLS} symbols are allowed"}), 400
+
+    try:
+        frame = current_app.yfinance_service.get_stock_data_many(symbols)
+        return current_app.response_class(frame.to_json(orient='split'), mimetype='application/json')
+    except Exception as e:
+        logger.error(f"Error building stock snapshot: {str(e)}")
+        return jsonify({"error": "Unable to fetch stock data at this time"}), 502
+
+@analyzer_bp.route('/api/metrics')
+@login_required
+def metrics():
+    """Cache, circuit breaker, model tier, context pool and job queue counters as JSON"""
+    return jsonify({
+        "market_data_cache": current_app.yfinance_service.cache_stats(),
+        "tavily_cache": current_app.tavily_service.cache_stats(),
+        "tavily_circuit": current_app.tavily_service.circuit_stats(),
+        "groq_models": current_app.groq_service.router_stats(),
+        "context_pool": current_app.context_service.stats(),
+        "analysis_jobs": current_app.analysis_jobs.stats(),
+        "user_cache": current_app.mongodb_service.user_cache.stats() if current_app.mongodb_service.user_cache else None,
+        "response_cache": current_app.response_cache.stats()
+    })
+
 # Define a dictionary of Nifty 50 stocks
 nifty_50_stocks = {
     'RELIANCE': 'RELIANCE',
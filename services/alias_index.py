@@ -0,0 +1,119 @@
+import logging
+from array import array
+
+logger = logging.getLogger(__name__)
+
+class AliasIndex:
+    """
+    Trigram index over company names and aliases for typo-tolerant lookup.
+
+    Aliases are stored once in a list and each trigram maps to a compact
+    array of alias ids. A lookup only computes edit distance for aliases
+    that share enough trigrams with the phrase to possibly be within the
+    allowed distance (an edit can destroy at most three trigrams, or four
+    for an adjacent transposition).
+    """
+
+    def __init__(self):
+        self._aliases = []
+        self._symbols = []
+        self._ids = {}
+        self._postings = {}
+
+    def __len__(self):
+        return len(self._aliases)
+
+    @staticmethod
+    def _trigrams(text):
+        padded = f"  {text} "
+        return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+    def add(self, alias, symbol):
+        """
+        Index an alias.
+
+        Args:
+            alias (str): Normalized alias (upper case, single-spaced tokens)
+            symbol (str): Canonical NSE symbol
+        """
+        if not alias or alias in self._ids:
+            return
+        alias_id = len(self._aliases)
+        self._ids[alias] = alias_id
+        self._aliases.append(alias)
+        self._symbols.append(symbol)
+        for gram in self._trigrams(alias):
+            self._postings.setdefault(gram, array("I")).append(alias_id)
+
+    def lookup(self, phrase, max_distance):
+        """
+        Find the closest alias within an edit distance.
+
+        Args:
+            phrase (str): Normalized phrase to resolve
+            max_distance (int): Largest edit distance accepted
+
+        Returns:
+            tuple: (symbol, alias, distance) of the best match, or None
+        """
+        alias_id = self._ids.get(phrase)
+        if alias_id is not None:
+            return self._symbols[alias_id], phrase, 0
+        if max_distance <= 0:
+            return None
+
+        grams = self._trigrams(phrase)
+        counts = {}
+        for gram in grams:
+            for candidate in self._postings.get(gram, ()):
+                counts[candidate] = counts.get(candidate, 0) + 1
+
+        best = None
+        min_shared = len(grams) - 4 * max_distance
+        for candidate, shared in counts.items():
+            if shared < min_shared:
+                continue
+            alias = self._aliases[candidate]
+            if abs(len(alias) - len(phrase)) > max_distance:
+                continue
+            distance = bounded_edit_distance(phrase, alias, max_distance)
+            if distance is not None and (best is None or distance < best[2]):
+                best = (self._symbols[candidate], alias, distance)
+                if distance == 1:
+                    break
+        return best
+
+
+def bounded_edit_distance(a, b, max_distance):
+    """
+    Optimal string alignment distance between a and b, if within max_distance.
+
+    Counts insertions, deletions, substitutions and adjacent transpositions
+    ('Relaince' -> 'Reliance' is one edit). Rows are abandoned as soon as no
+    cell can stay within the bound.
+
+    Args:
+        a (str): First string
+        b (str): Second string
+        max_distance (int): Largest distance of interest
+
+    Returns:
+        int: The distance, or None if it exceeds max_distance
+    """
+    if abs(len(a) - len(b)) > max_distance:
+        return None
+
+    previous_previous = None
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                current[j] = min(current[j], previous_previous[j - 2] + 1)
+        if min(current) > max_distance:
+            return None
+        previous_previous, previous = previous, current
+
+    return previous[-1] if previous[-1] <= max_distance else None
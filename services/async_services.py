@@ -0,0 +1,413 @@
+import asyncio
+import logging
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import httpx
+from pymongo.errors import BulkWriteError
+from services import tracing
+from services.context_service import fallback_context, keep_stock_result
+from services.groq_service import retry_after
+from services.tavily_service import failed_search
+from services.mongodb_service import MongoDBService, content_upserts, split_context
+from services.resilience import Deadline, RetryGuard
+from services.yfinance_service import TickerInfoMemo
+
+logger = logging.getLogger(__name__)
+
+class AsyncRuntime:
+    """
+    One event loop running in a daemon thread for the whole process.
+
+    Every async client is bound to this loop, and the job queue runs each
+    analysis on it as a task, so the upstream I/O of all in-flight
+    analyses is multiplexed on the loop instead of each holding a worker
+    thread. Blocking libraries (yfinance) run on the loop's default
+    executor via asyncio.to_thread.
+    """
+
+    def __init__(self, offload_workers=16, name="async-services"):
+        self.loop = asyncio.new_event_loop()
+        self.loop.set_default_executor(ThreadPoolExecutor(max_workers=offload_workers, thread_name_prefix=f"{name}-offload"))
+        self._thread = threading.Thread(target=self.loop.run_forever, name=name, daemon=True)
+        self._thread.start()
+        logger.info(f"Async runtime started with {offload_workers} offload workers")
+
+    def submit(self, coro):
+        """
+        Schedule a coroutine on the runtime's loop.
+
+        Returns:
+            concurrent.futures.Future: Future for the coroutine's result
+        """
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+
+def _http_client(base_url, api_key, timeout, pool_size):
+    """Pooled keep-alive AsyncClient with the same (connect, read) timeouts as the sync session."""
+    return httpx.AsyncClient(
+        base_url=base_url,
+        headers={
+            "Authorization": f"Bearer {api_key}",
+            "Content-Type": "application/json"
+        },
+        timeout=httpx.Timeout(timeout[1], connect=timeout[0]),
+        limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size)
+    )
+
+
+class AsyncTavilyService:
+    """
+    asyncio counterpart of TavilyService.
+
+    Shares the sync service's settings, search cache and circuit breaker,
+    so both paths see the same cached results and the same outage state.
+    Concurrent misses for one search await a single task. Cache reads are
+    synchronous, which is only cheap with the memory backend.
+    """
+
+    def __init__(self, tavily_service, pool_size=100):
+        self.tavily_service = tavily_service
+        self.client = _http_client(tavily_service.base_url, tavily_service.api_key, tavily_service.timeout, pool_size)
+        self._in_flight = {}
+        logger.info("Async Tavily service initialized")
+
+    async def search_financial_news(self, query, max_results=5, max_retries=3, deadline=None):
+        """
+        Search for financial news, with the same caching as TavilyService.search_financial_news.
+
+        Args:
+            query (str): The financial query to search for.
+            max_results (int): Maximum number of results to return.
+            max_retries (int): Maximum number of attempts.
+            deadline (Deadline): Time budget from the caller.
+
+        Returns:
+            dict: Contains news 'results' and a 'summary'.
+        """
+        service = self.tavily_service
+        if service.cache is None:
+            return await self._search_uncached(query, max_results, max_retries, deadline)
+
+        key = service._cache_key(service._search_params(query, max_results))
+        entry = service.cache.get(key)
+        if entry is not None:
+            if entry["fresh_until"] <= time.time() and key not in self._in_flight:
+                logger.debug(f"Serving stale Tavily results and refreshing for query: {query}")
+                self._single_flight(key, lambda: self._fetch_and_store(key, query, max_results, max_retries))
+            return entry["value"]
+
+        deadline = deadline or Deadline(service.default_budget)
+        task = self._single_flight(key, lambda: self._fetch_and_store(key, query, max_results, max_retries, deadline))
+        try:
+            # Shielded so a caller that gives up does not cancel the search for the others
+            return await asyncio.wait_for(asyncio.shield(task), deadline.remaining())
+        except asyncio.TimeoutError:
+            return await self._search_uncached(query, max_results, max_retries, deadline)
+
+    async def get_financial_context(self, financial_query, deadline=None):
+        """
+        Get financial context for a given query.
+
+        Args:
+            financial_query (str): The financial query to get context for.
+            deadline (Deadline): Time budget from the caller.
+
+        Returns:
+            dict: Financial context data.
+        """
+        news_data = await self.search_financial_news(financial_query, deadline=deadline)
+        return self.tavily_service._build_context(financial_query, news_data)
+
+    def _single_flight(self, key, factory):
+        """Return the running task for key, starting one from factory() if there is none."""
+        task = self._in_flight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(factory())
+            self._in_flight[key] = task
+            task.add_done_callback(lambda _: self._in_flight.pop(key, None))
+        return task
+
+    async def _fetch_and_store(self, key, query, max_results, max_retries, deadline=None):
+        service = self.tavily_service
+        result = await self._search_uncached(query, max_results, max_retries, deadline)
+        if not result.get("error"):
+            service.cache.set(key, {"value": result, "fresh_until": time.time() + service.cache_ttl},
+                              service.cache_ttl + service.stale_ttl)
+        return result
+
+    async def _search_uncached(self, query, max_results, max_retries, deadline=None):
+        """Search with retries bounded by the deadline and the shared circuit breaker."""
+        with tracing.span("tavily.request", kind=tracing.KIND_CLIENT) as span:
+            service = self.tavily_service
+            search_params = service._search_params(query, max_results)
+            guard = RetryGuard(service.circuit_breaker, deadline or Deadline(service.default_budget), max_retries,
+                               service.backoff_base, service.backoff_cap)
+
+            while (remaining := guard.begin()) is not None:
+                span.set_attribute("retry.count", guard.attempt - 1)
+                try:
+                    logger.debug(f"Searching for financial news with query: {query} (Attempt {guard.attempt})")
+                    response = await self.client.post(
+                        "/search",
+                        json=search_params,
+                        timeout=httpx.Timeout(min(service.timeout[1], remaining), connect=min(service.timeout[0], remaining))
+                    )
+
+                    span.set_attribute("http.response.status_code", response.status_code)
+                    if response.status_code == 200:
+                        news_data = service._process_response(response.json())
+                        guard.succeeded()
+                        return news_data
+
+                    logger.error(f"Error searching Tavily API: {response.status_code} - {response.text}")
+                    guard.failed(f"API Error: {response.status_code}")
+                except httpx.TransportError as e:
+                    logger.warning(f"Network error during Tavily API request: {str(e)}")
+                    guard.failed(str(e) or type(e).__name__)
+                except Exception as e:
+                    logger.error(f"Exception in Tavily search: {str(e)}")
+                    guard.failed(str(e))
+
+                sleep_time = guard.backoff()
+                if sleep_time is None:
+                    break
+                logger.info(f"Retrying in {sleep_time:.2f} seconds...")
+                await asyncio.sleep(sleep_time)
+
+            return failed_search(query, guard, span)
+
+
+class AsyncGroqService:
+    """asyncio counterpart of GroqService.analyze_financial_query, sharing its prompt builder and model router."""
+
+    def __init__(self, groq_service, pool_size=100):
+        self.groq_service = groq_service
+        self.client = _http_client(groq_service.base_url, groq_service.api_key, groq_service.timeout, pool_size)
+        logger.info("Async Groq service initialized")
+
+    async def analyze_financial_query(self, financial_query, context):
+        """
+        Analyze a financial query using the Groq Cloud API, with the same tier routing and fallback.
+
+        Args:
+            financial_query (str): The financial query to analyze
+            context (dict): Context information including news articles
+
+        Returns:
+            dict: Analysis results
+        """
+        groq = self.groq_service
+        tier = None
+        try:
+            logger.debug(f"Analyzing financial query with Groq API: {financial_query}")
+            prompt = groq._prepare_prompt(financial_query, context)
+            tiers = groq.router.route(financial_query, context)
+            for attempt, tier in enumerate(tiers):
+                with tracing.span("groq.chat_completion", kind=tracing.KIND_CLIENT, **tier.trace_attributes) as span:
+                    last = attempt == len(tiers) - 1
+                    connect_timeout, read_timeout = groq._tier_timeout(tier, last)
+                    started = time.monotonic()
+                    try:
+                        response = await self.client.post(
+                            "/chat/completions",
+                            json=groq._build_payload(prompt, tier),
+                            timeout=httpx.Timeout(read_timeout, connect=connect_timeout)
+                        )
+                    except httpx.TimeoutException:
+                        groq.router.record_failure(tier, "timeout")
+                        if last:
+                            raise
+                        groq.router.record_fallback(tier, tiers[attempt + 1], "latency SLO")
+                        continue
+
+                    span.set_attribute("http.response.status_code", response.status_code)
+                    if response.status_code == 429 and not last:
+                        groq.router.record_failure(tier, "rate_limited", retry_after(response.headers))
+                        groq.router.record_fallback(tier, tiers[attempt + 1], "rate limited")
+                        continue
+
+                    if response.status_code == 200:
+                        data = response.json()
+                        groq.router.record_success(tier, time.monotonic() - started, data.get("usage"))
+                        return groq._analysis_result(financial_query, groq._completion_text(data), tier)
+
+                    groq.router.record_failure(tier, "rate_limited" if response.status_code == 429 else "error",
+                                               retry_after(response.headers))
+                    logger.error(f"Error from Groq API: {response.status_code} - {response.text}")
+                    return groq._analysis_result(
+                        financial_query,
+                        "Unable to analyze the financial query at this time. Please try again later.",
+                        tier,
+                        error=f"API Error: {response.status_code}"
+                    )
+        except Exception as e:
+            logger.error(f"Exception in Groq analysis: {str(e)}")
+            return groq._analysis_result(
+                financial_query,
+                "An error occurred while analyzing your financial query.",
+                tier,
+                error=str(e) or type(e).__name__
+            )
+
+
+class AsyncYFinanceService:
+    """Runs the blocking YFinanceService lookups on the runtime's offload threads."""
+
+    def __init__(self, yfinance_service):
+        self.yfinance_service = yfinance_service
+
+    async def get_stock_data(self, symbol, memo=None):
+        """
+        Get stock quote and company overview for a symbol.
+
+        Args:
+            symbol (str): Stock symbol
+            memo (TickerInfoMemo): Optional request-scoped memo
+
+        Returns:
+            dict: Combined stock data
+        """
+        return await asyncio.to_thread(self.yfinance_service.get_stock_data, symbol, memo)
+
+
+class AsyncMongoDBService:
+    """Financial analysis operations on a Motor database, mirroring MongoDBService."""
+
+    def __init__(self, db, compressor):
+        self.db = db
+        # Shared with MongoDBService so both write and read the same format
+        self.compressor = compressor
+        logger.info("Async MongoDB service initialized")
+
+    async def save_financial_analysis(self, user_id, query, context, analysis):
+        """
+        Save a financial analysis to the database
+
+        Args:
+            user_id (str): ID of the user who made the query
+            query (str): The financial query
+            context (dict): Context data including news articles
+            analysis (dict): Analysis results
+
+        Returns:
+            str: ID of the saved analysis or None if failed
+        """
+        with tracing.span("mongodb.save_analysis") as span:
+            try:
+                stored_context, articles, snapshots = split_context(context)
+                span.set_attributes({"analysis.articles": len(articles), "analysis.stock_snapshots": len(snapshots)})
+                await self._store_content(
+                    self.db.articles, [self.compressor.compress_fields(article, "content") for article in articles]
+                )
+                await self._store_content(self.db.stock_snapshots, snapshots)
+                result = await self.db.financial_analyses.insert_one(MongoDBService._analysis_document(
+                    user_id, query, stored_context, self.compressor.compress_fields(analysis, "analysis")
+                ))
+
+                if result.inserted_id:
+                    logger.info(f"Financial analysis saved for user {user_id}")
+                    return str(result.inserted_id)
+                logger.error("Failed to insert financial analysis into database")
+                return None
+
+            except Exception as e:
+                logger.error(f"Error saving financial analysis: {str(e)}")
+                span.set_error(str(e))
+                return None
+
+    @staticmethod
+    async def _store_content(collection, documents):
+        if not documents:
+            return
+        try:
+            await collection.bulk_write(content_upserts(documents), ordered=False)
+        except BulkWriteError as e:
+            if any(error.get("code") != 11000 for error in e.details.get("writeErrors", [])):
+                raise
+
+
+class AsyncFinancialContextService:
+    """
+    asyncio counterpart of FinancialContextService.
+
+    The news search and every stock lookup run as tasks on the event loop
+    with the same per-source deadlines; no pool thread is held while
+    waiting on the network.
+    """
+
+    def __init__(self, tavily_service, yfinance_service, news_timeout=25, stock_timeout=10):
+        self.tavily_service = tavily_service
+        self.yfinance_service = yfinance_service
+        self.news_timeout = news_timeout
+        self.stock_timeout = stock_timeout
+
+    async def get_financial_context(self, financial_query, stock_symbols=None):
+        """
+        Get news context and stock data for a query concurrently.
+
+        Args:
+            financial_query (str): The financial query to get context for.
+            stock_symbols (list): Stock symbols mentioned in the query.
+
+        Returns:
+            dict: Financial context with 'stock_data' keyed by symbol.
+        """
+        start = time.monotonic()
+        symbols = list(dict.fromkeys(stock_symbols or []))
+        with tracing.span("context.gather", **{"context.symbols": len(symbols)}) as span:
+            memo = TickerInfoMemo()
+
+            news_task = asyncio.ensure_future(
+                self.tavily_service.get_financial_context(financial_query, deadline=Deadline(self.news_timeout))
+            )
+            stock_tasks = {
+                asyncio.ensure_future(self.yfinance_service.get_stock_data(symbol, memo)): symbol
+                for symbol in symbols
+            }
+
+            unavailable_sources = []
+            stock_data = await self._collect_stock_data(stock_tasks, unavailable_sources)
+            context = await self._collect_news(news_task, financial_query, start + self.news_timeout, unavailable_sources)
+
+            context['stock_data'] = stock_data
+            context['has_stock_data'] = True if stock_data else False
+            context['unavailable_sources'] = unavailable_sources
+            span.set_attribute("context.unavailable_sources", ",".join(unavailable_sources) or None)
+
+            logger.info(
+                f"Gathered financial context for {len(symbols)} symbols in {time.monotonic() - start:.2f}s"
+                f" ({len(unavailable_sources)} sources unavailable)"
+            )
+            return context
+
+    async def _collect_stock_data(self, stock_tasks, unavailable_sources):
+        if not stock_tasks:
+            return {}
+
+        _, pending = await asyncio.wait(stock_tasks, timeout=self.stock_timeout)
+
+        results = {}
+        for task, symbol in stock_tasks.items():
+            if task in pending:
+                task.cancel()
+                logger.warning(f"Stock data for {symbol} missed its deadline of {self.stock_timeout}s")
+                unavailable_sources.append(f"yfinance:{symbol}")
+                continue
+            keep_stock_result(task, symbol, results, unavailable_sources)
+        return results
+
+    async def _collect_news(self, news_task, financial_query, deadline, unavailable_sources):
+        try:
+            context = await asyncio.wait_for(news_task, timeout=max(deadline - time.monotonic(), 0))
+            if context.get('error'):
+                logger.warning(f"News context degraded: {context.get('error')}")
+                unavailable_sources.append("tavily")
+            return context
+        except asyncio.TimeoutError:
+            logger.warning(f"News context missed its deadline of {self.news_timeout}s")
+        except Exception as e:
+            logger.error(f"Error getting financial context: {str(e)}")
+
+        unavailable_sources.append("tavily")
+        return fallback_context(financial_query)
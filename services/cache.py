@@ -0,0 +1,346 @@
+import logging
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+class CacheBackend:
+    """
+    Base class for key/value caches with per-entry TTL and LRU eviction.
+
+    Subclasses implement _get, _set, _delete, _clear and _size. A miss is
+    reported as None, so None itself is never stored.
+    """
+
+    def __init__(self, name="cache"):
+        self.name = name
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._stats_lock = threading.Lock()
+
+    def get(self, key):
+        """
+        Get a value from the cache.
+
+        Args:
+            key (str): Cache key
+
+        Returns:
+            The cached value, or None if missing or expired
+        """
+        try:
+            value = self._get(key)
+        except Exception as e:
+            logger.error(f"Error reading {self.name} cache: {str(e)}")
+            value = None
+
+        with self._stats_lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return value
+
+    def set(self, key, value, ttl):
+        """
+        Store a value in the cache.
+
+        Args:
+            key (str): Cache key
+            value: Picklable value (None is ignored)
+            ttl (float): Seconds until the entry expires
+        """
+        if value is None or ttl <= 0:
+            return
+        try:
+            self._set(key, value, ttl)
+        except Exception as e:
+            logger.error(f"Error writing {self.name} cache: {str(e)}")
+
+    def delete(self, key):
+        """Remove a key from the cache if present."""
+        try:
+            self._delete(key)
+        except Exception as e:
+            logger.error(f"Error deleting from {self.name} cache: {str(e)}")
+
+    def clear(self):
+        """Remove every entry from the cache."""
+        self._clear()
+
+    def stats(self):
+        """
+        Get cache counters.
+
+        Returns:
+            dict: hits, misses, hit_rate, evictions, entries and bytes
+        """
+        entries, size_bytes = self._size()
+        with self._stats_lock:
+            lookups = self.hits + self.misses
+            return {
+                "backend": type(self).__name__,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "entries": entries,
+                "bytes": size_bytes
+            }
+
+    def _count_evictions(self, count):
+        if count:
+            with self._stats_lock:
+                self.evictions += count
+
+
+class MemoryCacheBackend(CacheBackend):
+    """
+    In-process LRU cache bounded by entry count and approximate memory.
+
+    Entry size is the length of the pickled value, which is a good enough
+    estimate for the small dicts we cache.
+    """
+
+    def __init__(self, name="cache", max_entries=1024, max_bytes=16 * 1024 * 1024):
+        super().__init__(name)
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def _get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, size, value = entry
+            if expires_at <= time.time():
+                del self._entries[key]
+                self._bytes -= size
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def _set(self, key, value, ttl):
+        size = len(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+        if size > self.max_bytes:
+            logger.warning(f"Value for {key} is larger than the {self.name} cache limit, not caching")
+            return
+
+        evicted = 0
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+            self._entries[key] = (time.time() + ttl, size, value)
+            self._bytes += size
+
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                _, (_, old_size, _) = self._entries.popitem(last=False)
+                self._bytes -= old_size
+                evicted += 1
+        self._count_evictions(evicted)
+
+    def _delete(self, key):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self._bytes -= entry[1]
+
+    def _clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def _size(self):
+        with self._lock:
+            return len(self._entries), self._bytes
+
+
+class SQLiteCacheBackend(CacheBackend):
+    """
+    LRU cache in a local SQLite file, shared by every worker process on the host.
+
+    Each thread uses its own connection; SQLite's WAL mode handles concurrent
+    readers and writers across processes.
+    """
+
+    def __init__(self, path, name="cache", max_entries=10000, max_bytes=64 * 1024 * 1024):
+        super().__init__(name)
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._local = threading.local()
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+
+        conn = self._connection()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache ("
+            "key TEXT PRIMARY KEY, value BLOB NOT NULL, size INTEGER NOT NULL, "
+            "expires_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS cache_accessed_at ON cache (accessed_at)")
+        conn.commit()
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _get(self, key):
+        conn = self._connection()
+        now = time.time()
+        row = conn.execute("SELECT value, expires_at FROM cache WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        if row[1] <= now:
+            conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+            return None
+        conn.execute("UPDATE cache SET accessed_at = ? WHERE key = ?", (now, key))
+        return pickle.loads(row[0])
+
+    def _set(self, key, value, ttl):
+        blob = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        if len(blob) > self.max_bytes:
+            logger.warning(f"Value for {key} is larger than the {self.name} cache limit, not caching")
+            return
+
+        conn = self._connection()
+        now = time.time()
+        conn.execute(
+            "INSERT OR REPLACE INTO cache (key, value, size, expires_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+            (key, sqlite3.Binary(blob), len(blob), now + ttl, now)
+        )
+        self._evict(conn, now)
+
+    def _evict(self, conn, now):
+        evicted = conn.execute("DELETE FROM cache WHERE expires_at <= ?", (now,)).rowcount
+        entries, size_bytes = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM cache").fetchone()
+
+        while entries > self.max_entries or size_bytes > self.max_bytes:
+            # Drop the least recently used entries; trim a tenth at a time when over the byte limit
+            overflow = entries - self.max_entries
+            batch = overflow if overflow > 0 else max(entries // 10, 1)
+            evicted += conn.execute(
+                "DELETE FROM cache WHERE key IN (SELECT key FROM cache ORDER BY accessed_at LIMIT ?)",
+                (batch,)
+            ).rowcount
+            entries, size_bytes = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM cache").fetchone()
+        self._count_evictions(evicted)
+
+    def _delete(self, key):
+        self._connection().execute("DELETE FROM cache WHERE key = ?", (key,))
+
+    def _clear(self):
+        self._connection().execute("DELETE FROM cache")
+
+    def _size(self):
+        row = self._connection().execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM cache").fetchone()
+        return row[0], row[1]
+
+
+class SingleFlight:
+    """
+    Collapses concurrent calls for the same key into one execution.
+
+    The first caller runs the function; callers arriving while it is in
+    flight wait for it and receive the same result (or exception). A
+    follower with a `timeout` stops waiting once it runs out and returns
+    its own `fallback()` instead, so a hung leader cannot hold it past its
+    budget.
+    """
+
+    class _Call:
+        def __init__(self):
+            self.done = threading.Event()
+            self.result = None
+            self.error = None
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn, timeout=None, fallback=None):
+        """
+        Run fn() once for all concurrent callers with the same key.
+
+        Args:
+            key (str): Identity of the call
+            fn (callable): Zero-argument function to run
+            timeout (float): Seconds a follower waits for the leader (default: no limit)
+            fallback (callable): Zero-argument function whose result a follower returns
+                when the timeout passes
+
+        Returns:
+            The result of fn(), or of fallback() for a follower that timed out
+
+        Raises:
+            TimeoutError: If a follower times out and there is no fallback
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = self._Call()
+
+        if not leader:
+            if not call.done.wait(timeout):
+                if fallback is None:
+                    raise TimeoutError(f"Timed out waiting for the in-flight call for {key}")
+                return fallback()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def in_flight(self, key):
+        """Return True if a call for key is currently running."""
+        with self._lock:
+            return key in self._calls
+
+
+def create_cache_backend(backend, name, path=None, max_entries=1024, max_bytes=16 * 1024 * 1024):
+    """
+    Build a cache backend from configuration values.
+
+    Args:
+        backend (str): 'memory' for an in-process cache or 'sqlite' for a shared local file
+        name (str): Name used in logs and stats
+        path (str): SQLite file path (sqlite backend only)
+        max_entries (int): Maximum number of entries
+        max_bytes (int): Approximate memory bound in bytes
+
+    Returns:
+        CacheBackend: The configured backend
+    """
+    if backend == "sqlite":
+        path = path or os.path.join("instance", f"{name}_cache.sqlite3")
+        logger.info(f"Using shared SQLite {name} cache at {path}")
+        return SQLiteCacheBackend(path, name=name, max_entries=max_entries, max_bytes=max_bytes)
+
+    if backend != "memory":
+        logger.warning(f"Unknown cache backend '{backend}', falling back to in-process memory cache")
+    return MemoryCacheBackend(name=name, max_entries=max_entries, max_bytes=max_bytes)
@@ -0,0 +1,258 @@
+import logging
+import struct
+import threading
+import zlib
+from collections import Counter
+from bson.binary import Binary
+
+try:
+    import zstandard
+except ImportError:  # Optional; zlib is always available
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+# BSON binary subtype marking a compressed field value (user-defined range)
+COMPRESSED_SUBTYPE = 0x80
+
+CODEC_ZLIB = 1
+CODEC_ZSTD = 2
+CODEC_NAMES = {"zlib": CODEC_ZLIB, "zstd": CODEC_ZSTD}
+
+# Every compressed value starts with the codec and the dictionary id (0 = none)
+HEADER = struct.Struct(">BI")
+
+# Text shorter than this is stored as it is
+MIN_COMPRESS_LENGTH = 256
+
+# zlib only looks back 32 KB, so a larger dictionary would be wasted
+ZLIB_DICTIONARY_SIZE = 32 * 1024
+ZSTD_DICTIONARY_SIZE = 112 * 1024
+
+def is_compressed(value):
+    """Return True if value is a field compressed by FieldCompressor."""
+    return isinstance(value, Binary) and value.subtype == COMPRESSED_SUBTYPE
+
+
+class FieldCompressor:
+    """
+    Compresses large text fields into tagged BSON binaries and back.
+
+    Values are compressed with zstd when the zstandard package is installed
+    and zlib otherwise, using the current dictionary trained on our own
+    analyses and articles. Each value records its codec and dictionary id,
+    so values written under an older dictionary (or codec) stay readable.
+    Dictionaries are fetched from the store on first use.
+    """
+
+    def __init__(self, codec="auto", level=6, store=None):
+        """
+        Args:
+            codec (str): 'auto', 'zstd', 'zlib' or 'none' (store text as it is)
+            level (int): Compression level
+            store: Object with get_compression_dictionary(id) and
+                get_latest_compression_dictionary(codec) (MongoDBService)
+        """
+        if codec == "auto":
+            codec = "zstd" if zstandard is not None else "zlib"
+        if codec == "zstd" and zstandard is None:
+            logger.warning("zstandard is not installed, compressing with zlib")
+            codec = "zlib"
+        self.codec = CODEC_NAMES.get(codec)
+        self.level = level
+        self.store = store
+
+        self._dictionaries = {}
+        self._current_dictionary_id = 0
+        self._current_loaded = False
+        self._lock = threading.Lock()
+
+    def use_dictionary(self, dictionary_id, data):
+        """
+        Make a dictionary the one new values are compressed with.
+
+        Args:
+            dictionary_id (int): Dictionary id recorded in compressed values
+            data (bytes): Dictionary content for the compressor's codec
+        """
+        with self._lock:
+            self._dictionaries[dictionary_id] = data
+            self._current_dictionary_id = dictionary_id
+            self._current_loaded = True
+
+    def compress(self, text):
+        """
+        Compress a text field.
+
+        Args:
+            text (str): Field value
+
+        Returns:
+            Binary: The compressed value, or text unchanged if it is short,
+            not a string, incompressible or compression is disabled
+        """
+        if self.codec is None or not isinstance(text, str) or len(text) < MIN_COMPRESS_LENGTH:
+            return text
+
+        raw = text.encode("utf-8")
+        dictionary_id = self._current_dictionary()
+        dictionary = self._dictionaries.get(dictionary_id) if dictionary_id else None
+
+        if self.codec == CODEC_ZSTD:
+            dict_data = zstandard.ZstdCompressionDict(dictionary) if dictionary else None
+            payload = zstandard.ZstdCompressor(level=self.level, dict_data=dict_data).compress(raw)
+        else:
+            compressor = zlib.compressobj(self.level, zdict=dictionary) if dictionary else zlib.compressobj(self.level)
+            payload = compressor.compress(raw) + compressor.flush()
+
+        if len(payload) + HEADER.size >= len(raw):
+            return text
+        return Binary(HEADER.pack(self.codec, dictionary_id) + payload, COMPRESSED_SUBTYPE)
+
+    def compress_fields(self, document, *fields):
+        """
+        Copy a document with the given text fields compressed.
+
+        Args:
+            document (dict): Document to store (left unchanged)
+            fields (str): Names of the fields to compress
+
+        Returns:
+            dict: The copy to write
+        """
+        compressed = dict(document)
+        for field in fields:
+            if field in compressed:
+                compressed[field] = self.compress(compressed[field])
+        return compressed
+
+    def decompress(self, value):
+        """
+        Decompress a field written by compress().
+
+        Args:
+            value: Field value as read from MongoDB
+
+        Returns:
+            str: The original text (other values are returned unchanged)
+        """
+        if not is_compressed(value):
+            return value
+
+        data = bytes(value)
+        codec, dictionary_id = HEADER.unpack_from(data)
+        payload = data[HEADER.size:]
+        dictionary = self._dictionary(dictionary_id) if dictionary_id else None
+
+        if codec == CODEC_ZSTD:
+            if zstandard is None:
+                raise RuntimeError("The zstandard package is needed to read zstd-compressed fields")
+            dict_data = zstandard.ZstdCompressionDict(dictionary) if dictionary else None
+            raw = zstandard.ZstdDecompressor(dict_data=dict_data).decompress(payload)
+        else:
+            decompressor = zlib.decompressobj(zdict=dictionary) if dictionary else zlib.decompressobj()
+            raw = decompressor.decompress(payload) + decompressor.flush()
+        return raw.decode("utf-8")
+
+    def train(self, samples):
+        """
+        Build a dictionary for this compressor's codec from sample texts.
+
+        Args:
+            samples (list): Representative field values
+
+        Returns:
+            tuple: (dictionary id, codec name, dictionary bytes)
+        """
+        encoded = [sample.encode("utf-8") for sample in samples if isinstance(sample, str) and sample]
+        if self.codec == CODEC_ZSTD:
+            data = zstandard.train_dictionary(ZSTD_DICTIONARY_SIZE, encoded, level=self.level).as_bytes()
+            codec = "zstd"
+        else:
+            data = build_zlib_dictionary(encoded)
+            codec = "zlib"
+        return dictionary_id_for(data), codec, data
+
+    def _current_dictionary(self):
+        """Id of the dictionary to compress with, loading the latest one from the store once."""
+        if self._current_loaded or self.store is None:
+            return self._current_dictionary_id
+        with self._lock:
+            if not self._current_loaded:
+                codec = "zstd" if self.codec == CODEC_ZSTD else "zlib"
+                try:
+                    latest = self.store.get_latest_compression_dictionary(codec)
+                except Exception as e:
+                    logger.warning(f"Could not load the compression dictionary: {str(e)}")
+                    return 0
+                if latest:
+                    self._dictionaries[latest[0]] = latest[1]
+                    self._current_dictionary_id = latest[0]
+                self._current_loaded = True
+            return self._current_dictionary_id
+
+    def _dictionary(self, dictionary_id):
+        data = self._dictionaries.get(dictionary_id)
+        if data is None:
+            data = self.store.get_compression_dictionary(dictionary_id) if self.store is not None else None
+            if data is None:
+                raise LookupError(f"Compression dictionary {dictionary_id} not found")
+            with self._lock:
+                self._dictionaries[dictionary_id] = data
+        return data
+
+
+class DecompressingDict(dict):
+    """Dict whose compressed values are decompressed the first time they are read."""
+
+    def __init__(self, data, compressor):
+        super().__init__(data)
+        self._compressor = compressor
+
+    def __getitem__(self, key):
+        value = super().__getitem__(key)
+        if is_compressed(value):
+            value = self._compressor.decompress(value)
+            self[key] = value
+        return value
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+
+def dictionary_id_for(data):
+    """Stable non-zero id for a dictionary's content."""
+    return zlib.crc32(data) or 1
+
+
+def build_zlib_dictionary(samples, size=ZLIB_DICTIONARY_SIZE):
+    """
+    Build a zlib preset dictionary from the lines that recur across samples.
+
+    Lines are scored by how many samples contain them times their length.
+    The best ones are placed last, since zlib finds nearby matches cheapest.
+
+    Args:
+        samples (list): Sample values as bytes
+        size (int): Largest dictionary size in bytes
+
+    Returns:
+        bytes: The dictionary
+    """
+    counts = Counter()
+    for sample in samples:
+        counts.update({line.strip() for line in sample.splitlines() if len(line.strip()) >= 8})
+
+    chosen = []
+    used = 0
+    for line, count in sorted(counts.items(), key=lambda item: item[1] * len(item[0]), reverse=True):
+        if count < 2:
+            break
+        if used + len(line) + 1 > size:
+            continue
+        chosen.append(line)
+        used += len(line) + 1
+    return b"\n".join(reversed(chosen))
@@ -0,0 +1,234 @@
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from datetime import datetime
+from services import tracing
+from services.yfinance_service import TickerInfoMemo
+from services.resilience import Deadline
+
+logger = logging.getLogger(__name__)
+
+class FinancialContextService:
+    """
+    Gathers news and market data for a query by running the Tavily search
+    and the per-symbol Yahoo Finance lookups at the same time.
+
+    Each source has its own deadline measured from the start of the request.
+    Sources that miss their deadline are left out of the context and listed
+    under 'unavailable_sources', so the analysis can go ahead with whatever
+    arrived in time.
+
+    yfinance calls cannot be timed out or interrupted, so the thread pools
+    are partitioned to keep slow tickers from starving other requests:
+    news searches have their own pool, and one request's symbols run as at
+    most `max_lookups_per_request` chains of sequential lookups on the stock
+    pool. A lookup that never got a thread before its deadline is counted
+    as pool saturation and logged as such, rather than reported as a slow
+    source.
+    """
+
+    def __init__(self, tavily_service, yfinance_service, max_workers=8, news_workers=4, max_lookups_per_request=3,
+                 news_timeout=25, stock_timeout=10):
+        self.tavily_service = tavily_service
+        self.yfinance_service = yfinance_service
+        self.news_timeout = news_timeout
+        self.stock_timeout = stock_timeout
+        self.max_workers = max_workers
+        self.news_workers = news_workers
+        self.max_lookups_per_request = max_lookups_per_request
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="financial-context")
+        self.news_executor = ThreadPoolExecutor(max_workers=news_workers, thread_name_prefix="financial-news")
+        self._saturated = 0
+        self._lock = threading.Lock()
+        logger.info(f"Financial context service initialized with {max_workers} stock and {news_workers} news workers")
+
+    def get_financial_context(self, financial_query, stock_symbols=None):
+        """
+        Get news context and stock data for a query concurrently.
+
+        Args:
+            financial_query (str): The financial query to get context for.
+            stock_symbols (list): Stock symbols mentioned in the query.
+
+        Returns:
+            dict: Financial context with 'stock_data' keyed by symbol.
+        """
+        start = time.monotonic()
+        symbols = list(dict.fromkeys(stock_symbols or []))
+        with tracing.span("context.gather", **{"context.symbols": len(symbols)}) as span:
+            # One memo per request so each ticker.info is fetched at most once
+            memo = TickerInfoMemo()
+
+            # Submit everything before waiting on anything
+            # Tavily sizes its retries to the same budget we wait for
+            news_future = self.news_executor.submit(
+                tracing.bind(self.tavily_service.get_financial_context), financial_query,
+                deadline=Deadline(self.news_timeout)
+            )
+            lookups = {}
+            chains = [symbols[i::self.max_lookups_per_request] for i in range(self.max_lookups_per_request)]
+            chain_futures = {
+                self.executor.submit(tracing.bind(self._lookup_chain), chain, memo, lookups): chain
+                for chain in chains if chain
+            }
+
+            unavailable_sources = []
+            saturated = []
+            stock_data = self._collect_stock_data(
+                chain_futures, lookups, symbols, start + self.stock_timeout, unavailable_sources, saturated
+            )
+            context = self._collect_news(
+                news_future, financial_query, start + self.news_timeout, unavailable_sources, saturated
+            )
+
+            context['stock_data'] = stock_data
+            context['has_stock_data'] = True if stock_data else False
+            context['unavailable_sources'] = unavailable_sources
+            span.set_attributes({
+                "context.unavailable_sources": ",".join(unavailable_sources) or None,
+                "context.saturated": ",".join(saturated) or None
+            })
+
+            logger.info(
+                f"Gathered financial context for {len(symbols)} symbols in {time.monotonic() - start:.2f}s"
+                f" ({len(unavailable_sources)} sources unavailable)"
+            )
+            return context
+
+    def stats(self):
+        """
+        Get pool counters.
+
+        Returns:
+            dict: workers, news_workers, max_lookups_per_request and saturated (lookups
+                that never got a thread before their deadline)
+        """
+        with self._lock:
+            return {
+                "workers": self.max_workers,
+                "news_workers": self.news_workers,
+                "max_lookups_per_request": self.max_lookups_per_request,
+                "saturated": self._saturated
+            }
+
+    def _lookup_chain(self, symbols, memo, lookups):
+        """Look up symbols one after another, recording each result (or error) as it arrives."""
+        for symbol in symbols:
+            try:
+                lookups[symbol] = self.yfinance_service.get_stock_data(symbol, memo)
+            except Exception as e:
+                lookups[symbol] = {"error": str(e)}
+
+    def _collect_stock_data(self, chain_futures, lookups, symbols, deadline, unavailable_sources, saturated):
+        """
+        Wait for the lookup chains until the deadline and keep the lookups that succeeded.
+
+        Args:
+            chain_futures (dict): Mapping of future to the symbols its chain looks up.
+            lookups (dict): Results recorded by the chains, keyed by symbol.
+            symbols (list): Every symbol requested, in order.
+            deadline (float): time.monotonic() value to stop waiting at.
+            unavailable_sources (list): Collects the names of sources that failed.
+            saturated (list): Collects the sources that never got a thread.
+
+        Returns:
+            dict: Stock data keyed by symbol, in the order the symbols were given.
+        """
+        if not chain_futures:
+            return {}
+
+        _, not_done = wait(chain_futures, timeout=max(deadline - time.monotonic(), 0))
+
+        never_started = set()
+        for future in not_done:
+            # Only a chain still queued behind other requests' lookups can be cancelled
+            if future.cancel():
+                never_started.update(chain_futures[future])
+
+        results = {}
+        for symbol in symbols:
+            if symbol not in lookups:
+                if symbol in never_started:
+                    self._record_saturation(f"yfinance:{symbol}", saturated)
+                else:
+                    logger.warning(f"Stock data for {symbol} missed its deadline of {self.stock_timeout}s")
+                unavailable_sources.append(f"yfinance:{symbol}")
+                continue
+
+            keep_stock_data(lookups[symbol], symbol, results, unavailable_sources)
+
+        return results
+
+    def _collect_news(self, news_future, financial_query, deadline, unavailable_sources, saturated):
+        """
+        Wait for the Tavily context until the deadline.
+
+        Args:
+            news_future (Future): Future returned for the Tavily lookup.
+            financial_query (str): The financial query, used for the fallback context.
+            deadline (float): time.monotonic() value to stop waiting at.
+            unavailable_sources (list): Collects the names of sources that failed.
+            saturated (list): Collects the sources that never got a thread.
+
+        Returns:
+            dict: Financial context from Tavily, or an empty fallback context.
+        """
+        try:
+            context = news_future.result(timeout=max(deadline - time.monotonic(), 0))
+            if context.get('error'):
+                logger.warning(f"News context degraded: {context.get('error')}")
+                unavailable_sources.append("tavily")
+            return context
+        except FutureTimeoutError:
+            if news_future.cancel():
+                self._record_saturation("tavily", saturated)
+            else:
+                logger.warning(f"News context missed its deadline of {self.news_timeout}s")
+        except Exception as e:
+            logger.error(f"Error getting financial context: {str(e)}")
+
+        unavailable_sources.append("tavily")
+        return fallback_context(financial_query)
+
+    def _record_saturation(self, source, saturated):
+        logger.warning(f"Context pool saturated: {source} never got a worker thread before its deadline")
+        saturated.append(source)
+        with self._lock:
+            self._saturated += 1
+
+
+def keep_stock_result(future, symbol, results, unavailable_sources):
+    """
+    Add a finished stock lookup to results, or record the symbol as unavailable.
+
+    Works for both concurrent.futures and asyncio futures.
+    """
+    try:
+        data = future.result()
+    except Exception as e:
+        logger.warning(f"Error getting stock data for {symbol}: {str(e)}")
+        unavailable_sources.append(f"yfinance:{symbol}")
+        return
+
+    keep_stock_data(data, symbol, results, unavailable_sources)
+
+
+def keep_stock_data(data, symbol, results, unavailable_sources):
+    """Add a stock lookup's data to results, or record the symbol as unavailable if it is an error."""
+    if data and data.get('error'):
+        logger.warning(f"Error getting stock data for {symbol}: {data.get('error')}")
+        unavailable_sources.append(f"yfinance:{symbol}")
+    elif data:
+        results[symbol] = data
+
+
+def fallback_context(financial_query):
+    """Empty news context used when Tavily fails or misses its deadline."""
+    return {
+        "news_summary": "Unable to retrieve financial context at this time.",
+        "articles": [],
+        "query_time": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "query": financial_query
+    }
@@ -0,0 +1,210 @@
+import gzip
+import logging
+import bson
+from bson import json_util
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:  # Optional; only needed for Parquet files
+    pyarrow = None
+
+logger = logging.getLogger(__name__)
+
+FORMATS = ("ndjson", "parquet")
+
+# Relaxed extended JSON keeps ObjectIds, dates and binaries while numbers stay plain
+JSON_OPTIONS = json_util.RELAXED_JSON_OPTIONS
+
+# Parquet columns per collection. Nested values are stored as extended JSON
+# strings and any other top-level fields go into the 'extra' column.
+PARQUET_FIELDS = {
+    "users": {
+        "_id": "objectid",
+        "username": "string",
+        "email": "string",
+        "password_hash": "string",
+        "created_at": "datetime",
+    },
+    "financial_analyses": {
+        "_id": "objectid",
+        "user_id": "string",
+        "query": "string",
+        "created_at": "datetime",
+        "context": "json",
+        "analysis": "json",
+    },
+}
+
+def format_for_path(path):
+    """Guess the file format from a path: '.parquet' files are Parquet, anything else NDJSON."""
+    return "parquet" if path.endswith(".parquet") else "ndjson"
+
+
+def export_collection(service, collection, path, file_format=None, batch_size=1000, progress=None):
+    """
+    Stream a collection to a file without holding more than one batch in memory.
+
+    Args:
+        service (MongoDBService): Service to read from
+        collection (str): 'users' or 'financial_analyses'
+        path (str): Output file; NDJSON paths ending in '.gz' are gzipped
+        file_format (str): 'ndjson' or 'parquet' (default: from the path)
+        batch_size (int): Documents per cursor batch and per write
+        progress (callable): Optional progress(exported) callback, called after each batch
+
+    Returns:
+        int: Number of documents exported
+    """
+    writer = _open_writer(file_format or format_for_path(path), path, collection)
+    exported = 0
+    try:
+        for batch in service.export_batches(collection, batch_size):
+            writer.write(batch)
+            exported += len(batch)
+            if progress:
+                progress(exported)
+    finally:
+        writer.close()
+    logger.info(f"Exported {exported} {collection} documents to {path}")
+    return exported
+
+
+def import_collection(service, collection, path, file_format=None, batch_size=1000, progress=None):
+    """
+    Stream a file written by export_collection into a collection, one bulk insert per batch.
+
+    Args:
+        service (MongoDBService): Service to write to
+        collection (str): 'users' or 'financial_analyses'
+        path (str): Input file; NDJSON paths ending in '.gz' are read as gzip
+        file_format (str): 'ndjson' or 'parquet' (default: from the path)
+        batch_size (int): Documents per bulk insert
+        progress (callable): Optional progress(inserted, skipped) callback, called after each batch
+
+    Returns:
+        tuple: (inserted, skipped) document counts; documents already present are skipped
+    """
+    inserted = skipped = 0
+    for batch in _read_batches(file_format or format_for_path(path), path, collection, batch_size):
+        batch_inserted, batch_skipped = service.import_documents(collection, batch)
+        inserted += batch_inserted
+        skipped += batch_skipped
+        if progress:
+            progress(inserted, skipped)
+    logger.info(f"Imported {inserted} {collection} documents from {path} ({skipped} already present)")
+    return inserted, skipped
+
+
+def _open_writer(file_format, path, collection):
+    if file_format == "parquet":
+        return ParquetWriter(path, collection)
+    if file_format == "ndjson":
+        return NDJSONWriter(path)
+    raise ValueError(f"Unknown file format '{file_format}'")
+
+
+def _read_batches(file_format, path, collection, batch_size):
+    if file_format == "parquet":
+        return _parquet_batches(path, collection, batch_size)
+    if file_format == "ndjson":
+        return _ndjson_batches(path, batch_size)
+    raise ValueError(f"Unknown file format '{file_format}'")
+
+
+def _open_text(path, mode):
+    if path.endswith(".gz"):
+        return gzip.open(path, mode + "t", encoding="utf-8")
+    return open(path, mode, encoding="utf-8")
+
+
+class NDJSONWriter:
+    """Writes one extended JSON document per line."""
+
+    def __init__(self, path):
+        self._file = _open_text(path, "w")
+
+    def write(self, documents):
+        self._file.writelines(json_util.dumps(document, json_options=JSON_OPTIONS) + "\n" for document in documents)
+
+    def close(self):
+        self._file.close()
+
+
+def _ndjson_batches(path, batch_size):
+    batch = []
+    with _open_text(path, "r") as lines:
+        for line in lines:
+            if not line.strip():
+                continue
+            batch.append(json_util.loads(line, json_options=JSON_OPTIONS))
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+    if batch:
+        yield batch
+
+
+class ParquetWriter:
+    """Writes each batch of documents as one Parquet row group."""
+
+    def __init__(self, path, collection):
+        if pyarrow is None:
+            raise RuntimeError("The pyarrow package is needed to write Parquet files")
+        self.fields = PARQUET_FIELDS[collection]
+        self.schema = pyarrow.schema(
+            [(name, pyarrow.timestamp("ms") if kind == "datetime" else pyarrow.string())
+             for name, kind in self.fields.items()]
+            + [("extra", pyarrow.string())]
+        )
+        self._writer = pyarrow.parquet.ParquetWriter(path, self.schema, compression="zstd")
+
+    def write(self, documents):
+        rows = [_parquet_row(document, self.fields) for document in documents]
+        self._writer.write_table(pyarrow.Table.from_pylist(rows, schema=self.schema))
+
+    def close(self):
+        self._writer.close()
+
+
+def _parquet_batches(path, collection, batch_size):
+    if pyarrow is None:
+        raise RuntimeError("The pyarrow package is needed to read Parquet files")
+    fields = PARQUET_FIELDS[collection]
+    for record_batch in pyarrow.parquet.ParquetFile(path).iter_batches(batch_size=batch_size):
+        yield [_parquet_document(row, fields) for row in record_batch.to_pylist()]
+
+
+def _parquet_row(document, fields):
+    row = {}
+    extra = {}
+    for key, value in document.items():
+        kind = fields.get(key)
+        if kind is None:
+            extra[key] = value
+        elif value is None:
+            row[key] = None
+        elif kind == "objectid":
+            row[key] = str(value)
+        elif kind == "json":
+            row[key] = json_util.dumps(value, json_options=JSON_OPTIONS)
+        else:
+            row[key] = value
+    row["extra"] = json_util.dumps(extra, json_options=JSON_OPTIONS) if extra else None
+    return row
+
+
+def _parquet_document(row, fields):
+    document = {}
+    for key, kind in fields.items():
+        value = row.get(key)
+        if value is None:
+            continue
+        if kind == "objectid":
+            value = bson.ObjectId(value) if bson.ObjectId.is_valid(value) else value
+        elif kind == "json":
+            value = json_util.loads(value, json_options=JSON_OPTIONS)
+        document[key] = value
+    if row.get("extra"):
+        document.update(json_util.loads(row["extra"], json_options=JSON_OPTIONS))
+    return document
@@ -1,8 +1,15 @@
 import requests
+from urllib3.exceptions import ReadTimeoutError
 import logging
 import json
+import os
+import time
 from datetime import datetime
 import dotenv
+from services import tracing
+from services.http_client import create_session
+from services.model_router import ModelRouter, ModelTier
+from services.prompt_builder import PromptBuilder, SYSTEM_PROMPT
 logger = logging.getLogger(__name__)
 
 from dotenv import load_dotenv
@@ -10,12 +17,29 @@ load_dotenv()
 logger.info("Loaded environment variables from .env file")
 
 class GroqService:
-    def __init__(self, api_key):
+    def __init__(self, api_key, pool_size=10, connect_timeout=5, read_timeout=60, prompt_budget=3000,
+                 max_article_tokens=400, knowledge_index=None, knowledge_top_k=3, router=None):
         self.api_key = api_key or os.getenv("GROQ_API_KEY")
 
         self.base_url = "https://api.groq.com/openai/v1"
-        self.model = "llama-3.3-70b-versatile"
-        logger.info("Groq service initialized with Llama 3.3 70B model")
+        # Short factual questions go to the small model and the rest to the 70B
+        self.router = router or ModelRouter([
+            ModelTier("deep", "llama-3.3-70b-versatile", max_tokens=1000, latency_slo=20),
+            ModelTier("fast", "llama-3.1-8b-instant", max_tokens=600, latency_slo=5),
+        ])
+        # (connect, read) timeouts so a hung upstream cannot pin a worker
+        self.timeout = (connect_timeout, read_timeout)
+        # One pooled keep-alive session shared by all requests
+        self.session = create_session(pool_size=pool_size, headers={
+            "Authorization": f"Bearer {self.api_key}",
+            "Content-Type": "application/json"
+        })
+        # Prompt tokens are the main per-request cost, so every prompt is packed into a fixed budget
+        self.prompt_builder = PromptBuilder(budget=prompt_budget, max_article_tokens=max_article_tokens)
+        # Optional KnowledgeIndex whose best passages for each query ground the prompt
+        self.knowledge_index = knowledge_index
+        self.knowledge_top_k = knowledge_top_k
+        logger.info(f"Groq service initialized with models: {', '.join(tier.model for tier in self.router.tiers)}")
     
     def _prepare_prompt(self, financial_query, context):
         """
@@ -26,86 +50,22 @@ class GroqService:
             context (dict): Context information including news articles
             
         Returns:
-            str: Formatted prompt for the model
+            str: Formatted prompt for the model, within the prompt token budget
         """
-        # Get news context
-        news_summary = context.get("news_summary", "No news summary available")
-        
-        # Get articles
-        articles = context.get("articles", [])
-        article_text = ""
-        for i, article in enumerate(articles[:3], 1):  # Limiting to 3 articles to avoid token limit
-            article_text += f"\nArticle {i}:\nTitle: {article.get('title')}\nContent: {article.get('content')[:500]}...\n"
-        
-        # Get stock data if available
-        stock_data = context.get("stock_data", {})
-        stock_info = ""
-        if stock_data:
-            for symbol, data in stock_data.items():
-                stock_info += f"""
-STOCK INFORMATION:
-Symbol: {symbol}
-Company: {data.get('name', 'N/A')}
-Current Price: {data.get('price', 'N/A')}
-Change: {data.get('change', 'N/A')} ({data.get('change_percent', 'N/A')})
-Sector: {data.get('sector', 'N/A')}
-Industry: {data.get('industry', 'N/A')}
-Market Cap: {data.get('market_cap', 'N/A')}
-P/E Ratio: {data.get('pe_ratio', 'N/A')}
-Dividend Yield: {data.get('dividend_yield', 'N/A')}
-Exchange: {data.get('exchange', 'N/A')}
-"""
-
-        
-        # Format the prompt
-        prompt = f"""You are a seasoned Indian financial advisor with extensive expertise in analyzing financial markets, regulatory trends, and economic data specific to India. Your role is to deliver actionable, data-driven advice tailored to Indian investors, considering local market conditions, tax implications, and guidelines from Indian regulatory bodies (such as SEBI and RBI).
-
-USER QUERY: {financial_query}
-
-LATEST FINANCIAL NEWS SUMMARY:
-{news_summary}
-
-RELEVANT FINANCIAL ARTICLES:
-{article_text}
-{stock_info}
-
-Based on the above information, please provide a response that includes:
-
-<h3>1. Comprehensive Analysis</h3>
-<p>
-   Deliver a detailed examination of the user’s query, incorporating current market data, economic trends, and insights drawn from the latest news and articles. Your analysis should be specifically tailored for Indian investors and reflect the nuances of the Indian financial landscape.
-</p>
-
-<h3>2. Key Insights and Implications</h3>
-<p>
-   Identify and explain the major insights from your analysis. Discuss how the information impacts the Indian economy and financial markets, including factors such as market volatility, liquidity, and regulatory changes.
-</p>
-
-<h3>3. Risks and Opportunities</h3>
-<p>
-   Outline potential risks and opportunities in the current market context. Consider aspects like market sentiment, regulatory shifts, tax changes, and global economic influences as they relate to India.
-</p>
-
-<h3>4. Concrete Recommendations</h3>
-<p>
-   Offer actionable recommendations for Indian investors. Your advice should address both short-term strategies and long-term planning, including specific investment strategies, portfolio diversification tips, and risk management techniques.
-</p>
-
-<h3>5. Supporting References</h3>
-<p>
-   Clearly reference specific news items, data points, or financial articles from the provided summaries that have shaped your analysis.
-</p>
-
-<p>
-   <strong>Additional Considerations:</strong> 
-   In your analysis, factor in the latest developments in monetary and fiscal policy, historical market trends, and any relevant tax implications. Ensure that the response is professional, well-structured, and formatted using proper HTML tags (e.g., <code><h3></code>, <code><p></code>, <code><ul></code>, <code><li></code>, <code><strong></code>).
-</p>
-"""
-        return prompt
+        with tracing.span("groq.prompt") as span:
+            passages = self.knowledge_index.search(financial_query, self.knowledge_top_k) if self.knowledge_index else []
+            prompt = self.prompt_builder.build(financial_query, context, passages)
+            prompt_tokens = self.prompt_builder.prompt_tokens(prompt)
+            span.set_attributes({"knowledge.passages": len(passages), "prompt.tokens": prompt_tokens})
+            logger.debug(f"Prompt uses {prompt_tokens} of {self.prompt_builder.budget} tokens")
+            return prompt
     
     def analyze_financial_query(self, financial_query, context):
         """
-        Analyze a financial query using the Llama 3.3 70B model via Groq Cloud API.
+        Analyze a financial query via Groq Cloud API, on the model tier the router picks.
+        
+        Falls back to the next smaller model when a tier is rate limited or
+        misses its latency SLO.
         
         Args:
             financial_query (str): The financial query to analyze
@@ -114,64 +74,220 @@ Based on the above information, please provide a response that includes:
         Returns:
             dict: Analysis results
         """
+        tier = None
         try:
             logger.debug(f"Analyzing financial query with Groq API: {financial_query}")
             
-            # Prepare the API request
+            # The prompt is the same for every tier, so it is built once
             prompt = self._prepare_prompt(financial_query, context)
-            
-            payload = {
-                "model": self.model,
-                "messages": [
-                    {"role": "system", "content": "You are a professional financial analyst providing accurate, helpful financial advice based on the latest market data and news."},
-                    {"role": "user", "content": prompt}
-                ],
-                "temperature": 0.5,
-                "max_tokens": 1000
-            }
-            
-            # Make the API request
-            headers = {
-                "Authorization": f"Bearer {self.api_key}",
-                "Content-Type": "application/json"
-            }
-            
-            response = requests.post(
-                f"{self.base_url}/chat/completions",
-                json=payload,
-                headers=headers
-            )
-            
-            # Check for successful response
-            if response.status_code == 200:
-                data = response.json()
-                analysis_text = data.get("choices", [{}])[0].get("message", {}).get("content", "No analysis available") if isinstance(data.get("choices", [{}]), list) and len(data.get("choices", [{}])) > 0 else "No analysis available"
+            tiers = self.router.route(financial_query, context)
+            for attempt, tier in enumerate(tiers):
+                with tracing.span("groq.chat_completion", kind=tracing.KIND_CLIENT, **tier.trace_attributes) as span:
+                    last = attempt == len(tiers) - 1
+                    started = time.monotonic()
+                    try:
+                        # Make the API request over the pooled session
+                        response = self.session.post(
+                            f"{self.base_url}/chat/completions",
+                            json=self._build_payload(prompt, tier),
+                            timeout=self._tier_timeout(tier, last)
+                        )
+                    except requests.Timeout:
+                        self.router.record_failure(tier, "timeout")
+                        if last:
+                            raise
+                        self.router.record_fallback(tier, tiers[attempt + 1], "latency SLO")
+                        continue
+                
+                    span.set_attribute("http.response.status_code", response.status_code)
+                    if response.status_code == 429 and not last:
+                        self.router.record_failure(tier, "rate_limited", retry_after(response.headers))
+                        self.router.record_fallback(tier, tiers[attempt + 1], "rate limited")
+                        continue
                 
-                # Process the analysis
-                analysis_result = {
-                    "analysis": analysis_text,
-                    "query": financial_query,
-                    "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                    "model": self.model
-                }
+                    # Check for successful response
+                    if response.status_code == 200:
+                        data = response.json()
+                        self.router.record_success(tier, time.monotonic() - started, data.get("usage"))
+                        return self._analysis_result(financial_query, self._completion_text(data), tier)
                 
-                return analysis_result
-            else:
-                logger.error(f"Error from Groq API: {response.status_code} - {response.text}. Full response: {response.json()}")
-                return {
-                    "analysis": "Unable to analyze the financial query at this time. Please try again later.",
-                    "query": financial_query,
-                    "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                    "model": self.model,
-                    "error": f"API Error: {response.status_code}"
-                }
+                    self.router.record_failure(tier, "rate_limited" if response.status_code == 429 else "error",
+                                               retry_after(response.headers))
+                    logger.error(f"Error from Groq API: {response.status_code} - {response.text}")
+                    return self._analysis_result(
+                        financial_query,
+                        "Unable to analyze the financial query at this time. Please try again later.",
+                        tier,
+                        error=f"API Error: {response.status_code}"
+                    )
                 
         except Exception as e:
             logger.error(f"Exception in Groq analysis: {str(e)}")
-            return {
-                "analysis": "An error occurred while analyzing your financial query.",
-                "query": financial_query,
-                "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                "model": self.model,
-                "error": str(e)
-            }
+            return self._analysis_result(
+                financial_query,
+                "An error occurred while analyzing your financial query.",
+                tier,
+                error=str(e)
+            )
+
+    def stream_financial_query(self, financial_query, context):
+        """
+        Stream the analysis of a financial query as it is generated.
+
+        Consumes the chat-completions server-sent-event stream and yields
+        text chunks as they arrive. When the stream ends the generator
+        returns the same result dict as analyze_financial_query (available
+        as StopIteration.value, or via `yield from`). Tier fallback happens
+        only before the first chunk: a tier that is rate limited, or whose
+        headers or first chunk miss its latency SLO, falls back to the next.
+        
+        Args:
+            financial_query (str): The financial query to analyze
+            context (dict): Context information including news articles
+            
+        Yields:
+            str: Chunks of the analysis text
+        """
+        chunks = []
+        tier = None
+        failure_recorded = False
+        try:
+            logger.debug(f"Streaming financial query analysis with Groq API: {financial_query}")
+            prompt = self._prepare_prompt(financial_query, context)
+            tiers = self.router.route(financial_query, context)
+
+            for attempt, tier in enumerate(tiers):
+                with tracing.span("groq.chat_completion", kind=tracing.KIND_CLIENT, **tier.trace_attributes) as span:
+                    last = attempt == len(tiers) - 1
+                    started = time.monotonic()
+                    usage = None
+                    failure_recorded = False
+                    try:
+                        with self.session.post(
+                            f"{self.base_url}/chat/completions",
+                            json=self._build_payload(prompt, tier, stream=True),
+                            timeout=self._tier_timeout(tier, last),
+                            stream=True
+                        ) as response:
+                            span.set_attribute("http.response.status_code", response.status_code)
+                            if response.status_code == 429 and not last:
+                                self.router.record_failure(tier, "rate_limited", retry_after(response.headers))
+                                self.router.record_fallback(tier, tiers[attempt + 1], "rate limited")
+                                continue
+                            if response.status_code != 200:
+                                self.router.record_failure(tier, "rate_limited" if response.status_code == 429 else "error",
+                                                           retry_after(response.headers))
+                                logger.error(f"Error from Groq API: {response.status_code} - {response.text}")
+                                message = "Unable to analyze the financial query at this time. Please try again later."
+                                yield message
+                                return self._analysis_result(financial_query, message, tier,
+                                                             error=f"API Error: {response.status_code}")
+
+                            for line in response.iter_lines(decode_unicode=True):
+                                if not line or not line.startswith("data:"):
+                                    continue
+                                data = line[len("data:"):].strip()
+                                if data == "[DONE]":
+                                    break
+                                event = json.loads(data)
+                                usage = event.get("usage") or (event.get("x_groq") or {}).get("usage") or usage
+                                choices = event.get("choices") or [{}]
+                                chunk = choices[0].get("delta", {}).get("content")
+                                if chunk:
+                                    chunks.append(chunk)
+                                    yield chunk
+                    except (requests.Timeout, requests.ConnectionError) as e:
+                        # A read timeout while iterating the body surfaces as a ConnectionError
+                        if not _is_timeout(e):
+                            raise
+                        self.router.record_failure(tier, "timeout")
+                        failure_recorded = True
+                        if chunks or last:
+                            raise
+                        self.router.record_fallback(tier, tiers[attempt + 1], "latency SLO")
+                        continue
+
+                    self.router.record_success(tier, time.monotonic() - started, usage)
+                    return self._analysis_result(financial_query, "".join(chunks) or "No analysis available", tier)
+
+        except Exception as e:
+            logger.error(f"Exception in Groq streaming analysis: {str(e)}")
+            if tier is not None and not failure_recorded:
+                self.router.record_failure(tier, "error")
+            if chunks:
+                return self._analysis_result(financial_query, "".join(chunks), tier, error=str(e))
+            message = "An error occurred while analyzing your financial query."
+            yield message
+            return self._analysis_result(financial_query, message, tier, error=str(e))
+
+    def _build_payload(self, prompt, tier, stream=False):
+        """
+        Build the chat-completions request body.
+
+        Args:
+            prompt (str): User prompt from _prepare_prompt
+            tier (ModelTier): Model tier to call
+            stream (bool): Ask the API for a server-sent-event stream
+
+        Returns:
+            dict: Request payload
+        """
+        payload = {
+            "model": tier.model,
+            "messages": [
+                {"role": "system", "content": SYSTEM_PROMPT},
+                {"role": "user", "content": prompt}
+            ],
+            "temperature": 0.5,
+            "max_tokens": tier.max_tokens
+        }
+        if stream:
+            payload["stream"] = True
+        return payload
+
+    def _tier_timeout(self, tier, last):
+        """(connect, read) timeout for a tier: its SLO while a smaller tier is left to fall back to."""
+        if last:
+            return self.timeout
+        return (self.timeout[0], min(self.timeout[1], tier.latency_slo))
+
+    def router_stats(self):
+        """Get per-tier routing, latency and token counters."""
+        return self.router.stats()
+
+    @staticmethod
+    def _completion_text(data):
+        """Pull the generated text out of a chat-completions response body."""
+        choices = data.get("choices", [{}])
+        if isinstance(choices, list) and len(choices) > 0:
+            return choices[0].get("message", {}).get("content", "No analysis available")
+        return "No analysis available"
+
+    def _analysis_result(self, financial_query, analysis_text, tier=None, error=None):
+        """Build the analysis result dict stored with each analysis."""
+        tier = tier or self.router.tiers[0]
+        analysis_result = {
+            "analysis": analysis_text,
+            "query": financial_query,
+            "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "model": tier.model,
+            "model_tier": tier.name
+        }
+        if error:
+            analysis_result["error"] = error
+        return analysis_result
+
+
+def _is_timeout(error):
+    """Return True for a requests timeout, including a read timeout raised while streaming the body."""
+    if isinstance(error, requests.Timeout):
+        return True
+    return bool(error.args) and isinstance(error.args[0], ReadTimeoutError)
+
+
+def retry_after(headers):
+    """Seconds from a Retry-After header, or None."""
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
@@ -0,0 +1,35 @@
+import logging
+from http.cookiejar import DefaultCookiePolicy
+
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+def create_session(pool_size=10, pool_block=False, headers=None):
+    """
+    Create a pooled HTTP session that keeps connections to an API alive.
+
+    The session is shared by every request thread. Its connection pool is
+    thread-safe, cookies are refused so the session holds no per-request
+    state, and headers should only be set here, before it is shared.
+
+    Args:
+        pool_size (int): Maximum number of kept-alive connections per host
+        pool_block (bool): Wait for a free connection instead of opening an extra one
+        headers (dict): Default headers sent with every request
+
+    Returns:
+        requests.Session: The configured session
+    """
+    session = requests.Session()
+    session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+
+    # Retries are handled by the services themselves
+    adapter = HTTPAdapter(pool_connections=2, pool_maxsize=pool_size, max_retries=0, pool_block=pool_block)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+
+    if headers:
+        session.headers.update(headers)
+    return session
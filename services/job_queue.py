@@ -0,0 +1,383 @@
+import asyncio
+import itertools
+import logging
+import math
+import os
+import queue
+import socket
+import threading
+import time
+import uuid
+from contextlib import nullcontext
+from datetime import datetime, timedelta
+from models import AnalysisJob
+from services import tracing
+
+logger = logging.getLogger(__name__)
+
+# Lower runs first
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 5
+PRIORITY_LOW = 9
+
+class QueueFullError(Exception):
+    """Raised when the queue cannot take another job; retry_after is a hint in seconds."""
+
+    def __init__(self, message, retry_after=5):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class UserQueueFullError(QueueFullError):
+    """Raised when one user already has the maximum number of unfinished jobs."""
+
+
+class UpstreamLimiter:
+    """
+    Caps how many jobs use each upstream at once.
+
+    Workers take a slot around each stage ('context', 'groq', ...). Stages
+    without a configured limit run unbounded. Jobs running on an event loop
+    take their slots with `async_slot`, which waits without blocking it.
+    """
+
+    def __init__(self, limits=None):
+        self._semaphores = {
+            name: threading.BoundedSemaphore(limit)
+            for name, limit in (limits or {}).items() if limit
+        }
+        self._async_semaphores = {
+            name: asyncio.BoundedSemaphore(limit)
+            for name, limit in (limits or {}).items() if limit
+        }
+
+    def slot(self, name):
+        """
+        Context manager holding one slot of the named upstream.
+
+        Args:
+            name (str): Upstream name
+
+        Returns:
+            A context manager that blocks until a slot is free
+        """
+        semaphore = self._semaphores.get(name)
+        return semaphore if semaphore is not None else nullcontext()
+
+    def async_slot(self, name):
+        """
+        Async context manager holding one slot of the named upstream.
+
+        Args:
+            name (str): Upstream name
+
+        Returns:
+            An async context manager that waits until a slot is free
+        """
+        semaphore = self._async_semaphores.get(name)
+        return semaphore if semaphore is not None else nullcontext()
+
+
+class AnalysisJobQueue:
+    """
+    In-process priority queue of analysis jobs served by a fixed worker pool.
+
+    The web tier only enqueues a job and returns its id; workers run the
+    pipeline and update the job as it moves through its stages. Bursts wait
+    in the queue rather than on web workers, and once `max_pending`
+    unfinished jobs exist (or a user has `max_pending_per_user`) new ones
+    are refused with a Retry-After hint. A user's first unfinished job runs
+    at normal priority and further ones at low priority, so one user's
+    burst does not hold up everyone else.
+
+    With a `store` (MongoDBService) every status change is also written to
+    MongoDB, so any web worker process can answer a status poll. Each job
+    records the process that owns it, and that process refreshes a
+    heartbeat on its unfinished jobs every `heartbeat_interval` seconds.
+    A stored job that is still unfinished but has had no heartbeat for
+    `stale_after` seconds belongs to a process that restarted or died, so
+    it is marked FAILED when polled instead of being polled forever.
+
+    With a `runtime` (AsyncRuntime) there are no worker threads: one
+    dispatcher thread hands jobs to the runtime's event loop as tasks, and
+    `workers` caps how many run at once.
+    """
+
+    def __init__(self, runner, workers=4, max_pending=100, max_pending_per_user=3, upstream_limits=None,
+                 store=None, job_ttl=3600, heartbeat_interval=10, stale_after=None, runtime=None):
+        """
+        Args:
+            runner (callable): runner(job, limiter, progress) runs the pipeline and
+                returns the saved analysis id; progress(stage) reports what it is doing.
+                With a runtime both are coroutine functions.
+            workers (int): Number of worker threads, or of concurrent jobs with a runtime
+            max_pending (int): Unfinished jobs accepted before new ones are refused
+            max_pending_per_user (int): Unfinished jobs accepted per user
+            upstream_limits (dict): Concurrent jobs allowed per upstream stage
+            store (MongoDBService): Optional shared job store
+            job_ttl (float): Seconds a finished job stays in memory
+            heartbeat_interval (float): Seconds between heartbeats on this process's stored jobs
+            stale_after (float): Seconds without a heartbeat before a stored job counts as
+                abandoned (default: three heartbeat intervals)
+            runtime (AsyncRuntime): Optional event loop to run jobs on
+        """
+        self.runner = runner
+        self.workers = workers
+        self.max_pending = max_pending
+        self.max_pending_per_user = max_pending_per_user
+        self.limiter = UpstreamLimiter(upstream_limits)
+        self.store = store
+        self.job_ttl = job_ttl
+        self.heartbeat_interval = heartbeat_interval
+        self.stale_after = stale_after or 3 * heartbeat_interval
+        self.runtime = runtime
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+        self._queue = queue.PriorityQueue()
+        self._sequence = itertools.count()
+        self._jobs = {}
+        self._pending_by_user = {}
+        self._pending = 0
+        self._running = 0
+        self._completed = 0
+        self._failed = 0
+        self._rejected = 0
+        # Moving average of job run time, used for Retry-After hints
+        self._average_seconds = 10.0
+        self._lock = threading.Lock()
+
+        if runtime is None:
+            for i in range(workers):
+                threading.Thread(target=self._work, name=f"analysis-job-{i}", daemon=True).start()
+        else:
+            self._slots = threading.BoundedSemaphore(workers)
+            threading.Thread(target=self._dispatch, name="analysis-job-dispatch", daemon=True).start()
+        if store is not None:
+            threading.Thread(target=self._heartbeat, name="analysis-job-heartbeat", daemon=True).start()
+        logger.info(f"Analysis job queue started with {workers} {'workers' if runtime is None else 'async slots'}"
+                    f" (max {max_pending} pending)")
+
+    def submit(self, user_id, query, priority=None):
+        """
+        Enqueue an analysis job.
+
+        Args:
+            user_id (str): ID of the user who made the query
+            query (str): The financial query
+            priority (int): Explicit priority; by default chosen from the user's unfinished jobs
+
+        Returns:
+            AnalysisJob: The queued job
+
+        Raises:
+            QueueFullError: If the queue (or the user's share of it) is full
+        """
+        with self._lock:
+            self._expire_finished()
+            if self._pending >= self.max_pending:
+                self._rejected += 1
+                raise QueueFullError("The analysis queue is full. Please try again shortly.", self._retry_after())
+
+            user_pending = self._pending_by_user.get(user_id, 0)
+            if user_pending >= self.max_pending_per_user:
+                self._rejected += 1
+                raise UserQueueFullError("You already have analyses in progress. Please wait for them to finish.",
+                                         self._retry_after())
+
+            if priority is None:
+                priority = PRIORITY_NORMAL if user_pending == 0 else PRIORITY_LOW
+            job = AnalysisJob({
+                "_id": uuid.uuid4().hex,
+                "user_id": user_id,
+                "query": query,
+                "priority": priority,
+                "stage": "Waiting for a free worker...",
+                "created_at": datetime.now(),
+                "owner": self.owner
+            })
+            self._jobs[job.id] = job
+            self._pending += 1
+            self._pending_by_user[user_id] = user_pending + 1
+
+        self._save(job)
+        # The submitting request's span, so the job's spans join its trace
+        self._queue.put((priority, next(self._sequence), job.id, tracing.current_span() or None))
+        logger.info(f"Queued analysis job {job.id} for user {user_id} (priority {priority})")
+        return job
+
+    def get(self, job_id):
+        """
+        Get a job by ID, from this process or the shared store.
+
+        A stored job whose owner has stopped sending heartbeats is marked
+        FAILED here, since no process will ever finish it.
+
+        Args:
+            job_id (str): ID of the job
+
+        Returns:
+            AnalysisJob: The job or None if not found
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is None and self.store is not None:
+            job = self.store.get_analysis_job(job_id)
+            if job is not None and not job.finished:
+                cutoff = datetime.now() - timedelta(seconds=self.stale_after)
+                if (job.heartbeat_at or job.started_at or job.created_at or cutoff) < cutoff:
+                    logger.warning(f"Analysis job {job.id} was abandoned by {job.owner}, marking it failed")
+                    job = self.store.fail_stale_analysis_job(
+                        job.id, cutoff, "The server running this analysis restarted. Please try again."
+                    ) or self.store.get_analysis_job(job_id)
+        return job
+
+    def stats(self):
+        """
+        Get queue counters.
+
+        Returns:
+            dict: workers, pending, queued, running, completed, failed, rejected, average_seconds
+        """
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "pending": self._pending,
+                "queued": self._pending - self._running,
+                "running": self._running,
+                "completed": self._completed,
+                "failed": self._failed,
+                "rejected": self._rejected,
+                "average_seconds": round(self._average_seconds, 2)
+            }
+
+    def _work(self):
+        while True:
+            _, _, job_id, parent_span = self._queue.get()
+            with self._lock:
+                job = self._jobs.get(job_id)
+                self._running += 1
+            try:
+                self._run(job, parent_span)
+            finally:
+                with self._lock:
+                    self._running -= 1
+                self._queue.task_done()
+
+    def _dispatch(self):
+        while True:
+            # Take a slot first, so the queue still hands out the highest priority job
+            self._slots.acquire()
+            _, _, job_id, parent_span = self._queue.get()
+            with self._lock:
+                job = self._jobs.get(job_id)
+                self._running += 1
+            self.runtime.submit(self._run_async(job, parent_span)).add_done_callback(self._dispatched_done)
+
+    def _dispatched_done(self, future):
+        with self._lock:
+            self._running -= 1
+        self._slots.release()
+        self._queue.task_done()
+
+    def _run(self, job, parent_span=None):
+        self._start(job)
+        self._save(job)
+
+        def progress(stage):
+            job.stage = stage
+            self._save(job)
+
+        analysis_id = error = None
+        try:
+            with tracing.span("analysis.job", parent=parent_span, **self._span_attributes(job)):
+                analysis_id = self.runner(job, self.limiter, progress)
+        except Exception as e:
+            error = e
+        self._finish(job, analysis_id, error)
+        self._save(job)
+
+    async def _run_async(self, job, parent_span=None):
+        self._start(job)
+        await self._save_async(job)
+
+        async def progress(stage):
+            job.stage = stage
+            await self._save_async(job)
+
+        analysis_id = error = None
+        try:
+            with tracing.span("analysis.job", parent=parent_span, **self._span_attributes(job)):
+                analysis_id = await self.runner(job, self.limiter, progress)
+        except Exception as e:
+            error = e
+        self._finish(job, analysis_id, error)
+        await self._save_async(job)
+
+    @staticmethod
+    def _start(job):
+        job.status = AnalysisJob.RUNNING
+        job.started_at = datetime.now()
+
+    @staticmethod
+    def _span_attributes(job):
+        return {"job.id": job.id, "job.priority": job.priority,
+                "job.queued_seconds": (job.started_at - job.created_at).total_seconds()}
+
+    def _finish(self, job, analysis_id, error):
+        """Record a job's outcome and update the counters."""
+        job.analysis_id = analysis_id
+        if error is not None:
+            logger.error(f"Error running analysis job {job.id}: {str(error)}")
+            job.status = AnalysisJob.FAILED
+            job.error = "An error occurred while processing your query. Please try again."
+        elif analysis_id:
+            job.status = AnalysisJob.DONE
+            job.stage = "Analysis complete."
+        else:
+            job.status = AnalysisJob.FAILED
+            job.error = "The analysis could not be saved. Please try again."
+
+        job.finished_at = datetime.now()
+        with self._lock:
+            self._pending -= 1
+            remaining = self._pending_by_user.get(job.user_id, 1) - 1
+            if remaining > 0:
+                self._pending_by_user[job.user_id] = remaining
+            else:
+                self._pending_by_user.pop(job.user_id, None)
+            if job.status == AnalysisJob.DONE:
+                self._completed += 1
+            else:
+                self._failed += 1
+            elapsed = (job.finished_at - job.started_at).total_seconds()
+            self._average_seconds = 0.8 * self._average_seconds + 0.2 * elapsed
+        logger.info(f"Analysis job {job.id} {job.status} in {elapsed:.2f}s")
+
+    def _save(self, job):
+        if self.store is not None:
+            job.heartbeat_at = datetime.now()
+            self.store.save_analysis_job(job.to_dict())
+
+    async def _save_async(self, job):
+        # The store is synchronous, so its writes go to the runtime's offload threads
+        if self.store is not None:
+            await asyncio.to_thread(self._save, job)
+
+    def _heartbeat(self):
+        while True:
+            time.sleep(self.heartbeat_interval)
+            self.store.touch_analysis_jobs(self.owner, datetime.now())
+
+    def _retry_after(self):
+        """Rough seconds until a slot frees up, from the average run time."""
+        return max(1, math.ceil(self._average_seconds * self._pending / max(self.workers, 1)))
+
+    def _expire_finished(self):
+        """Drop finished jobs older than job_ttl from memory (the store keeps them)."""
+        cutoff = datetime.now() - timedelta(seconds=self.job_ttl)
+        expired = [
+            job_id for job_id, job in self._jobs.items()
+            if job.finished and job.finished_at < cutoff
+        ]
+        for job_id in expired:
+            del self._jobs[job_id]
@@ -0,0 +1,429 @@
+import fcntl
+import hashlib
+import json
+import logging
+import math
+import mmap
+import os
+import re
+import struct
+import numpy as np
+from services.text import STOPWORDS, WORD_PATTERN
+
+logger = logging.getLogger(__name__)
+
+# Bump when the file layout, chunking or term rules change; older files are rebuilt
+INDEX_VERSION = 2
+
+INDEX_MAGIC = b"FKIX"
+
+# magic, version, source checksum, term count, passage count, posting count
+HEADER = struct.Struct("<4sI32sQQQ")
+
+# Flat sections of the index file, in file order, each 8-byte aligned:
+# (name, element dtype) with one (offset, length in bytes) pair per section after the header
+SECTIONS = [
+    ("term_offsets", np.int64),
+    ("term_bytes", np.uint8),
+    ("postings_offsets", np.int64),
+    ("doc_ids", np.int32),
+    ("weights", np.float32),
+    ("passage_offsets", np.int64),
+    ("passage_bytes", np.uint8),
+]
+SECTION_TABLE = struct.Struct("<" + "QQ" * len(SECTIONS))
+
+# Source documents indexed from the knowledge directory
+SOURCE_EXTENSIONS = (".txt", ".md")
+
+# Longest passage in words; longer sections are split
+MAX_PASSAGE_WORDS = 120
+
+HEADING_PATTERN = re.compile(r"^(#+)\s*(.*?)\s*$")
+
+def knowledge_tokens(text):
+    """
+    Split text into index terms: lower-cased words without stopwords, crudely singularized.
+
+    Args:
+        text (str): Passage or query text
+
+    Returns:
+        list: Terms in order, repeats kept
+    """
+    terms = []
+    for word in WORD_PATTERN.findall((text or "").lower()):
+        if word in STOPWORDS:
+            continue
+        if len(word) > 4 and word.endswith("ies"):
+            word = word[:-3] + "y"
+        elif len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+            word = word[:-1]
+        terms.append(word)
+    return terms
+
+
+def chunk_document(text, source):
+    """
+    Cut a markdown-style document into passages, one or more per section.
+
+    The first '#' heading is taken as the document title. Each '###' (or
+    deeper) section becomes passages of at most MAX_PASSAGE_WORDS words,
+    split between paragraphs where possible.
+
+    Args:
+        text (str): Document text
+        source (str): Name recorded with each passage (the file name)
+
+    Returns:
+        list: Passage dicts with source, title, heading and text
+    """
+    title = os.path.splitext(os.path.basename(source))[0].replace("_", " ").title()
+    heading = ""
+    sections = [(heading, [])]
+    for line in text.splitlines():
+        match = HEADING_PATTERN.match(line)
+        if match:
+            level, name = len(match.group(1)), match.group(2)
+            if level == 1:
+                title = name
+            elif level >= 3:
+                heading = name
+                sections.append((heading, []))
+            continue
+        sections[-1][1].append(line)
+
+    passages = []
+    for heading, lines in sections:
+        paragraphs = [" ".join(paragraph.split()) for paragraph in "\n".join(lines).split("\n\n")]
+        words = []
+        for paragraph in filter(None, paragraphs):
+            paragraph_words = paragraph.split()
+            if words and len(words) + len(paragraph_words) > MAX_PASSAGE_WORDS:
+                passages.append(_passage(source, title, heading, words))
+                words = []
+            words.extend(paragraph_words)
+            while len(words) > MAX_PASSAGE_WORDS:
+                passages.append(_passage(source, title, heading, words[:MAX_PASSAGE_WORDS]))
+                words = words[MAX_PASSAGE_WORDS:]
+        if words:
+            passages.append(_passage(source, title, heading, words))
+    return passages
+
+
+def _passage(source, title, heading, words):
+    return {"source": source, "title": title, "heading": heading, "text": " ".join(words)}
+
+
+def source_checksum(source_dir):
+    """
+    SHA-256 over the index version and every source document's name and bytes.
+
+    Args:
+        source_dir (str): Directory of source documents
+
+    Returns:
+        bytes: 32-byte digest; it changes whenever a source is added, removed or edited
+    """
+    digest = hashlib.sha256(f"knowledge-index-{INDEX_VERSION}-{MAX_PASSAGE_WORDS}".encode("utf-8"))
+    for name in source_files(source_dir):
+        digest.update(name.encode("utf-8") + b"\0")
+        with open(os.path.join(source_dir, name), "rb") as f:
+            for block in iter(lambda: f.read(1 << 16), b""):
+                digest.update(block)
+        digest.update(b"\0")
+    return digest.digest()
+
+
+def source_files(source_dir):
+    """Source documents under source_dir, as sorted paths relative to it."""
+    found = []
+    for root, _, files in os.walk(source_dir):
+        for name in files:
+            if name.endswith(SOURCE_EXTENSIONS):
+                found.append(os.path.relpath(os.path.join(root, name), source_dir))
+    return sorted(found)
+
+
+class StringTable:
+    """
+    Strings packed into one byte buffer, addressed through an offsets array.
+
+    Backs both the sorted vocabulary (looked up by binary search) and the
+    passages (stored as JSON) of a memory-mapped index, so neither has to be
+    unpacked into Python objects in each worker.
+    """
+
+    def __init__(self, offsets, data):
+        self.offsets = offsets
+        self.data = data
+
+    @classmethod
+    def pack(cls, strings):
+        """Pack a list of strings into (offsets, bytes) arrays."""
+        encoded = [string.encode("utf-8") for string in strings]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(item) for item in encoded], dtype=np.int64)
+        return cls(offsets, np.frombuffer(b"".join(encoded), dtype=np.uint8))
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        return self.data[self.offsets[i]:self.offsets[i + 1]].tobytes().decode("utf-8")
+
+    def find(self, string):
+        """Index of string in a sorted table, or None."""
+        low, high = 0, len(self)
+        while low < high:
+            middle = (low + high) // 2
+            if self[middle] < string:
+                low = middle + 1
+            else:
+                high = middle
+        return low if low < len(self) and self[low] == string else None
+
+
+class KnowledgeIndex:
+    """
+    BM25 index over the passages of the knowledge corpus.
+
+    Postings are stored by term in flat NumPy arrays (CSR layout):
+    postings_offsets[t]:postings_offsets[t + 1] slices the passage ids and
+    precomputed BM25 weights of term t. A query adds up the weight slices
+    of its terms, so a search touches only the postings of the query's own
+    terms.
+
+    The index is compiled ahead of time (`flask build-knowledge-index`) into
+    a single versioned file that records a checksum of its sources. Workers
+    map the file read-only and use its arrays in place, so every process
+    shares one page-cache copy and nothing is tokenized at boot.
+    """
+
+    def __init__(self, terms, passages, postings_offsets, doc_ids, weights, checksum=b""):
+        """
+        Args:
+            terms (StringTable): Sorted vocabulary; the position of a term is its id
+            passages (StringTable): Passages as JSON strings
+            postings_offsets (ndarray): Start of each term's postings, plus the end
+            doc_ids (ndarray): Passage id of each posting
+            weights (ndarray): BM25 weight of each posting
+            checksum (bytes): Checksum of the sources the index was built from
+        """
+        self.terms = terms
+        self.passages = passages
+        self.postings_offsets = postings_offsets
+        self.doc_ids = doc_ids
+        self.weights = weights
+        self.checksum = checksum
+        self._mmap = None
+
+    def __len__(self):
+        return len(self.passages)
+
+    @classmethod
+    def build(cls, passages, k1=1.5, b=0.75, checksum=b""):
+        """
+        Build an in-memory index from passages.
+
+        Args:
+            passages (list): Passage dicts as returned by chunk_document
+            k1 (float): BM25 term-frequency saturation
+            b (float): BM25 length normalization
+            checksum (bytes): Source checksum to record
+
+        Returns:
+            KnowledgeIndex: The index
+        """
+        term_counts = []
+        for passage in passages:
+            counts = {}
+            for term in knowledge_tokens(f"{passage['heading']} {passage['text']}"):
+                counts[term] = counts.get(term, 0) + 1
+            term_counts.append(counts)
+
+        terms = sorted({term for counts in term_counts for term in counts})
+        term_ids = {term: term_id for term_id, term in enumerate(terms)}
+        lengths = np.array([sum(counts.values()) for counts in term_counts], dtype=np.float32)
+        average_length = float(lengths.mean()) if len(lengths) else 1.0
+
+        postings = [[] for _ in terms]
+        for doc_id, counts in enumerate(term_counts):
+            for term, count in counts.items():
+                postings[term_ids[term]].append((doc_id, count))
+
+        postings_offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+        doc_ids = np.empty(sum(len(p) for p in postings), dtype=np.int32)
+        weights = np.empty(len(doc_ids), dtype=np.float32)
+        position = 0
+        for term_id, term_postings in enumerate(postings):
+            idf = math.log(1 + (len(passages) - len(term_postings) + 0.5) / (len(term_postings) + 0.5))
+            for doc_id, count in term_postings:
+                norm = k1 * (1 - b + b * lengths[doc_id] / average_length)
+                doc_ids[position] = doc_id
+                weights[position] = idf * count * (k1 + 1) / (count + norm)
+                position += 1
+            postings_offsets[term_id + 1] = position
+
+        return cls(
+            StringTable.pack(terms),
+            StringTable.pack([json.dumps(passage, ensure_ascii=False) for passage in passages]),
+            postings_offsets, doc_ids, weights, checksum
+        )
+
+    @classmethod
+    def from_directory(cls, source_dir):
+        """Chunk and index every source document under source_dir."""
+        checksum = source_checksum(source_dir)
+        passages = []
+        for name in source_files(source_dir):
+            with open(os.path.join(source_dir, name), encoding="utf-8") as f:
+                passages.extend(chunk_document(f.read(), name))
+        return cls.build(passages, checksum=checksum)
+
+    @classmethod
+    def compile(cls, source_dir, index_path, force=False):
+        """
+        Build the index file for source_dir unless it is already up to date.
+
+        Only one process builds at a time; others wait and then find the
+        file current. The file is written beside the old one and renamed
+        over it, so readers never see a partial index.
+
+        Args:
+            source_dir (str): Directory of source documents
+            index_path (str): Index file to write
+            force (bool): Rebuild even if the checksum matches
+
+        Returns:
+            bool: True if the file was rebuilt
+        """
+        os.makedirs(os.path.dirname(os.path.abspath(index_path)), exist_ok=True)
+        with open(index_path + ".lock", "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            if not force and cls.stored_checksum(index_path) == source_checksum(source_dir):
+                return False
+            index = cls.from_directory(source_dir)
+            index.save(index_path)
+            logger.info(f"Knowledge index compiled: {len(index)} passages, {len(index.terms)} terms -> {index_path}")
+            return True
+
+    @classmethod
+    def load_or_build(cls, source_dir, index_path, auto_build=True):
+        """
+        Map the index file, compiling it first if it is missing or its sources changed.
+
+        Args:
+            source_dir (str): Directory of source documents
+            index_path (str): Index file
+            auto_build (bool): Compile a missing or stale file here; when False a
+                stale file is used as it is and a missing one gives an empty index
+
+        Returns:
+            KnowledgeIndex: The index
+        """
+        try:
+            if auto_build:
+                cls.compile(source_dir, index_path)
+            elif cls.stored_checksum(index_path) != source_checksum(source_dir):
+                logger.warning(f"Knowledge index {index_path} is missing or stale; run `flask build-knowledge-index`")
+            return cls.load(index_path)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Could not load the knowledge index from {index_path}: {str(e)}")
+            return cls.build([]) if not auto_build else cls.from_directory(source_dir)
+
+    def save(self, index_path):
+        """Write the index as one file: header, section table, then each flat array."""
+        arrays = {
+            "term_offsets": self.terms.offsets,
+            "term_bytes": self.terms.data,
+            "postings_offsets": self.postings_offsets,
+            "doc_ids": self.doc_ids,
+            "weights": self.weights,
+            "passage_offsets": self.passages.offsets,
+            "passage_bytes": self.passages.data,
+        }
+        position = HEADER.size + SECTION_TABLE.size
+        table = []
+        for name, dtype in SECTIONS:
+            position += -position % 8
+            size = len(arrays[name]) * np.dtype(dtype).itemsize
+            table.extend((position, size))
+            position += size
+
+        temp_path = f"{index_path}.{os.getpid()}.tmp"
+        with open(temp_path, "wb") as f:
+            f.write(HEADER.pack(INDEX_MAGIC, INDEX_VERSION, self.checksum.ljust(32, b"\0"),
+                                len(self.terms), len(self.passages), len(self.doc_ids)))
+            f.write(SECTION_TABLE.pack(*table))
+            for (name, dtype), offset in zip(SECTIONS, table[::2]):
+                f.write(b"\0" * (offset - f.tell()))
+                f.write(np.ascontiguousarray(arrays[name], dtype=dtype).tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, index_path)
+
+    @classmethod
+    def load(cls, index_path):
+        """
+        Map an index file read-only.
+
+        Raises:
+            ValueError: If the file is not an index of the current version
+        """
+        with open(index_path, "rb") as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, checksum, _, _, _ = HEADER.unpack_from(mapped)
+        if magic != INDEX_MAGIC or version != INDEX_VERSION:
+            mapped.close()
+            raise ValueError(f"{index_path} is not a version {INDEX_VERSION} knowledge index")
+
+        table = SECTION_TABLE.unpack_from(mapped, HEADER.size)
+        arrays = {
+            name: np.frombuffer(mapped, dtype=dtype, count=size // np.dtype(dtype).itemsize, offset=offset)
+            for (name, dtype), offset, size in zip(SECTIONS, table[::2], table[1::2])
+        }
+        index = cls(
+            StringTable(arrays["term_offsets"], arrays["term_bytes"]),
+            StringTable(arrays["passage_offsets"], arrays["passage_bytes"]),
+            arrays["postings_offsets"], arrays["doc_ids"], arrays["weights"], checksum
+        )
+        index._mmap = mapped
+        return index
+
+    @staticmethod
+    def stored_checksum(index_path):
+        """Source checksum recorded in an index file, or None if there is no current-version file."""
+        try:
+            with open(index_path, "rb") as f:
+                magic, version, checksum, _, _, _ = HEADER.unpack(f.read(HEADER.size))
+        except (OSError, struct.error):
+            return None
+        return checksum if magic == INDEX_MAGIC and version == INDEX_VERSION else None
+
+    def search(self, query, top_k=3):
+        """
+        Find the passages that best match a query.
+
+        Args:
+            query (str): Free text, usually the user's financial query
+            top_k (int): Largest number of passages returned
+
+        Returns:
+            list: Passage dicts with a 'score', best first; only passages sharing a term with the query
+        """
+        term_ids = {self.terms.find(term) for term in knowledge_tokens(query)} - {None}
+        if not term_ids or top_k <= 0:
+            return []
+
+        scores = np.zeros(len(self.passages), dtype=np.float32)
+        for term_id in term_ids:
+            start, end = self.postings_offsets[term_id], self.postings_offsets[term_id + 1]
+            # A term lists each passage at most once, so plain fancy-index addition is safe
+            scores[self.doc_ids[start:end]] += self.weights[start:end]
+
+        matched = np.flatnonzero(scores)
+        if len(matched) > top_k:
+            matched = matched[np.argpartition(scores[matched], -top_k)[-top_k:]]
+        best = matched[np.argsort(-scores[matched], kind="stable")]
+        return [{**json.loads(self.passages[doc_id]), "score": round(float(scores[doc_id]), 4)} for doc_id in best]
@@ -0,0 +1,126 @@
+import logging
+from datetime import datetime, time as dt_time, timedelta, timezone
+
+logger = logging.getLogger(__name__)
+
+# India does not observe daylight saving, so a fixed offset is exact
+IST = timezone(timedelta(hours=5, minutes=30), name="IST")
+
+# Raw ticker.info keys grouped by how quickly they go stale
+QUOTE_FIELDS = (
+    "symbol",
+    "regularMarketPrice",
+    "regularMarketChange",
+    "regularMarketChangePercent",
+    "previousClose",
+)
+FUNDAMENTAL_FIELDS = (
+    "shortName",
+    "sector",
+    "industry",
+    "marketCap",
+    "trailingPE",
+    "dividendYield",
+)
+
+class NSEMarketHours:
+    """
+    NSE regular trading session: 09:15 to 15:30 IST, Monday to Friday.
+
+    Exchange holidays are not modelled; on a holiday prices simply keep the
+    short intraday TTL.
+    """
+
+    open_time = dt_time(9, 15)
+    close_time = dt_time(15, 30)
+
+    def is_open(self, now=None):
+        """Return True if the regular session is open at `now` (defaults to the current time)."""
+        now = (now or datetime.now(IST)).astimezone(IST)
+        return now.weekday() < 5 and self.open_time <= now.time() < self.close_time
+
+    def next_open(self, now=None):
+        """Return the datetime of the next session open strictly after `now`."""
+        now = (now or datetime.now(IST)).astimezone(IST)
+        candidate = datetime.combine(now.date(), self.open_time, tzinfo=IST)
+        if candidate <= now:
+            candidate += timedelta(days=1)
+        while candidate.weekday() >= 5:
+            candidate += timedelta(days=1)
+        return candidate
+
+
+class MarketDataCache:
+    """
+    Caches the raw ticker.info fields for a normalized symbol in two groups.
+
+    Prices expire after `quote_ttl` seconds while the market is open and are
+    held until the next session open once it closes. Fundamentals live for
+    `fundamentals_ttl` seconds regardless of market hours, so a price miss
+    only needs the price fields refetched.
+    """
+
+    def __init__(self, backend, quote_ttl=15, fundamentals_ttl=86400, market_hours=None):
+        self.backend = backend
+        self.quote_ttl = quote_ttl
+        self.fundamentals_ttl = fundamentals_ttl
+        self.market_hours = market_hours or NSEMarketHours()
+        logger.info(f"Market data cache initialized (quote TTL {quote_ttl}s, fundamentals TTL {fundamentals_ttl}s)")
+
+    def quote_expiry(self, now=None):
+        """
+        Seconds a freshly fetched price stays valid.
+
+        Args:
+            now (datetime): Reference time, defaults to the current time
+
+        Returns:
+            float: TTL in seconds
+        """
+        now = (now or datetime.now(IST)).astimezone(IST)
+        if self.market_hours.is_open(now):
+            return self.quote_ttl
+        return max((self.market_hours.next_open(now) - now).total_seconds(), self.quote_ttl)
+
+    def get_quote(self, normalized_symbol):
+        """Get the cached price fields for a symbol, or None if stale."""
+        return self.backend.get(f"quote:{normalized_symbol}")
+
+    def get_fundamentals(self, normalized_symbol):
+        """Get the cached fundamental fields for a symbol, or None if stale."""
+        return self.backend.get(f"fundamentals:{normalized_symbol}")
+
+    def set_info(self, normalized_symbol, info):
+        """
+        Store the quote and fundamental fields of a ticker.info mapping.
+
+        Args:
+            normalized_symbol (str): Symbol as returned by YFinanceService._normalize_symbol
+            info (dict): Raw ticker.info mapping
+        """
+        if not info:
+            return
+        self.set_quote(normalized_symbol, info)
+        self.backend.set(
+            f"fundamentals:{normalized_symbol}",
+            {field: info.get(field) for field in FUNDAMENTAL_FIELDS if field in info},
+            self.fundamentals_ttl
+        )
+
+    def set_quote(self, normalized_symbol, info):
+        """
+        Store only the price fields of a ticker.info-shaped mapping.
+
+        Args:
+            normalized_symbol (str): Symbol as returned by YFinanceService._normalize_symbol
+            info (dict): Mapping with any of the QUOTE_FIELDS keys
+        """
+        self.backend.set(
+            f"quote:{normalized_symbol}",
+            {field: info.get(field) for field in QUOTE_FIELDS if field in info},
+            self.quote_expiry()
+        )
+
+    def stats(self):
+        """Get hit/miss counters of the underlying backend."""
+        return self.backend.stats()
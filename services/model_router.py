@@ -0,0 +1,213 @@
+import logging
+import re
+import threading
+import time
+from collections import deque
+from services import tracing
+
+logger = logging.getLogger(__name__)
+
+# Words that ask for judgement or explanation rather than a figure
+DEEP_WORDS = frozenset({
+    "analyse", "analyze", "analysis", "compare", "comparison", "should", "strategy", "outlook", "portfolio",
+    "risk", "risks", "why", "explain", "versus", "vs", "long-term", "future", "forecast", "diversify",
+    "allocate", "allocation", "impact", "recommend", "worth", "invest", "plan", "pros", "cons",
+})
+
+# Phrases of short factual or price questions
+FACTUAL_PATTERN = re.compile(
+    r"\b(price|quote|trading at|market cap|p/?e|dividend yield|52[- ]week|high|low|close|"
+    r"how much|what is|what's|current|today|now|change)\b",
+    re.IGNORECASE
+)
+
+WORD_PATTERN = re.compile(r"[\w\-/']+")
+
+class ModelTier:
+    """One model the router can send a query to."""
+
+    def __init__(self, name, model, max_tokens, latency_slo):
+        """
+        Args:
+            name (str): Tier name used in metrics ('fast', 'deep')
+            model (str): Groq model id
+            max_tokens (int): Completion token limit for this tier
+            latency_slo (float): Seconds a call should take at most; a slower
+                call falls back to the next tier when there is one
+        """
+        self.name = name
+        self.model = model
+        self.max_tokens = max_tokens
+        self.latency_slo = latency_slo
+
+        self.requests = 0
+        self.failures = 0
+        self.rate_limited = 0
+        self.slo_breaches = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.latencies = deque(maxlen=500)
+        self.unavailable_until = 0.0
+
+    @property
+    def trace_attributes(self):
+        """Span attributes identifying this tier."""
+        return {"gen_ai.request.model": self.model, "model.tier": self.name}
+
+
+class ModelRouter:
+    """
+    Picks a model tier per query and the tiers to fall back to.
+
+    Tiers are ordered largest first. Short factual or price questions with
+    at most one stock go to the smallest tier; everything else goes to the
+    largest. A call that is rate limited (429) or runs past its tier's
+    latency SLO is retried on the next smaller tier, and a rate-limited
+    tier is skipped until its Retry-After has passed. A tier whose recent
+    p95 latency is over its SLO is skipped for `degraded_seconds` too.
+    """
+
+    def __init__(self, tiers, min_samples=20, degraded_seconds=60):
+        """
+        Args:
+            tiers (list): ModelTier objects, largest model first
+            min_samples (int): Calls needed before a tier's p95 is trusted
+            degraded_seconds (float): How long a tier over its SLO is skipped
+        """
+        self.tiers = tiers
+        self.min_samples = min_samples
+        self.degraded_seconds = degraded_seconds
+        self._routed = {tier.name: 0 for tier in tiers}
+        self._fallbacks = 0
+        self._lock = threading.Lock()
+
+    def choose(self, financial_query, context):
+        """
+        Pick the tier a query deserves, from cheap features of the query and context.
+
+        Args:
+            financial_query (str): The financial query
+            context (dict): Financial context for the query
+
+        Returns:
+            ModelTier: The chosen tier
+        """
+        words = [word.lower() for word in WORD_PATTERN.findall(financial_query or "")]
+        symbols = len(context.get("stock_data") or {})
+        factual = bool(FACTUAL_PATTERN.search(financial_query or ""))
+        deep = any(word in DEEP_WORDS for word in words)
+        if factual and not deep and len(words) <= 15 and symbols <= 1:
+            return self.tiers[-1]
+        return self.tiers[0]
+
+    def route(self, financial_query, context):
+        """
+        Tiers to try for a query, in order: the chosen tier, then each smaller one.
+
+        Tiers that are rate limited or over their SLO are left out, unless
+        that would leave nothing to try.
+
+        Returns:
+            list: ModelTier objects
+        """
+        chosen = self.choose(financial_query, context)
+        candidates = self.tiers[self.tiers.index(chosen):]
+        now = time.monotonic()
+        with self._lock:
+            available = [tier for tier in candidates if tier.unavailable_until <= now] or candidates[-1:]
+            self._routed[available[0].name] += 1
+        if available[0] is not chosen:
+            logger.info(f"Routing to {available[0].name} model: {chosen.name} tier is unavailable")
+        return available
+
+    def record_success(self, tier, latency, usage=None):
+        """
+        Record a completed call.
+
+        Args:
+            tier (ModelTier): Tier that answered
+            latency (float): Seconds the call took
+            usage (dict): The response's 'usage' block (prompt_tokens, completion_tokens)
+        """
+        usage = usage or {}
+        tracing.current_span().set_attributes({
+            "gen_ai.usage.input_tokens": usage.get("prompt_tokens"),
+            "gen_ai.usage.output_tokens": usage.get("completion_tokens"),
+            "slo.breached": latency > tier.latency_slo
+        })
+        with self._lock:
+            tier.requests += 1
+            tier.latencies.append(latency)
+            # Streamed usage blocks can carry the keys with null values
+            tier.prompt_tokens += usage.get("prompt_tokens") or 0
+            tier.completion_tokens += usage.get("completion_tokens") or 0
+            if latency > tier.latency_slo:
+                tier.slo_breaches += 1
+                if len(tier.latencies) >= self.min_samples and self._percentile(tier, 95) > tier.latency_slo:
+                    logger.warning(f"{tier.name} model p95 latency is over its {tier.latency_slo}s SLO")
+                    tier.unavailable_until = time.monotonic() + self.degraded_seconds
+                    tier.latencies.clear()
+
+    def record_failure(self, tier, reason, retry_after=None):
+        """
+        Record a failed call.
+
+        Args:
+            tier (ModelTier): Tier that failed
+            reason (str): 'rate_limited', 'timeout' or 'error'
+            retry_after (float): Seconds to skip a rate-limited tier for
+        """
+        tracing.current_span().set_error(reason)
+        with self._lock:
+            tier.requests += 1
+            tier.failures += 1
+            if reason == "rate_limited":
+                tier.rate_limited += 1
+                tier.unavailable_until = time.monotonic() + (retry_after or self.degraded_seconds)
+            elif reason == "timeout":
+                tier.slo_breaches += 1
+
+    def record_fallback(self, from_tier, to_tier, reason):
+        """Record a retry on a smaller tier."""
+        tracing.current_span().set_attributes({"fallback.to": to_tier.name, "fallback.reason": reason})
+        with self._lock:
+            self._fallbacks += 1
+        logger.warning(f"Falling back from {from_tier.name} to {to_tier.name} model ({reason})")
+
+    def stats(self):
+        """
+        Get per-tier routing, latency and token counters.
+
+        Returns:
+            dict: fallbacks and, per tier, model, routed, requests, failures, rate_limited,
+            slo_breaches, p50/p95 latency, token totals and whether it is being skipped
+        """
+        now = time.monotonic()
+        with self._lock:
+            return {
+                "fallbacks": self._fallbacks,
+                "tiers": {
+                    tier.name: {
+                        "model": tier.model,
+                        "routed": self._routed[tier.name],
+                        "requests": tier.requests,
+                        "failures": tier.failures,
+                        "rate_limited": tier.rate_limited,
+                        "slo_breaches": tier.slo_breaches,
+                        "latency_slo": tier.latency_slo,
+                        "p50_latency": round(self._percentile(tier, 50), 3),
+                        "p95_latency": round(self._percentile(tier, 95), 3),
+                        "prompt_tokens": tier.prompt_tokens,
+                        "completion_tokens": tier.completion_tokens,
+                        "unavailable": tier.unavailable_until > now
+                    }
+                    for tier in self.tiers
+                }
+            }
+
+    @staticmethod
+    def _percentile(tier, percent):
+        if not tier.latencies:
+            return 0.0
+        ordered = sorted(tier.latencies)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * percent / 100))]
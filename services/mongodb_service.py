@@ -1,14 +1,123 @@
+import base64
+import hashlib
+import json
 import logging
 from datetime import datetime
 import bson
-from models import User, FinancialAnalysis
+import bson.errors
+from pymongo import ASCENDING, DESCENDING, ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError
+from models import User, FinancialAnalysis, FinancialAnalysisSummary, AnalysisContext, AnalysisJob
+from services import tracing
+from services.compression import FieldCompressor, DecompressingDict, is_compressed
 
 logger = logging.getLogger(__name__)
 
+# Indexes behind every query this service runs: (collection, keys, options)
+INDEXES = [
+    ("users", [("username", ASCENDING)], {"name": "username_unique", "unique": True}),
+    ("users", [("email", ASCENDING)], {"name": "email_unique", "unique": True}),
+    # History: one user's analyses newest first; _id breaks ties between equal timestamps
+    ("financial_analyses", [("user_id", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)],
+     {"name": "user_created_at"}),
+    # Finished jobs expire after a week; unfinished ones have no finished_at and are kept
+    ("analysis_jobs", [("finished_at", ASCENDING)], {"name": "finished_at_ttl", "expireAfterSeconds": 7 * 24 * 3600}),
+    # Heartbeats: one queue process's unfinished jobs
+    ("analysis_jobs", [("owner", ASCENDING), ("status", ASCENDING)], {"name": "owner_status"}),
+]
+
+# Stages that mean a query reads the whole collection or sorts in memory
+UNINDEXED_STAGES = frozenset({"COLLSCAN", "SORT"})
+
+# Collections the bulk export and import commands move
+TRANSFER_COLLECTIONS = ("users", "financial_analyses")
+
+# User fields needed to rebuild current_user on each request
+SESSION_USER_PROJECTION = {"username": 1, "email": 1}
+
+class QueryPlanError(RuntimeError):
+    """Raised when a hot query is not served by an index."""
+
 class MongoDBService:
-    def __init__(self, db):
+    def __init__(self, db, compression="auto", compression_level=6, user_cache=None, user_cache_ttl=300):
         self.db = db
+        # Analysis HTML and article bodies are stored compressed and only
+        # decompressed when a page actually reads them
+        self.compressor = FieldCompressor(compression, compression_level, store=self)
+        # Optional CacheBackend of session users (no password hashes), so
+        # authenticated requests do not each read the users collection
+        self.user_cache = user_cache
+        self.user_cache_ttl = user_cache_ttl
         logger.info("MongoDB service initialized")
+
+    # Index operations
+    def ensure_indexes(self):
+        """
+        Create the indexes in INDEXES if they do not exist yet.
+        
+        Creating an index that already exists is a no-op, so this is safe
+        to run at every startup.
+        
+        Returns:
+            list: Names of the ensured indexes
+        """
+        names = []
+        for collection, keys, options in INDEXES:
+            names.append(self.db[collection].create_index(keys, **options))
+        logger.info(f"Ensured MongoDB indexes: {', '.join(names)}")
+        return names
+
+    def hot_queries(self):
+        """
+        The queries this service runs on every request, with placeholder values.
+        
+        Returns:
+            list: (description, collection, filter, sort) tuples
+        """
+        sample_id = bson.ObjectId()
+        return [
+            ("user by username", "users", {"username": "sample"}, None),
+            ("user by username or email", "users", {"$or": [{"username": "sample"}, {"email": "sample@example.com"}]}, None),
+            ("user by id", "users", {"_id": sample_id}, None),
+            ("analysis history", "financial_analyses", {"user_id": str(sample_id)},
+             [("created_at", DESCENDING), ("_id", DESCENDING)]),
+            ("analysis history page", "financial_analyses", {"user_id": str(sample_id), "$or": [
+                {"created_at": {"$lt": datetime.now()}},
+                {"created_at": datetime.now(), "_id": {"$lt": sample_id}}
+            ]}, [("created_at", DESCENDING), ("_id", DESCENDING)]),
+            ("analysis by id and owner", "financial_analyses", {"_id": sample_id, "user_id": str(sample_id)}, None),
+            ("analysis job by id", "analysis_jobs", {"_id": "sample"}, None),
+            ("unfinished analysis jobs by owner", "analysis_jobs",
+             {"owner": "sample", "status": {"$in": [AnalysisJob.QUEUED, AnalysisJob.RUNNING]}}, None),
+        ]
+
+    def verify_query_plans(self):
+        """
+        Explain every hot query and fail if one is not served by an index.
+        
+        Returns:
+            dict: Winning-plan stages keyed by query description
+            
+        Raises:
+            QueryPlanError: If any winning plan contains a COLLSCAN or an in-memory SORT
+        """
+        plans = {}
+        failures = []
+        for description, collection, query_filter, sort in self.hot_queries():
+            cursor = self.db[collection].find(query_filter).limit(10)
+            if sort:
+                cursor = cursor.sort(sort)
+            planner = cursor.explain().get("queryPlanner", {})
+            stages = sorted(_plan_stages(planner.get("winningPlan", {})))
+            plans[description] = stages
+            unindexed = UNINDEXED_STAGES.intersection(stages)
+            if unindexed:
+                failures.append(f"{description} on {collection} uses {', '.join(sorted(unindexed))}")
+
+        if failures:
+            raise QueryPlanError("Hot queries are not using indexes: " + "; ".join(failures))
+        logger.info("All hot MongoDB queries are served by indexes")
+        return plans
     
     # User operations
     def create_user(self, username, email, password):
@@ -75,6 +184,8 @@ class MongoDBService:
         try:
             user_data = self.db.users.find_one({"username": username})
             if user_data:
+                # Usually a login, so the session lookups that follow start warm
+                self._cache_session_user(user_data)
                 return User(user_data)
             return None
         except Exception as e:
@@ -100,6 +211,70 @@ class MongoDBService:
             logger.error(f"Error getting user by ID: {str(e)}")
             return None
     
+    def get_session_user(self, user_id):
+        """
+        Get the user for a logged-in session, from the user cache when possible
+        
+        The returned user carries no password hash; use get_user_by_username
+        to check passwords.
+        
+        Args:
+            user_id (str): User ID stored in the session
+            
+        Returns:
+            User: User object or None if not found
+        """
+        if self.user_cache is not None:
+            user_data = self.user_cache.get(f"user:{user_id}")
+            tracing.current_span().set_attribute("user_cache.hit", user_data is not None)
+            if user_data is not None:
+                return User(user_data)
+        try:
+            user_data = self.db.users.find_one({"_id": bson.ObjectId(user_id)}, SESSION_USER_PROJECTION)
+            if user_data:
+                self._cache_session_user(user_data)
+                return User(user_data)
+            return None
+        except Exception as e:
+            logger.error(f"Error getting session user: {str(e)}")
+            return None
+    
+    def update_user(self, user_id, updates):
+        """
+        Update fields of a user and drop the user from the cache
+        
+        Args:
+            user_id (str): User ID
+            updates (dict): Fields to set
+            
+        Returns:
+            bool: True if a user was updated, False otherwise
+        """
+        try:
+            result = self.db.users.update_one({"_id": bson.ObjectId(user_id)}, {"$set": updates})
+            return result.modified_count > 0
+        except Exception as e:
+            logger.error(f"Error updating user: {str(e)}")
+            return False
+        finally:
+            self.invalidate_user(user_id)
+    
+    def invalidate_user(self, user_id):
+        """
+        Drop a user from the user cache; call after any change to the user's document
+        
+        Args:
+            user_id (str): User ID
+        """
+        if self.user_cache is not None:
+            self.user_cache.delete(f"user:{user_id}")
+    
+    def _cache_session_user(self, user_data):
+        if self.user_cache is not None:
+            session_data = {field: user_data.get(field) for field in SESSION_USER_PROJECTION}
+            session_data["_id"] = user_data["_id"]
+            self.user_cache.set(f"user:{user_data['_id']}", session_data, self.user_cache_ttl)
+    
     # Financial Analysis operations
     def save_financial_analysis(self, user_id, query, context, analysis):
         """
@@ -114,33 +289,80 @@ class MongoDBService:
         Returns:
             str: ID of the saved analysis or None if failed
         """
-        try:
-            analysis_data = {
-                "_id": bson.ObjectId(),
-                "user_id": user_id,
-                "query": query,
-                "context": context,
-                "analysis": analysis,
-                "created_at": datetime.now()
-            }
+        with tracing.span("mongodb.save_analysis") as span:
+            try:
+                # Articles and stock snapshots are stored once each and referenced by hash
+                stored_context, articles, snapshots = split_context(context)
+                span.set_attributes({"analysis.articles": len(articles), "analysis.stock_snapshots": len(snapshots)})
+                self._store_content(
+                    self.db.articles, [self.compressor.compress_fields(article, "content") for article in articles]
+                )
+                self._store_content(self.db.stock_snapshots, snapshots)
+                analysis_data = self._analysis_document(
+                    user_id, query, stored_context, self.compressor.compress_fields(analysis, "analysis")
+                )
             
-            result = self.db.financial_analyses.insert_one(analysis_data)
+                result = self.db.financial_analyses.insert_one(analysis_data)
             
-            if result.inserted_id:
-                logger.info(f"Financial analysis saved for user {user_id}")
-                return str(result.inserted_id)
-            else:
-                logger.error("Failed to insert financial analysis into database")
-                return None
+                if result.inserted_id:
+                    logger.info(f"Financial analysis saved for user {user_id}")
+                    return str(result.inserted_id)
+                else:
+                    logger.error("Failed to insert financial analysis into database")
+                    return None
                 
-        except Exception as e:
-            logger.error(f"Error saving financial analysis: {str(e)}")
-            return None
+            except Exception as e:
+                logger.error(f"Error saving financial analysis: {str(e)}")
+                span.set_error(str(e))
+                return None
     
+    @staticmethod
+    def _analysis_document(user_id, query, context, analysis):
+        """Build the financial_analyses document for a new analysis."""
+        return {
+            "_id": bson.ObjectId(),
+            "user_id": user_id,
+            "query": query,
+            "context": context,
+            "analysis": analysis,
+            "created_at": datetime.now()
+        }
+
+    @staticmethod
+    def _store_content(collection, documents):
+        """Insert content-addressed documents that are not stored yet; existing ones are left as they are."""
+        if not documents:
+            return
+        try:
+            collection.bulk_write(content_upserts(documents), ordered=False)
+        except BulkWriteError as e:
+            # A concurrent save inserting the same hash first is fine
+            if any(error.get("code") != 11000 for error in e.details.get("writeErrors", [])):
+                raise
+
+    def _load_articles(self, refs):
+        """Load referenced articles, in reference order."""
+        documents = {
+            document.pop("_id"): DecompressingDict(document, self.compressor)
+            for document in self.db.articles.find({"_id": {"$in": list(refs)}}, {"created_at": 0})
+        }
+        return [documents[ref] for ref in refs if ref in documents]
+
+    def _load_stock_snapshots(self, refs):
+        """Load referenced stock snapshots keyed by symbol."""
+        documents = {
+            document.pop("_id"): document
+            for document in self.db.stock_snapshots.find({"_id": {"$in": [ref["ref"] for ref in refs]}}, {"created_at": 0})
+        }
+        return {ref["symbol"]: documents[ref["ref"]] for ref in refs if ref["ref"] in documents}
+
     def get_financial_analysis(self, analysis_id):
         """
         Get a financial analysis by ID
         
+        Referenced articles and stock snapshots are only read from MongoDB
+        when the context's 'articles' or 'stock_data' is first accessed.
+        
         Args:
             analysis_id (str): ID of the analysis to retrieve
             
@@ -150,6 +372,10 @@ class MongoDBService:
         try:
             analysis_data = self.db.financial_analyses.find_one({"_id": bson.ObjectId(analysis_id)})
             if analysis_data:
+                analysis_data["context"] = AnalysisContext(
+                    analysis_data.get("context") or {}, self._load_articles, self._load_stock_snapshots
+                )
+                analysis_data["analysis"] = DecompressingDict(analysis_data.get("analysis") or {}, self.compressor)
                 return FinancialAnalysis(analysis_data)
             return None
         except Exception as e:
@@ -172,6 +398,7 @@ class MongoDBService:
             cursor = self.db.financial_analyses.find({"user_id": user_id}).sort("created_at", -1).limit(limit)
             
             for analysis_data in cursor:
+                analysis_data["analysis"] = DecompressingDict(analysis_data.get("analysis") or {}, self.compressor)
                 analyses.append(FinancialAnalysis(analysis_data))
                 
             return analyses
@@ -179,6 +406,50 @@ class MongoDBService:
             logger.error(f"Error getting user financial analyses: {str(e)}")
             return []
     
+    def get_user_analysis_page(self, user_id, limit=20, cursor=None):
+        """
+        Get one page of lightweight summaries of a user's financial analyses
+        
+        Pages are keyset-paginated over (created_at, _id), newest first: each
+        page starts right after the last row of the previous one, so every
+        page costs the same index range scan however deep the user scrolls.
+        Only the id, query and creation time are read from MongoDB.
+        
+        Args:
+            user_id (str): User ID
+            limit (int): Maximum number of summaries on the page
+            cursor (str): Opaque cursor returned with the previous page, or None for the first page
+            
+        Returns:
+            tuple: (list of FinancialAnalysisSummary objects, cursor for the next page or None)
+            
+        Raises:
+            ValueError: If the cursor is malformed
+        """
+        query_filter = {"user_id": user_id}
+        if cursor:
+            created_at, last_id = decode_page_cursor(cursor)
+            query_filter["$or"] = [
+                {"created_at": {"$lt": created_at}},
+                {"created_at": created_at, "_id": {"$lt": last_id}}
+            ]
+
+        try:
+            # One extra row tells us whether there is a next page
+            rows = list(self.db.financial_analyses.find(
+                query_filter,
+                FinancialAnalysisSummary.PROJECTION
+            ).sort([("created_at", DESCENDING), ("_id", DESCENDING)]).limit(limit + 1))
+        except Exception as e:
+            logger.error(f"Error getting user analysis summaries: {str(e)}")
+            return [], None
+
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = encode_page_cursor(rows[-1]["created_at"], rows[-1]["_id"])
+        return [FinancialAnalysisSummary(analysis_data) for analysis_data in rows], next_cursor
+    
     def delete_financial_analysis(self, analysis_id, user_id):
         """
         Delete a financial analysis by ID
@@ -203,3 +474,453 @@ class MongoDBService:
         except Exception as e:
             logger.error(f"Error deleting financial analysis: {str(e)}")
             return False
+
+    # Compression operations
+    def get_compression_dictionary(self, dictionary_id):
+        """
+        Get a compression dictionary's content by ID
+        
+        Args:
+            dictionary_id (int): Dictionary ID recorded in compressed values
+            
+        Returns:
+            bytes: Dictionary content or None if not found
+        """
+        document = self.db.compression_dictionaries.find_one({"_id": dictionary_id})
+        return bytes(document["data"]) if document else None
+    
+    def get_latest_compression_dictionary(self, codec):
+        """
+        Get the newest compression dictionary for a codec
+        
+        Args:
+            codec (str): 'zlib' or 'zstd'
+            
+        Returns:
+            tuple: (dictionary ID, content) or None if none has been trained
+        """
+        document = self.db.compression_dictionaries.find_one({"codec": codec}, sort=[("created_at", DESCENDING)])
+        return (document["_id"], bytes(document["data"])) if document else None
+    
+    def train_compression_dictionary(self, sample_size=500):
+        """
+        Train a compression dictionary on a sample of stored analyses and articles
+        
+        The dictionary is saved and used for every value compressed from
+        then on; values compressed earlier keep their own dictionary.
+        
+        Args:
+            sample_size (int): Number of analyses and of articles to sample
+            
+        Returns:
+            tuple: (dictionary ID, dictionary size in bytes, number of samples)
+        """
+        samples = []
+        for document in self.db.financial_analyses.aggregate([
+            {"$sample": {"size": sample_size}}, {"$project": {"text": "$analysis.analysis"}}
+        ]):
+            samples.append(self.compressor.decompress(document.get("text")))
+        for document in self.db.articles.aggregate([
+            {"$sample": {"size": sample_size}}, {"$project": {"text": "$content"}}
+        ]):
+            samples.append(self.compressor.decompress(document.get("text")))
+
+        dictionary_id, codec, data = self.compressor.train(samples)
+        self.db.compression_dictionaries.replace_one(
+            {"_id": dictionary_id},
+            {"_id": dictionary_id, "codec": codec, "data": bson.Binary(data), "created_at": datetime.now()},
+            upsert=True
+        )
+        self.compressor.use_dictionary(dictionary_id, data)
+        logger.info(f"Trained {codec} compression dictionary {dictionary_id} ({len(data)} bytes) on {len(samples)} samples")
+        return dictionary_id, len(data), len(samples)
+    
+    def dedupe_stored_contexts(self, batch_size=500, progress=None):
+        """
+        Move articles and stock data embedded in older analyses into the content store
+        
+        Each analysis saved before contexts were deduplicated gets 'article_refs'
+        and 'stock_refs' in place of its embedded 'articles' and 'stock_data',
+        exactly as save_financial_analysis would have stored it. Safe to re-run
+        and to interrupt: only analyses that still embed content are read, and
+        each is rewritten only if it has not been converted meanwhile.
+        
+        Args:
+            batch_size (int): Analyses converted per bulk write
+            progress (callable): Optional progress(converted) callback, called after each batch
+            
+        Returns:
+            int: Number of analyses converted
+        """
+        converted = 0
+        embedded = {"$or": [{"context.articles": {"$exists": True}}, {"context.stock_data": {"$exists": True}}]}
+        cursor = self.db.financial_analyses.find(embedded, {"context": 1}, batch_size=batch_size)
+        batch = []
+        for document in cursor:
+            batch.append(document)
+            if len(batch) >= batch_size:
+                converted += self._dedupe_contexts(batch)
+                batch = []
+                if progress:
+                    progress(converted)
+        if batch:
+            converted += self._dedupe_contexts(batch)
+            if progress:
+                progress(converted)
+        return converted
+    
+    def _dedupe_contexts(self, analyses):
+        """Store the content of a batch of analyses once each and point their contexts at it."""
+        articles, snapshots, operations = {}, {}, []
+        for analysis in analyses:
+            try:
+                stored_context, document_articles, document_snapshots = split_context(analysis.get("context") or {})
+            except (AttributeError, TypeError, ValueError) as e:
+                logger.warning(f"Skipping analysis {analysis['_id']} with a malformed context: {str(e)}")
+                continue
+            articles.update((article["_id"], article) for article in document_articles)
+            snapshots.update((snapshot["_id"], snapshot) for snapshot in document_snapshots)
+            operations.append(UpdateOne(
+                {"_id": analysis["_id"], "context.article_refs": {"$exists": False}},
+                {"$set": {"context": stored_context}}
+            ))
+        # Content first, so no analysis ever points at a document that is not stored yet
+        self._store_content(
+            self.db.articles, [self.compressor.compress_fields(article, "content") for article in articles.values()]
+        )
+        self._store_content(self.db.stock_snapshots, list(snapshots.values()))
+        if not operations:
+            return 0
+        return self.db.financial_analyses.bulk_write(operations, ordered=False).modified_count
+    
+    def compress_stored_fields(self, batch_size=500, progress=None):
+        """
+        Compress analysis HTML and article bodies that are still stored as text
+        
+        Article bodies embedded in older analyses' contexts are first moved
+        into the content store (see dedupe_stored_contexts), which stores them
+        compressed; then the remaining text fields are compressed in place.
+        Safe to re-run: only embedded contexts and string values are rewritten.
+        
+        Args:
+            batch_size (int): Documents updated per bulk write
+            progress (callable): Optional progress(collection, updated) callback
+            
+        Returns:
+            dict: Number of documents compressed per collection, plus the number of
+            analyses whose embedded articles were moved ('embedded_contexts')
+        """
+        updated = {
+            "embedded_contexts": self.dedupe_stored_contexts(
+                batch_size, progress=lambda count: progress("embedded_contexts", count) if progress else None
+            )
+        }
+        for collection, field in (("financial_analyses", "analysis.analysis"), ("articles", "content")):
+            updated[collection] = 0
+            operations = []
+            cursor = self.db[collection].find({field: {"$type": "string"}}, {field: 1}, batch_size=batch_size)
+            for document in cursor:
+                value = document
+                for part in field.split("."):
+                    value = value.get(part) if isinstance(value, dict) else None
+                compressed = self.compressor.compress(value)
+                if not is_compressed(compressed):
+                    continue
+                operations.append(UpdateOne({"_id": document["_id"], field: value}, {"$set": {field: compressed}}))
+                if len(operations) >= batch_size:
+                    updated[collection] += self.db[collection].bulk_write(operations, ordered=False).modified_count
+                    operations = []
+                    if progress:
+                        progress(collection, updated[collection])
+            if operations:
+                updated[collection] += self.db[collection].bulk_write(operations, ordered=False).modified_count
+                if progress:
+                    progress(collection, updated[collection])
+        return updated
+    
+    # Bulk export and import
+    def export_batches(self, collection, batch_size=1000):
+        """
+        Read a whole collection in batches of portable documents
+        
+        Analyses come out self-contained: compressed fields are decompressed
+        and referenced articles and stock snapshots are inlined, so they can
+        be imported into a database with other dictionaries and content.
+        
+        Args:
+            collection (str): 'users' or 'financial_analyses'
+            batch_size (int): Documents per batch (and per cursor round-trip)
+            
+        Yields:
+            list: The next batch of documents, in _id order
+        """
+        if collection not in TRANSFER_COLLECTIONS:
+            raise ValueError(f"Cannot export collection '{collection}'")
+        
+        batch = []
+        for document in self.db[collection].find({}, batch_size=batch_size).sort("_id", ASCENDING):
+            batch.append(document)
+            if len(batch) >= batch_size:
+                yield self._portable_analyses(batch) if collection == "financial_analyses" else batch
+                batch = []
+        if batch:
+            yield self._portable_analyses(batch) if collection == "financial_analyses" else batch
+    
+    def _portable_analyses(self, analyses):
+        """Inline and decompress the content of a batch of analyses, with one query per content collection."""
+        contexts = [analysis.get("context") or {} for analysis in analyses]
+        article_refs = {ref for context in contexts for ref in context.get("article_refs", [])}
+        snapshot_refs = {ref["ref"] for context in contexts for ref in context.get("stock_refs", [])}
+        articles = {
+            document.pop("_id"): document
+            for document in self.db.articles.find({"_id": {"$in": list(article_refs)}}, {"created_at": 0})
+        } if article_refs else {}
+        snapshots = {
+            document.pop("_id"): document
+            for document in self.db.stock_snapshots.find({"_id": {"$in": list(snapshot_refs)}}, {"created_at": 0})
+        } if snapshot_refs else {}
+        
+        portable = []
+        for analysis, context in zip(analyses, contexts):
+            context = dict(context)
+            if "article_refs" in context:
+                context["articles"] = [
+                    {**articles[ref], "content": self.compressor.decompress(articles[ref].get("content"))}
+                    for ref in context.pop("article_refs") if ref in articles
+                ]
+            if "stock_refs" in context:
+                context["stock_data"] = {
+                    ref["symbol"]: snapshots[ref["ref"]] for ref in context.pop("stock_refs") if ref["ref"] in snapshots
+                }
+            result = analysis.get("analysis")
+            if isinstance(result, dict) and "analysis" in result:
+                result = {**result, "analysis": self.compressor.decompress(result["analysis"])}
+            portable.append({**analysis, "context": context, "analysis": result})
+        return portable
+    
+    def import_documents(self, collection, documents):
+        """
+        Insert a batch of documents in the form export_batches() produces
+        
+        Analyses are stored the way save_financial_analysis stores them.
+        Documents whose _id already exists are skipped, so an interrupted
+        import can simply be run again.
+        
+        Args:
+            collection (str): 'users' or 'financial_analyses'
+            documents (list): Documents to insert
+            
+        Returns:
+            tuple: (inserted, skipped) document counts
+        """
+        if collection not in TRANSFER_COLLECTIONS:
+            raise ValueError(f"Cannot import collection '{collection}'")
+        if not documents:
+            return 0, 0
+        
+        if collection == "financial_analyses":
+            stored, articles, snapshots = [], {}, {}
+            for document in documents:
+                context = document.get("context") or {}
+                if "articles" in context or "stock_data" in context:
+                    context, document_articles, document_snapshots = split_context(context)
+                    articles.update((article["_id"], article) for article in document_articles)
+                    snapshots.update((snapshot["_id"], snapshot) for snapshot in document_snapshots)
+                result = document.get("analysis")
+                if isinstance(result, dict):
+                    result = self.compressor.compress_fields(result, "analysis")
+                stored.append({**document, "context": context, "analysis": result})
+            self._store_content(
+                self.db.articles, [self.compressor.compress_fields(article, "content") for article in articles.values()]
+            )
+            self._store_content(self.db.stock_snapshots, list(snapshots.values()))
+            documents = stored
+        
+        try:
+            inserted = len(self.db[collection].insert_many(documents, ordered=False).inserted_ids)
+        except BulkWriteError as e:
+            if any(error.get("code") != 11000 for error in e.details.get("writeErrors", [])):
+                raise
+            inserted = e.details.get("nInserted", 0)
+        return inserted, len(documents) - inserted
+    
+    # Analysis job operations
+    def save_analysis_job(self, job_data):
+        """
+        Insert or replace an analysis job's status document
+        
+        Args:
+            job_data (dict): Job document from AnalysisJob.to_dict()
+            
+        Returns:
+            bool: True if saved successfully, False otherwise
+        """
+        try:
+            self.db.analysis_jobs.replace_one({"_id": job_data["_id"]}, job_data, upsert=True)
+            return True
+        except Exception as e:
+            logger.error(f"Error saving analysis job: {str(e)}")
+            return False
+    
+    def touch_analysis_jobs(self, owner, heartbeat_at):
+        """
+        Record that a queue process is alive on all of its unfinished jobs
+        
+        Args:
+            owner (str): Owner id of the queue process
+            heartbeat_at (datetime): Time of the heartbeat
+            
+        Returns:
+            int: Number of jobs updated
+        """
+        try:
+            result = self.db.analysis_jobs.update_many(
+                {"owner": owner, "status": {"$in": [AnalysisJob.QUEUED, AnalysisJob.RUNNING]}},
+                {"$set": {"heartbeat_at": heartbeat_at}}
+            )
+            return result.modified_count
+        except Exception as e:
+            logger.error(f"Error recording analysis job heartbeat: {str(e)}")
+            return 0
+    
+    def fail_stale_analysis_job(self, job_id, heartbeat_before, error):
+        """
+        Mark an unfinished job FAILED if its owner has not sent a heartbeat since a cutoff
+        
+        The heartbeat is part of the filter, so a job whose owner is still
+        alive is left alone even if a check races with its heartbeat.
+        
+        Args:
+            job_id (str): ID of the job
+            heartbeat_before (datetime): Heartbeats older than this mean the owner is gone
+            error (str): Message shown to the user
+            
+        Returns:
+            AnalysisJob: The updated job, or None if it was not stale
+        """
+        try:
+            job_data = self.db.analysis_jobs.find_one_and_update(
+                {
+                    "_id": job_id,
+                    "status": {"$in": [AnalysisJob.QUEUED, AnalysisJob.RUNNING]},
+                    "$or": [{"heartbeat_at": {"$lt": heartbeat_before}}, {"heartbeat_at": None}]
+                },
+                {"$set": {"status": AnalysisJob.FAILED, "error": error, "finished_at": datetime.now()}},
+                return_document=ReturnDocument.AFTER
+            )
+            return AnalysisJob(job_data) if job_data else None
+        except Exception as e:
+            logger.error(f"Error failing stale analysis job: {str(e)}")
+            return None
+    
+    def get_analysis_job(self, job_id):
+        """
+        Get an analysis job by ID
+        
+        Args:
+            job_id (str): ID of the job
+            
+        Returns:
+            AnalysisJob: Job object or None if not found
+        """
+        try:
+            job_data = self.db.analysis_jobs.find_one({"_id": job_id})
+            if job_data:
+                return AnalysisJob(job_data)
+            return None
+        except Exception as e:
+            logger.error(f"Error getting analysis job: {str(e)}")
+            return None
+
+
+def content_hash(document):
+    """SHA-256 of a document's canonical JSON form, used as its _id."""
+    raw = json.dumps(document, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def split_context(context):
+    """
+    Move a context's articles and stock snapshots into content-addressed documents.
+
+    Args:
+        context (dict): Financial context as built by the context service
+
+    Returns:
+        tuple: (context to embed, with 'article_refs' and 'stock_refs' in place of
+        'articles' and 'stock_data'; article documents; stock snapshot documents)
+    """
+    stored_context = {key: value for key, value in context.items() if key not in ("articles", "stock_data")}
+
+    articles = [{"_id": content_hash(article), **article} for article in context.get("articles") or []]
+    stored_context["article_refs"] = [article["_id"] for article in articles]
+
+    # A list rather than a dict keyed by symbol: symbols like 'RELIANCE.BO' contain dots
+    snapshots = []
+    stored_context["stock_refs"] = []
+    for symbol, data in (context.get("stock_data") or {}).items():
+        snapshot = {"_id": content_hash(data), **data}
+        snapshots.append(snapshot)
+        stored_context["stock_refs"].append({"symbol": symbol, "ref": snapshot["_id"]})
+
+    return stored_context, articles, snapshots
+
+
+def content_upserts(documents):
+    """Bulk operations that insert each document only if its hash is not stored yet."""
+    now = datetime.now()
+    return [
+        UpdateOne(
+            {"_id": document["_id"]},
+            {"$setOnInsert": {**{key: value for key, value in document.items() if key != "_id"}, "created_at": now}},
+            upsert=True
+        )
+        for document in documents
+    ]
+
+
+def encode_page_cursor(created_at, last_id):
+    """
+    Encode the position after a history row as an opaque URL-safe cursor.
+
+    Args:
+        created_at (datetime): created_at of the last row on the page
+        last_id (ObjectId): _id of the last row on the page
+
+    Returns:
+        str: The cursor
+    """
+    raw = f"{created_at.isoformat()}|{last_id}"
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_page_cursor(cursor):
+    """
+    Decode a cursor made by encode_page_cursor.
+
+    Returns:
+        tuple: (created_at, last_id)
+
+    Raises:
+        ValueError: If the cursor is malformed
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        created_at, _, last_id = base64.urlsafe_b64decode(padded.encode("ascii")).decode("utf-8").partition("|")
+        return datetime.fromisoformat(created_at), bson.ObjectId(last_id)
+    except (ValueError, TypeError, UnicodeError, bson.errors.InvalidId) as e:
+        raise ValueError(f"Invalid page cursor: {cursor}") from e
+
+
+def _plan_stages(plan):
+    """Collect every stage name in an explain plan tree (classic or slot-based engine)."""
+    stages = set()
+    if isinstance(plan, dict):
+        if "stage" in plan:
+            stages.add(plan["stage"])
+        for value in plan.values():
+            stages |= _plan_stages(value)
+    elif isinstance(plan, list):
+        for item in plan:
+            stages |= _plan_stages(item)
+    return stages
@@ -0,0 +1,293 @@
+import logging
+import math
+import re
+from string import Template
+from services.text import normalize_query, WORD_PATTERN
+
+try:
+    import tiktoken
+except ImportError:  # Optional; a conservative estimate is used without it
+    tiktoken = None
+
+logger = logging.getLogger(__name__)
+
+SYSTEM_PROMPT = (
+    "You are a professional financial analyst providing accurate, helpful financial advice "
+    "based on the latest market data and news."
+)
+
+PROMPT_TEMPLATE = Template("""You are a seasoned Indian financial advisor with extensive expertise in analyzing financial markets, regulatory trends, and economic data specific to India. Your role is to deliver actionable, data-driven advice tailored to Indian investors, considering local market conditions, tax implications, and guidelines from Indian regulatory bodies (such as SEBI and RBI).
+
+USER QUERY: $query
+
+LATEST FINANCIAL NEWS SUMMARY:
+$news_summary
+
+RELEVANT FINANCIAL ARTICLES:
+$articles
+$stocks$principles
+$instructions""")
+
+INSTRUCTIONS = """
+Based on the above information, please provide a response that includes:
+
+<h3>1. Comprehensive Analysis</h3>
+<p>
+   Deliver a detailed examination of the user’s query, incorporating current market data, economic trends, and insights drawn from the latest news and articles. Your analysis should be specifically tailored for Indian investors and reflect the nuances of the Indian financial landscape.
+</p>
+
+<h3>2. Key Insights and Implications</h3>
+<p>
+   Identify and explain the major insights from your analysis. Discuss how the information impacts the Indian economy and financial markets, including factors such as market volatility, liquidity, and regulatory changes.
+</p>
+
+<h3>3. Risks and Opportunities</h3>
+<p>
+   Outline potential risks and opportunities in the current market context. Consider aspects like market sentiment, regulatory shifts, tax changes, and global economic influences as they relate to India.
+</p>
+
+<h3>4. Concrete Recommendations</h3>
+<p>
+   Offer actionable recommendations for Indian investors. Your advice should address both short-term strategies and long-term planning, including specific investment strategies, portfolio diversification tips, and risk management techniques.
+</p>
+
+<h3>5. Supporting References</h3>
+<p>
+   Clearly reference specific news items, data points, or financial articles from the provided summaries that have shaped your analysis.
+</p>
+
+<p>
+   <strong>Additional Considerations:</strong>
+   In your analysis, factor in the latest developments in monetary and fiscal policy, historical market trends, and any relevant tax implications. Ensure that the response is professional, well-structured, and formatted using proper HTML tags (e.g., <code><h3></code>, <code><p></code>, <code><ul></code>, <code><li></code>, <code><strong></code>).
+</p>
+"""
+
+ARTICLE_TEMPLATE = Template("\nArticle $number:\nTitle: $title\nContent: $content\n")
+
+STOCK_TEMPLATE = Template("\nSTOCK INFORMATION:\nSymbol: $symbol\n$fields")
+
+PRINCIPLES_HEADER = "\nINVESTING PRINCIPLES FROM OUR KNOWLEDGE BASE:\n"
+
+PRINCIPLE_TEMPLATE = Template("- $title ($heading): $text\n")
+
+# Stock fields in prompt order; missing ('N/A') values are left out
+STOCK_FIELDS = [
+    ("name", "Company"),
+    ("price", "Current Price"),
+    ("change", "Change"),
+    ("change_percent", "Change %"),
+    ("sector", "Sector"),
+    ("industry", "Industry"),
+    ("market_cap", "Market Cap"),
+    ("pe_ratio", "P/E Ratio"),
+    ("dividend_yield", "Dividend Yield"),
+    ("exchange", "Exchange"),
+]
+
+# Tokens by the estimate: letter runs of up to 4, digit runs of up to 3, each other character
+ESTIMATE_PATTERN = re.compile(r"[A-Za-z]{1,4}|[0-9]{1,3}|[^\sA-Za-z0-9]")
+
+class TokenCounter:
+    """
+    Counts prompt tokens locally.
+
+    Uses tiktoken when it is installed. Otherwise the count is an estimate
+    that errs high for English text (each non-ASCII character counts as its
+    UTF-8 bytes), so a prompt within budget by the estimate is within budget
+    for the model's own tokenizer too.
+    """
+
+    def __init__(self, encoding="cl100k_base"):
+        self._encoding = None
+        if tiktoken is not None:
+            try:
+                self._encoding = tiktoken.get_encoding(encoding)
+            except Exception as e:
+                logger.warning(f"Could not load the {encoding} tokenizer, estimating tokens: {str(e)}")
+
+    def count(self, text):
+        """Number of tokens in text."""
+        if not text:
+            return 0
+        if self._encoding is not None:
+            return len(self._encoding.encode(text, disallowed_special=()))
+        return sum(
+            1 if len(piece) > 1 or piece.isascii() else len(piece.encode("utf-8"))
+            for piece in ESTIMATE_PATTERN.findall(text)
+        )
+
+    def truncate(self, text, max_tokens, suffix="..."):
+        """
+        Cut text at a word boundary so that it (with suffix) fits in max_tokens.
+
+        Returns:
+            str: text unchanged if it fits, else the longest fitting prefix plus suffix ('' if none fits)
+        """
+        if self.count(text) <= max_tokens:
+            return text
+        words = text.split(" ")
+        low, high = 0, len(words)
+        while low < high:
+            middle = (low + high + 1) // 2
+            if self.count(" ".join(words[:middle]) + suffix) <= max_tokens:
+                low = middle
+            else:
+                high = middle - 1
+        return " ".join(words[:low]) + suffix if low else ""
+
+
+class PromptBuilder:
+    """
+    Renders the analysis prompt within a fixed token budget.
+
+    The instruction block, query and news summary always go in (the query
+    and summary are cut if they alone would overflow). Stock blocks come
+    next, since they are short and exact, then any knowledge base passages
+    retrieved for the query, then articles in order of how
+    well they match the query, each cut to at most `max_article_tokens`
+    and all of them to what is left of the budget. The finished prompt
+    plus the system message never counts more than `budget` tokens.
+    """
+
+    def __init__(self, budget=3000, max_article_tokens=400, min_article_tokens=60, counter=None):
+        """
+        Args:
+            budget (int): Largest number of prompt tokens (system and user message together)
+            max_article_tokens (int): Most tokens one article may take
+            min_article_tokens (int): Articles that would get fewer tokens are left out
+            counter (TokenCounter): Token counter (default: a new one)
+        """
+        self.budget = budget
+        self.max_article_tokens = max_article_tokens
+        self.min_article_tokens = min_article_tokens
+        self.counter = counter or TokenCounter()
+        self.system_tokens = self.counter.count(SYSTEM_PROMPT)
+        self.instruction_tokens = self.counter.count(INSTRUCTIONS)
+        fixed_tokens = self.system_tokens + self.counter.count(self._render("", "", "", "", "", INSTRUCTIONS))
+        if fixed_tokens >= budget:
+            raise ValueError(f"A prompt budget of {budget} tokens leaves no room beyond the {fixed_tokens} fixed tokens")
+
+    def build(self, financial_query, context, passages=None):
+        """
+        Render the user prompt for a query and its context.
+
+        Args:
+            financial_query (str): The user's financial query
+            context (dict): Context information including news articles and stock data
+            passages (list): Knowledge base passages retrieved for the query, best first
+
+        Returns:
+            str: The prompt, within budget once SYSTEM_PROMPT is added
+        """
+        available = self.budget - self.system_tokens
+        # The template's fixed text and joins, counted once with every slot empty
+        available -= self.counter.count(self._render("", "", "", "", "", ""))
+        available -= self.instruction_tokens
+
+        query = self.counter.truncate(financial_query or "", max(available // 4, 0))
+        available -= self.counter.count(query)
+        news_summary = self.counter.truncate(
+            context.get("news_summary") or "No news summary available", max(available // 3, 0)
+        )
+        available -= self.counter.count(news_summary)
+
+        stocks = []
+        for block in self._stock_blocks(financial_query, context.get("stock_data") or {}):
+            tokens = self.counter.count(block)
+            if tokens <= available:
+                stocks.append(block)
+                available -= tokens
+
+        principles = []
+        for passage in passages or []:
+            block = PRINCIPLE_TEMPLATE.substitute(
+                title=passage.get("title", ""), heading=passage.get("heading", ""),
+                text=self.counter.truncate(passage.get("text") or "", self.max_article_tokens)
+            )
+            tokens = self.counter.count(block if principles else PRINCIPLES_HEADER + block)
+            if tokens <= available:
+                principles.append(block)
+                available -= tokens
+
+        articles = []
+        for article in self._ranked_articles(financial_query, context.get("articles") or []):
+            header = ARTICLE_TEMPLATE.substitute(number=len(articles) + 1, title=article.get("title") or "Untitled",
+                                                 content="")
+            room = min(available - self.counter.count(header), self.max_article_tokens)
+            if room < self.min_article_tokens:
+                continue
+            content = self.counter.truncate((article.get("content") or "").strip(), room)
+            if not content:
+                continue
+            block = ARTICLE_TEMPLATE.substitute(number=len(articles) + 1, title=article.get("title") or "Untitled",
+                                                content=content)
+            tokens = self.counter.count(block)
+            if tokens <= available:
+                articles.append(block)
+                available -= tokens
+
+        prompt = self._render(query, news_summary, articles, stocks, principles, INSTRUCTIONS)
+        # Tokens can merge across the joins, so the whole may count a little more than its parts
+        while self.prompt_tokens(prompt) > self.budget:
+            if articles:
+                articles.pop()
+            elif principles:
+                principles.pop()
+            elif stocks:
+                stocks.pop()
+            elif news_summary:
+                news_summary = self.counter.truncate(news_summary, self.counter.count(news_summary) // 2)
+            else:
+                query = self.counter.truncate(query, self.counter.count(query) // 2)
+            prompt = self._render(query, news_summary, articles, stocks, principles, INSTRUCTIONS)
+        return prompt
+
+    def prompt_tokens(self, prompt):
+        """Tokens a built prompt uses, system message included."""
+        return self.system_tokens + self.counter.count(prompt)
+
+    @staticmethod
+    def _render(query, news_summary, articles, stocks, principles, instructions):
+        return PROMPT_TEMPLATE.substitute(
+            query=query,
+            news_summary=news_summary,
+            articles="".join(articles),
+            stocks="".join(stocks),
+            principles=PRINCIPLES_HEADER + "".join(principles) if principles else "",
+            instructions=instructions
+        )
+
+    @staticmethod
+    def _ranked_articles(financial_query, articles):
+        """Articles with content, best match for the query first (ties keep search order)."""
+        query_words = set(normalize_query(financial_query))
+
+        def score(article):
+            title_words = set(WORD_PATTERN.findall((article.get("title") or "").lower()))
+            content_words = WORD_PATTERN.findall((article.get("content") or "").lower())
+            content_hits = sum(1 for word in content_words if word in query_words)
+            return 2 * len(query_words & title_words) + math.log1p(content_hits)
+
+        usable = [article for article in articles if isinstance(article, dict) and article.get("content")]
+        return sorted(usable, key=score, reverse=True)
+
+    @staticmethod
+    def _stock_blocks(financial_query, stock_data):
+        """Rendered stock blocks, symbols named in the query first."""
+        query = (financial_query or "").upper()
+
+        def named(item):
+            symbol, data = item
+            name = str(data.get("name") or "").upper() if isinstance(data, dict) else ""
+            return symbol.split(".")[0].upper() in query or bool(name and name in query)
+
+        blocks = []
+        for symbol, data in sorted(stock_data.items(), key=named, reverse=True):
+            if not isinstance(data, dict) or data.get("error"):
+                continue
+            fields = "".join(
+                f"{label}: {data[key]}\n" for key, label in STOCK_FIELDS
+                if data.get(key) not in (None, "", "N/A")
+            )
+            blocks.append(STOCK_TEMPLATE.substitute(symbol=symbol, fields=fields))
+        return blocks
@@ -0,0 +1,241 @@
+import logging
+import random
+import threading
+import time
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+class Deadline:
+    """
+    A time budget handed down from the caller.
+
+    Retries and timeouts are sized from what is left of the budget so a
+    call never outlives the request that made it.
+    """
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self.expires_at = time.monotonic() + seconds
+
+    def remaining(self):
+        """Seconds left before the deadline (never negative)."""
+        return max(self.expires_at - time.monotonic(), 0.0)
+
+    def expired(self):
+        """Return True once the budget is used up."""
+        return self.remaining() <= 0
+
+
+def backoff_delay(attempt, base=0.5, cap=4.0):
+    """
+    Full-jitter exponential backoff.
+
+    Args:
+        attempt (int): Retry number, starting at 1
+        base (float): Delay scale in seconds
+        cap (float): Largest possible delay in seconds
+
+    Returns:
+        float: Seconds to wait, uniformly drawn from [0, min(cap, base * 2 ** attempt)]
+    """
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+class RetryGuard:
+    """
+    Per-attempt decisions for a retried call to an upstream behind a circuit breaker.
+
+    Shared by the sync and async clients so both gate, time and record
+    attempts the same way; only the call itself and the wait differ.
+    An attempt starts only with time left on the deadline and the
+    breaker's permission, and every started attempt records its outcome,
+    so a half-open probe is always given back.
+
+    Usage:
+        guard = RetryGuard(breaker, deadline, max_retries)
+        while (remaining := guard.begin()) is not None:
+            ...call upstream with timeouts cut to `remaining`...
+            on success: guard.succeeded() and return
+            on failure: guard.failed(error)
+            delay = guard.backoff()
+            if delay is None: break
+            ...sleep for delay...
+        then guard.error says why no attempt succeeded
+    """
+
+    CIRCUIT_OPEN = "Circuit open"
+    DEADLINE_EXCEEDED = "Deadline exceeded"
+
+    def __init__(self, circuit_breaker, deadline, max_retries, backoff_base=0.5, backoff_cap=4.0,
+                 max_total_backoff=None):
+        self.circuit_breaker = circuit_breaker
+        self.deadline = deadline
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        # Most seconds all backoffs together may take (None: only the deadline bounds them)
+        self.max_total_backoff = max_total_backoff
+        self.backed_off = 0.0
+        self.attempt = 0
+        self.error = "Retries exhausted"
+
+    def begin(self):
+        """
+        Start the next attempt.
+
+        Returns:
+            float: Seconds left on the deadline for it, or None if no attempt
+            may start (see `error`)
+        """
+        if self.attempt >= self.max_retries:
+            return None
+        # Checked before the breaker: in half-open state allow_request() takes the
+        # single probe slot, which only a recorded outcome gives back
+        remaining = self.deadline.remaining()
+        if remaining <= 0:
+            self.error = self.DEADLINE_EXCEEDED
+            return None
+        if not self.circuit_breaker.allow_request():
+            self.error = self.CIRCUIT_OPEN
+            return None
+        self.attempt += 1
+        return remaining
+
+    def succeeded(self):
+        """Record that the current attempt succeeded."""
+        self.circuit_breaker.record_success()
+
+    def failed(self, error):
+        """Record that the current attempt failed with `error`."""
+        self.error = error
+        self.circuit_breaker.record_failure()
+
+    def backoff(self):
+        """
+        Seconds to wait before the next attempt.
+
+        Returns:
+            float: Jittered backoff delay, or None if there is no next attempt,
+            it could not finish before the deadline or the total backoff is used up
+        """
+        if self.attempt >= self.max_retries:
+            return None
+        delay = backoff_delay(self.attempt, self.backoff_base, self.backoff_cap)
+        if self.max_total_backoff is not None:
+            if self.backed_off >= self.max_total_backoff:
+                logger.warning(f"Not retrying {self.circuit_breaker.name}: total backoff budget exhausted")
+                return None
+            delay = min(delay, self.max_total_backoff - self.backed_off)
+        if delay >= self.deadline.remaining():
+            logger.warning(f"Not retrying {self.circuit_breaker.name}: deadline budget exhausted")
+            return None
+        self.backed_off += delay
+        return delay
+
+
+class CircuitBreaker:
+    """
+    Failure-rate circuit breaker shared by every request to one upstream.
+
+    Closed: calls flow and their outcomes are recorded over a sliding window.
+    Once at least `min_calls` outcomes are in the window and the failure rate
+    reaches `failure_rate_threshold`, the breaker opens and calls fail fast.
+    After `cooldown_seconds` a single probe call is let through (half-open);
+    its success closes the breaker and its failure opens it again.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name, failure_rate_threshold=0.5, min_calls=5, window_seconds=60, cooldown_seconds=30):
+        self.name = name
+        self.failure_rate_threshold = failure_rate_threshold
+        self.min_calls = min_calls
+        self.window_seconds = window_seconds
+        self.cooldown_seconds = cooldown_seconds
+
+        self.state = self.CLOSED
+        self._outcomes = deque()
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._rejected = 0
+        self._lock = threading.Lock()
+
+    def allow_request(self):
+        """
+        Check whether a call may go upstream now.
+
+        Returns:
+            bool: False while the breaker is open (the caller should fail fast)
+        """
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+
+            if self.state == self.OPEN and time.monotonic() - self._opened_at >= self.cooldown_seconds:
+                self.state = self.HALF_OPEN
+                self._probe_in_flight = False
+                logger.info(f"Circuit breaker {self.name} half-open, probing upstream")
+
+            if self.state == self.HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return True
+
+            self._rejected += 1
+            return False
+
+    def record_success(self):
+        """Record a successful upstream call."""
+        with self._lock:
+            if self.state == self.HALF_OPEN:
+                logger.info(f"Circuit breaker {self.name} closed")
+                self.state = self.CLOSED
+                self._outcomes.clear()
+            self._record(True)
+
+    def record_failure(self):
+        """Record a failed upstream call, opening the breaker if the failure rate is too high."""
+        with self._lock:
+            if self.state == self.HALF_OPEN:
+                self._open()
+                return
+            self._record(False)
+
+            failures = sum(1 for _, ok in self._outcomes if not ok)
+            if (self.state == self.CLOSED and len(self._outcomes) >= self.min_calls
+                    and failures / len(self._outcomes) >= self.failure_rate_threshold):
+                self._open()
+
+    def stats(self):
+        """
+        Get the breaker state and window counters.
+
+        Returns:
+            dict: state, calls and failures in the window, rejected call count
+        """
+        with self._lock:
+            self._trim(time.monotonic())
+            return {
+                "state": self.state,
+                "window_calls": len(self._outcomes),
+                "window_failures": sum(1 for _, ok in self._outcomes if not ok),
+                "rejected": self._rejected
+            }
+
+    def _record(self, ok):
+        now = time.monotonic()
+        self._outcomes.append((now, ok))
+        self._trim(now)
+
+    def _trim(self, now):
+        while self._outcomes and now - self._outcomes[0][0] > self.window_seconds:
+            self._outcomes.popleft()
+
+    def _open(self):
+        logger.warning(f"Circuit breaker {self.name} opened for {self.cooldown_seconds}s")
+        self.state = self.OPEN
+        self._opened_at = time.monotonic()
+        self._probe_in_flight = False
+        self._outcomes.clear()
@@ -0,0 +1,202 @@
+import hashlib
+import logging
+import threading
+import time
+
+import numpy as np
+from services.text import normalize_query
+
+logger = logging.getLogger(__name__)
+
+# Words that flip or set the action asked about; a near-duplicate must agree on them exactly
+INTENT_WORDS = frozenset({"not", "avoid", "buy", "sell", "hold", "exit", "short"})
+
+# Large prime for the MinHash permutations (2^61 - 1)
+MERSENNE_PRIME = (1 << 61) - 1
+
+class ResponseCache:
+    """
+    Caches finished analyses (context plus LLM result) for repeated questions.
+
+    Entries are keyed on the normalized query, the resolved symbols and a
+    time bucket, so the same question about the same stocks within one
+    bucket is answered without calling Tavily or Groq. Rephrasings that
+    normalize differently are found through a MinHash signature of the
+    query words and an LSH band index; a near match is only accepted
+    between queries of at least `min_near_tokens` words with the same
+    symbols in the same bucket, the same numbers ('Q2' and 'Q3' never
+    match) and the same negation and action words ('buy' never matches
+    'not buy' or 'sell').
+
+    The band index lives in this process. With a shared backend, exact hits
+    work across workers while near-duplicate hits are per worker.
+    """
+
+    def __init__(self, backend, ttl=900, bucket_seconds=900, similarity_threshold=0.8, min_near_tokens=4,
+                 num_perm=128, bands=32, max_index_keys=50000):
+        self.backend = backend
+        self.ttl = min(ttl, bucket_seconds)
+        self.bucket_seconds = bucket_seconds
+        self.similarity_threshold = similarity_threshold
+        self.min_near_tokens = min_near_tokens
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.max_index_keys = max_index_keys
+
+        rng = np.random.default_rng(seed=7919)
+        self._perm_a = rng.integers(1, MERSENNE_PRIME, size=num_perm, dtype=np.uint64)
+        self._perm_b = rng.integers(0, MERSENNE_PRIME, size=num_perm, dtype=np.uint64)
+
+        self._band_index = {}
+        self._band_bucket = None
+        self._lock = threading.Lock()
+
+        self.exact_hits = 0
+        self.near_hits = 0
+        self.misses = 0
+        logger.info(f"Response cache initialized (TTL {self.ttl}s, bucket {bucket_seconds}s)")
+
+    def lookup(self, financial_query, stock_symbols):
+        """
+        Find a cached analysis for a query.
+
+        Args:
+            financial_query (str): The financial query
+            stock_symbols (list): Symbols resolved for the query
+
+        Returns:
+            dict: {'context': ..., 'analysis': ...} or None on a miss
+        """
+        tokens = normalize_query(financial_query)
+        scope = self._scope(stock_symbols)
+        key = self._key(tokens, scope)
+
+        entry = self.backend.get(key)
+        if entry is not None:
+            with self._lock:
+                self.exact_hits += 1
+            logger.info(f"Response cache hit for query: {financial_query}")
+            return self._result(entry)
+
+        # Short queries are all but one or two words, so one differing word is too large a change
+        if len(tokens) >= self.min_near_tokens:
+            signature = self._signature(tokens)
+            for candidate_key in self._candidates(signature, scope):
+                entry = self.backend.get(candidate_key)
+                if entry is None:
+                    continue
+                # Numbers (quarters, years, amounts) change the question, so they must agree exactly
+                if entry["numbers"] != self._numbers(tokens):
+                    continue
+                if entry.get("intent") != self._intent(tokens):
+                    continue
+                similarity = float(np.mean(entry["signature"] == signature))
+                if similarity >= self.similarity_threshold:
+                    with self._lock:
+                        self.near_hits += 1
+                    logger.info(f"Response cache near-duplicate hit ({similarity:.2f}) for query: {financial_query}")
+                    return self._result(entry)
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def store(self, financial_query, stock_symbols, context, analysis_result):
+        """
+        Cache a finished analysis.
+
+        Args:
+            financial_query (str): The financial query
+            stock_symbols (list): Symbols resolved for the query
+            context (dict): Financial context the analysis was based on
+            analysis_result (dict): Result from GroqService
+        """
+        tokens = normalize_query(financial_query)
+        scope = self._scope(stock_symbols)
+        key = self._key(tokens, scope)
+        signature = self._signature(tokens) if len(tokens) >= self.min_near_tokens else None
+
+        self.backend.set(key, {
+            "context": context,
+            "analysis": analysis_result,
+            "signature": signature,
+            "numbers": self._numbers(tokens),
+            "intent": self._intent(tokens)
+        }, self.ttl)
+
+        if signature is not None:
+            with self._lock:
+                self._roll_bucket(scope[1])
+                if len(self._band_index) >= self.max_index_keys:
+                    # Entries behind old band keys may already be evicted; start over rather than grow
+                    self._band_index.clear()
+                for band_key in self._band_keys(signature, scope):
+                    self._band_index.setdefault(band_key, set()).add(key)
+
+    def stats(self):
+        """
+        Get hit-rate counters.
+
+        Returns:
+            dict: exact/near hits, misses, hit rate and backend stats
+        """
+        with self._lock:
+            lookups = self.exact_hits + self.near_hits + self.misses
+            return {
+                "exact_hits": self.exact_hits,
+                "near_hits": self.near_hits,
+                "misses": self.misses,
+                "hit_rate": round((self.exact_hits + self.near_hits) / lookups, 4) if lookups else 0.0,
+                "band_index_keys": len(self._band_index),
+                "backend": self.backend.stats()
+            }
+
+    def _scope(self, stock_symbols):
+        """Symbols and time bucket that a cached answer is valid for."""
+        symbols = ",".join(sorted({symbol.upper() for symbol in stock_symbols or []}))
+        return symbols, int(time.time() // self.bucket_seconds)
+
+    def _key(self, tokens, scope):
+        raw = f"{' '.join(tokens)}|{scope[0]}|{scope[1]}"
+        return "response:" + hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def _result(entry):
+        """The cached answer without the matching metadata."""
+        return {"context": entry["context"], "analysis": entry["analysis"]}
+
+    @staticmethod
+    def _intent(tokens):
+        return [token for token in tokens if token in INTENT_WORDS]
+
+    @staticmethod
+    def _numbers(tokens):
+        return [token for token in tokens if any(char.isdigit() for char in token)]
+
+    def _signature(self, tokens):
+        """MinHash signature of the query's token set."""
+        hashes = np.array(
+            [int.from_bytes(hashlib.blake2b(token.encode("utf-8"), digest_size=7).digest(), "big") for token in tokens],
+            dtype=np.uint64
+        )
+        # (a * x + b) mod p per permutation; uint64 products wrap, which keeps the family deterministic
+        values = (np.outer(self._perm_a, hashes) + self._perm_b[:, None]) % MERSENNE_PRIME
+        return values.min(axis=1)
+
+    def _band_keys(self, signature, scope):
+        for band in range(self.bands):
+            rows = signature[band * self.rows:(band + 1) * self.rows]
+            yield (scope, band, rows.tobytes())
+
+    def _candidates(self, signature, scope):
+        with self._lock:
+            candidates = set()
+            for band_key in self._band_keys(signature, scope):
+                candidates.update(self._band_index.get(band_key, ()))
+        return candidates
+
+    def _roll_bucket(self, bucket):
+        """Drop band entries from earlier time buckets; their cache entries can no longer match."""
+        if self._band_bucket != bucket:
+            self._band_index = {key: value for key, value in self._band_index.items() if key[0][1] >= bucket}
+            self._band_bucket = bucket
@@ -0,0 +1,248 @@
+import csv
+import logging
+import re
+from services.alias_index import AliasIndex
+
+logger = logging.getLogger(__name__)
+
+# Words, tickers and optional exchange suffix ("INFY", "M&M", "BAJAJ-AUTO", "TCS.NS")
+TOKEN_PATTERN = re.compile(r"[A-Za-z0-9][A-Za-z0-9&\-]*(?:\.[A-Za-z]{2,3}\b)?")
+
+# Exchange suffixes users type, mapped to the Yahoo Finance suffix
+EXCHANGE_SUFFIXES = {
+    "NS": ".NS",
+    "NSE": ".NS",
+    "BO": ".BO",
+    "BSE": ".BO",
+}
+
+# Listed symbols that are also everyday English words. Written in lowercase
+# they are treated as words rather than tickers.
+AMBIGUOUS_WORDS = frozenset({
+    "ACE", "ALL", "ANY", "AXIS", "BEL", "BEST", "CAN", "DATA", "EASY", "ETERNAL", "FACT", "FAIR",
+    "GOLD", "GOOD", "HOME", "IDEA", "JUST", "LIFE", "LT", "MAN", "MORE", "NEW", "NOW", "ONE",
+    "OPEN", "PLUS", "POWER", "RAIN", "RATE", "SAFE", "SUN", "TIME", "TRUST", "WELL", "YES",
+})
+
+# Trailing words dropped from registered company names to derive shorter aliases
+LEGAL_SUFFIXES = frozenset({"LIMITED", "LTD", "COMPANY", "CO", "CORPORATION", "CORP"})
+
+# Fuzzy matching only applies to capitalised phrases at least this long
+FUZZY_MIN_LENGTH = 6
+
+# Longest run of tokens tried as one fuzzy phrase ("Tata Consultancy Servces")
+FUZZY_MAX_TOKENS = 3
+
+_TERMINAL = object()
+
+class SymbolExtractor:
+    """
+    Finds stock symbols in a free-text query in a single pass.
+
+    Known symbols and company-name aliases are held in a token trie built
+    once at startup. The query is tokenized once and, at each position, the
+    trie is walked for the longest known entry, so the cost grows with the
+    length of the query and not with the size of the symbol universe. Only
+    whole tokens match, so 'TCS' is not found inside 'TCSXYZ' and unknown
+    words are never returned.
+
+    Capitalised phrases that match nothing exactly ('Infosis', 'Relaince
+    Industries') are looked up in an AliasIndex with a small edit-distance
+    budget.
+    """
+
+    def __init__(self, symbols=None):
+        self._root = {}
+        self.symbol_count = 0
+        self.alias_index = AliasIndex()
+        for symbol in symbols or []:
+            self.add(symbol, symbol)
+
+    @classmethod
+    def from_csv(cls, path, aliases_path=None):
+        """
+        Build an extractor from an NSE EQUITY_L style CSV file.
+
+        The file needs a SYMBOL column and may have a NAME OF COMPANY column,
+        from which name aliases are derived; the exchange's full equity list
+        can be dropped in as-is.
+
+        Args:
+            path (str): Path to the CSV file
+            aliases_path (str): Optional CSV of extra ALIAS,SYMBOL pairs
+
+        Returns:
+            SymbolExtractor: Extractor indexing every symbol in the file
+        """
+        extractor = cls()
+        for row in cls._read_csv(path):
+            if row.get("SYMBOL"):
+                extractor.add(row["SYMBOL"], row["SYMBOL"])
+                for alias in company_name_aliases(row.get("NAME OF COMPANY", "")):
+                    extractor.add_alias(alias, row["SYMBOL"])
+
+        if aliases_path:
+            for row in cls._read_csv(aliases_path):
+                if row.get("ALIAS") and row.get("SYMBOL"):
+                    extractor.add_alias(row["ALIAS"], row["SYMBOL"])
+
+        logger.info(
+            f"Symbol extractor loaded {extractor.symbol_count} entries"
+            f" ({len(extractor.alias_index)} aliases) from {path}"
+        )
+        return extractor
+
+    @staticmethod
+    def _read_csv(path):
+        """Read a CSV file into dicts with upper-cased, stripped keys."""
+        try:
+            with open(path, newline="", encoding="utf-8") as f:
+                return [
+                    {key.strip().upper(): (value or "").strip() for key, value in row.items() if key}
+                    for row in csv.DictReader(f)
+                ]
+        except OSError as e:
+            logger.error(f"Error loading symbol data from {path}: {str(e)}")
+            return []
+
+    @staticmethod
+    def tokenize(text):
+        """
+        Split text into upper-cased tokens.
+
+        Args:
+            text (str): Free text
+
+        Returns:
+            list: (token, original) tuples in order of appearance
+        """
+        return [(match.group(0).upper(), match.group(0)) for match in TOKEN_PATTERN.finditer(text)]
+
+    def add(self, phrase, symbol):
+        """
+        Index a phrase so that it resolves to a symbol.
+
+        Args:
+            phrase (str): Ticker or multi-word name
+            symbol (str): Canonical NSE symbol the phrase resolves to
+        """
+        tokens = [token for token, _ in self.tokenize(phrase)]
+        if not tokens:
+            return
+        node = self._root
+        for token in tokens:
+            node = node.setdefault(token, {})
+        if _TERMINAL not in node:
+            self.symbol_count += 1
+        node[_TERMINAL] = symbol.upper()
+
+    def add_alias(self, alias, symbol):
+        """
+        Index a company name or abbreviation for exact and fuzzy lookup.
+
+        Args:
+            alias (str): Name as users type it (e.g. 'State Bank')
+            symbol (str): Canonical NSE symbol
+        """
+        self.add(alias, symbol)
+        normalized = " ".join(token for token, _ in self.tokenize(alias))
+        self.alias_index.add(normalized, symbol.upper())
+
+    def extract(self, query):
+        """
+        Extract known stock symbols from a query.
+
+        Args:
+            query (str): The financial query
+
+        Returns:
+            list: Unique symbols in order of first mention. Symbols typed with
+            a BSE suffix keep it (e.g. 'RELIANCE.BO'); all others are bare.
+        """
+        tokens = self.tokenize(query or "")
+        found = []
+        i = 0
+        while i < len(tokens):
+            symbol, length = self._longest_match(tokens, i)
+            if not symbol:
+                symbol, length = self._fuzzy_match(tokens, i)
+            if symbol:
+                found.append(symbol)
+                i += length
+            else:
+                i += 1
+        return list(dict.fromkeys(found))
+
+    def _longest_match(self, tokens, start):
+        """
+        Walk the trie from tokens[start] and return the longest known entry.
+
+        Returns:
+            tuple: (symbol, number of tokens consumed), or (None, 0)
+        """
+        node = self._root
+        best = (None, 0)
+        for offset in range(start, len(tokens)):
+            token, original = tokens[offset]
+            base, _, suffix = token.partition(".")
+            child = node.get(token) or (node.get(base) if suffix in EXCHANGE_SUFFIXES else None)
+            if child is None:
+                break
+            node = child
+
+            symbol = node.get(_TERMINAL)
+            if symbol is None:
+                continue
+            if offset == start and base in AMBIGUOUS_WORDS and not suffix and not original.isupper():
+                continue
+            if suffix in EXCHANGE_SUFFIXES and EXCHANGE_SUFFIXES[suffix] != ".NS":
+                symbol = f"{symbol}{EXCHANGE_SUFFIXES[suffix]}"
+            best = (symbol, offset - start + 1)
+        return best
+
+    def _fuzzy_match(self, tokens, start):
+        """
+        Resolve a misspelt company name starting at tokens[start].
+
+        Only phrases that start with a capital letter are tried, longest
+        first, with one edit allowed up to 8 characters and two beyond.
+
+        Returns:
+            tuple: (symbol, number of tokens consumed), or (None, 0)
+        """
+        if not tokens[start][1][0].isupper():
+            return None, 0
+
+        for length in range(min(FUZZY_MAX_TOKENS, len(tokens) - start), 0, -1):
+            phrase = " ".join(token for token, _ in tokens[start:start + length])
+            if len(phrase) < FUZZY_MIN_LENGTH:
+                continue
+            match = self.alias_index.lookup(phrase, 1 if len(phrase) <= 8 else 2)
+            if match:
+                logger.debug(f"Resolved '{phrase}' to {match[0]} via alias '{match[1]}'")
+                return match[0], length
+        return None, 0
+
+
+def company_name_aliases(name):
+    """
+    Derive lookup aliases from a registered company name.
+
+    'Tata Power Company Limited' yields 'TATA POWER COMPANY LIMITED',
+    'TATA POWER COMPANY' and 'TATA POWER'. Parenthesised parts such as
+    '(India)' are dropped.
+
+    Args:
+        name (str): Company name as listed by the exchange
+
+    Returns:
+        list: Alias strings, longest first
+    """
+    tokens = [token for token, _ in SymbolExtractor.tokenize(re.sub(r"\(.*?\)", " ", name))]
+    aliases = []
+    while tokens:
+        aliases.append(" ".join(tokens))
+        if tokens[-1] not in LEGAL_SUFFIXES:
+            break
+        tokens = tokens[:-1]
+    return aliases
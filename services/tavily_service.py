@@ -1,10 +1,17 @@
 import requests
+import hashlib
+import json
 import logging
 import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from requests.exceptions import Timeout, ConnectionError
 from dotenv import load_dotenv
 import os
+from services.http_client import create_session
+from services.cache import SingleFlight
+from services.resilience import CircuitBreaker, Deadline, RetryGuard
+from services import tracing
 
 logger = logging.getLogger(__name__)
 
@@ -12,139 +19,259 @@ load_dotenv()
 logger.info("Loaded environment variables from .env file")
 
 class TavilyService:
-    def __init__(self, api_key):
+    def __init__(self, api_key, pool_size=10, connect_timeout=5, read_timeout=20, cache=None, cache_ttl=120, stale_ttl=600,
+                 circuit_breaker=None, default_budget=30, backoff_base=0.5, backoff_cap=4.0, max_sync_backoff=2.0):
         self.api_key = api_key or os.getenv("TAVILY_API_KEY")
 
         # Updated base URL per the documentation (remove /v1)
         self.base_url = "https://api.tavily.com"
+        # (connect, read) timeouts applied to every attempt
+        self.timeout = (connect_timeout, read_timeout)
+        # One pooled keep-alive session shared by all requests and retries;
+        # API key passed in header per docs
+        self.session = create_session(pool_size=pool_size, headers={
+            "Authorization": f"Bearer {self.api_key}",
+            "Content-Type": "application/json"
+        })
+        # Optional CacheBackend for search results: fresh for cache_ttl seconds,
+        # then served stale for up to stale_ttl more while a refresh runs
+        self.cache = cache
+        self.cache_ttl = cache_ttl
+        self.stale_ttl = stale_ttl
+        self._single_flight = SingleFlight()
+        self._refresh_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="tavily-refresh")
+        # Shared by every request so an outage is detected once and fails fast everywhere
+        self.circuit_breaker = circuit_breaker or CircuitBreaker("tavily")
+        # Time budget for searches whose caller passes no deadline, and retry backoff bounds
+        self.default_budget = default_budget
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        # Most seconds one sync search may sleep between retries, since it sleeps on a pool thread
+        self.max_sync_backoff = max_sync_backoff
         logger.info("Tavily service initialized")
 
-    def search_financial_news(self, query, max_results=5, max_retries=3):
+    def _search_params(self, query, max_results):
+        """Build search parameters (simplified to match Tavily documentation)."""
+        return {
+            "query": f"Latest Indian financial news about {query}, focus on stock market impact",
+            "search_depth": "advanced",
+            "max_results": max_results,
+            "include_answer": True,
+            "include_images": False,
+            "include_raw_content": False
+        }
+
+    def _cache_key(self, search_params):
+        """Cache key for a search payload, ignoring case and whitespace in the query."""
+        normalized = {
+            **search_params,
+            "query": " ".join(search_params["query"].lower().split())
+        }
+        raw = json.dumps(normalized, sort_keys=True)
+        return "tavily:" + hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+    def search_financial_news(self, query, max_results=5, max_retries=3, deadline=None):
         """
-        Search for financial news using Tavily API with retry logic.
+        Search for financial news using Tavily API, with caching and retry logic.
+
+        Fresh cached results are returned directly. Stale ones are returned
+        too while a single background refresh runs. On a miss, concurrent
+        callers with the same search share one upstream request; a caller
+        that is still waiting on it when its deadline runs out gets a
+        'Deadline exceeded' result.
 
         Args:
             query (str): The financial query to search for.
             max_results (int): Maximum number of results to return.
             max_retries (int): Maximum number of retry attempts.
+            deadline (Deadline): Time budget from the caller; defaults to `default_budget` seconds.
 
         Returns:
             dict: Contains news 'results' and a 'summary'.
         """
-        retry_count = 0
-        # API key passed in header per docs
-        headers = {
-            "Authorization": f"Bearer {self.api_key}",
-            "Content-Type": "application/json"
-        }
-        while retry_count < max_retries:
-            try:
-                logger.debug(f"Searching for financial news with query: {query} (Attempt {retry_count + 1})")
-                
-                # Build search parameters (simplified to match Tavily documentation)
-                search_params = {
-                    "query": f"Latest Indian financial news about {query}, focus on stock market impact",
-                    "search_depth": "advanced",
-                    "max_results": max_results,
-                    "include_answer": True,
-                    "include_images": False,
-                    "include_raw_content": False
-                }
-                
-                # Updated endpoint URL as per docs: https://api.tavily.com/search
-                response = requests.post(
-                    f"{self.base_url}/search",
-                    json=search_params,
-                    headers=headers,
-                    timeout=20
-                )
-                
-                if response.status_code == 200:
-                    data = response.json()
-                    processed_results = []
-                    for result in data.get("results", []):
-                        processed_results.append({
-                            "title": result.get("title", "No title"),
-                            "url": result.get("url", ""),
-                            "content": result.get("content", "No content available"),
-                            "published_date": result.get("published_date", "Unknown date"),
-                            "source": result.get("source", "Unknown source")
-                        })
-                    summary = data.get("answer", "No summary available")
-                    return {
-                        "results": processed_results,
-                        "summary": summary
-                    }
-                elif response.status_code == 404:
-                    logger.warning(f"404 error from Tavily API on attempt {retry_count + 1}")
-                    retry_count += 1
-                    time.sleep(1)
-                    continue
-                else:
+        with tracing.span("tavily.search") as span:
+            if self.cache is None:
+                return self._search_uncached(query, max_results, max_retries, deadline)
+            span.set_attribute("cache.hit", False)
+
+            key = self._cache_key(self._search_params(query, max_results))
+            entry = self.cache.get(key)
+            if entry is not None:
+                span.set_attribute("cache.hit", True)
+                if entry["fresh_until"] > time.time():
+                    logger.debug(f"Tavily cache hit for query: {query}")
+                    return entry["value"]
+
+                span.set_attribute("cache.stale", True)
+                if not self._single_flight.in_flight(key):
+                    logger.debug(f"Serving stale Tavily results and refreshing for query: {query}")
+                    self._refresh_executor.submit(tracing.bind(self._refresh), key, query, max_results, max_retries)
+                return entry["value"]
+
+            # A caller waiting on another's search gives up with the rest of its own deadline
+            deadline = deadline or Deadline(self.default_budget)
+            return self._single_flight.do(
+                key,
+                lambda: self._fetch_and_store(key, query, max_results, max_retries, deadline),
+                timeout=deadline.remaining(),
+                fallback=lambda: self._search_uncached(query, max_results, max_retries, deadline)
+            )
+
+    def cache_stats(self):
+        """Get search cache counters, or None if caching is disabled."""
+        return self.cache.stats() if self.cache is not None else None
+
+    def circuit_stats(self):
+        """Get circuit breaker state and counters."""
+        return self.circuit_breaker.stats()
+
+    def _fetch_and_store(self, key, query, max_results, max_retries, deadline=None):
+        """Search upstream and cache successful results."""
+        result = self._search_uncached(query, max_results, max_retries, deadline)
+        if not result.get("error"):
+            self.cache.set(key, {"value": result, "fresh_until": time.time() + self.cache_ttl}, self.cache_ttl + self.stale_ttl)
+        return result
+
+    def _refresh(self, key, query, max_results, max_retries):
+        """Background refresh of a stale entry; failures keep serving the stale value."""
+        try:
+            self._single_flight.do(key, lambda: self._fetch_and_store(key, query, max_results, max_retries))
+        except Exception as e:
+            logger.warning(f"Background Tavily refresh failed: {str(e)}")
+
+    def _search_uncached(self, query, max_results, max_retries, deadline=None):
+        """
+        Search for financial news using Tavily API with retry logic.
+
+        Every attempt with time left on the deadline first asks the shared
+        circuit breaker; while it is open the search fails fast. Retries wait a jittered backoff, and
+        both the waits and the per-attempt timeouts are cut to what is left
+        of the deadline, so no retry is started that could not finish in time.
+
+        Unlike the async client, which awaits its backoff on the event loop,
+        this one sleeps in the calling thread, usually a context-service
+        news worker. That thread is held for the whole search, so the sleeps
+        of one search together are also capped at `max_sync_backoff`
+        seconds; once that is used up it stops retrying.
+
+        Args:
+            query (str): The financial query to search for.
+            max_results (int): Maximum number of results to return.
+            max_retries (int): Maximum number of attempts.
+            deadline (Deadline): Time budget from the caller; defaults to `default_budget` seconds.
+
+        Returns:
+            dict: Contains news 'results' and a 'summary', plus 'error' if the search failed.
+        """
+        with tracing.span("tavily.request", kind=tracing.KIND_CLIENT) as span:
+            search_params = self._search_params(query, max_results)
+            guard = RetryGuard(self.circuit_breaker, deadline or Deadline(self.default_budget), max_retries,
+                               self.backoff_base, self.backoff_cap, max_total_backoff=self.max_sync_backoff)
+
+            while (remaining := guard.begin()) is not None:
+                span.set_attribute("retry.count", guard.attempt - 1)
+                try:
+                    logger.debug(f"Searching for financial news with query: {query} (Attempt {guard.attempt})")
+
+                    # Updated endpoint URL as per docs: https://api.tavily.com/search
+                    response = self.session.post(
+                        f"{self.base_url}/search",
+                        json=search_params,
+                        timeout=(min(self.timeout[0], remaining), min(self.timeout[1], remaining))
+                    )
+
+                    span.set_attribute("http.response.status_code", response.status_code)
+                    if response.status_code == 200:
+                        news_data = self._process_response(response.json())
+                        guard.succeeded()
+                        return news_data
+
                     logger.error(f"Error searching Tavily API: {response.status_code} - {response.text}")
-                    retry_count += 1
-                    if retry_count < max_retries:
-                        sleep_time = 2 ** retry_count
-                        logger.info(f"Retrying in {sleep_time} seconds...")
-                        time.sleep(sleep_time)
-                        continue
-                    else:
-                        return {
-                            "results": [],
-                            "summary": "Unable to fetch financial news at this time."
-                        }
-            except (Timeout, ConnectionError) as e:
-                logger.warning(f"Network error during Tavily API request: {str(e)}")
-                retry_count += 1
-                if retry_count < max_retries:
-                    sleep_time = 2 ** retry_count
-                    logger.info(f"Retrying in {sleep_time} seconds...")
-                    time.sleep(sleep_time)
-                    continue
-                else:
-                    raise
-            except Exception as e:
-                logger.error(f"Exception in Tavily search: {str(e)}")
-                retry_count += 1
-                if retry_count < max_retries:
-                    sleep_time = 2 ** retry_count
-                    logger.info(f"Retrying in {sleep_time} seconds due to error: {str(e)}")
-                    time.sleep(sleep_time)
-                else:
-                    return {
-                        "results": [],
-                        "summary": "An error occurred while fetching financial news."
-                    }
-        logger.error(f"All {max_retries} attempts to fetch news failed for query: {query}")
-        return {
-            "results": [],
-            "summary": "Unable to fetch financial news after multiple attempts."
-        }
+                    guard.failed(f"API Error: {response.status_code}")
+                except (Timeout, ConnectionError) as e:
+                    logger.warning(f"Network error during Tavily API request: {str(e)}")
+                    guard.failed(str(e))
+                except Exception as e:
+                    logger.error(f"Exception in Tavily search: {str(e)}")
+                    guard.failed(str(e))
+
+                sleep_time = guard.backoff()
+                if sleep_time is None:
+                    break
+                logger.info(f"Retrying in {sleep_time:.2f} seconds...")
+                time.sleep(sleep_time)
+
+            return failed_search(query, guard, span)
     
-    def get_financial_context(self, financial_query):
+    def get_financial_context(self, financial_query, deadline=None):
         """
         Get financial context for a given query using Tavily API.
         
         Args:
             financial_query (str): The financial query to get context for.
+            deadline (Deadline): Time budget from the caller.
             
         Returns:
             dict: Financial context data.
         """
         try:
-            news_data = self.search_financial_news(financial_query)
-            context = {
-                "news_summary": news_data.get("summary", "No summary available"),
-                "articles": news_data.get("results", []),
-                "query_time": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                "query": financial_query
-            }
-            return context
+            news_data = self.search_financial_news(financial_query, deadline=deadline)
+            return self._build_context(financial_query, news_data)
         except Exception as e:
             logger.error(f"Error getting financial context: {str(e)}")
             return {
                 "news_summary": "Unable to retrieve financial context at this time.",
                 "articles": [],
                 "query_time": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                "query": financial_query
+                "query": financial_query,
+                "error": str(e)
             }
+
+    @staticmethod
+    def _process_response(data):
+        """Reduce a Tavily search response to the 'results' and 'summary' we keep."""
+        processed_results = []
+        for result in data.get("results", []):
+            processed_results.append({
+                "title": result.get("title", "No title"),
+                "url": result.get("url", ""),
+                "content": result.get("content", "No content available"),
+                "published_date": result.get("published_date", "Unknown date"),
+                "source": result.get("source", "Unknown source")
+            })
+        return {
+            "results": processed_results,
+            "summary": data.get("answer", "No summary available")
+        }
+
+    @staticmethod
+    def _build_context(financial_query, news_data):
+        """Turn search results into the financial context passed to the analysis."""
+        context = {
+            "news_summary": news_data.get("summary", "No summary available"),
+            "articles": news_data.get("results", []),
+            "query_time": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "query": financial_query
+        }
+        if news_data.get("error"):
+            context["error"] = news_data["error"]
+        return context
+
+
+def failed_search(query, guard, span):
+    """Result of a search that got no successful attempt, from the RetryGuard's error."""
+    span.set_error(guard.error)
+    if guard.error == RetryGuard.CIRCUIT_OPEN:
+        logger.warning("Tavily circuit breaker is open, skipping news search")
+        span.set_attribute("circuit.open", True)
+        return {
+            "results": [],
+            "summary": "Financial news is temporarily unavailable.",
+            "error": guard.error
+        }
+    logger.error(f"All attempts to fetch news failed for query: {query}")
+    return {
+        "results": [],
+        "summary": "Unable to fetch financial news at this time.",
+        "error": guard.error
+    }
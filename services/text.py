@@ -0,0 +1,57 @@
+import re
+
+# Words that do not change what is being asked
+STOPWORDS = frozenset({
+    "a", "an", "and", "are", "as", "at", "be", "can", "could", "do", "does", "for", "from", "how",
+    "i", "in", "is", "it", "me", "my", "now", "of", "on", "or", "please", "share", "shares", "should",
+    "stock", "stocks", "tell", "that", "the", "this", "to", "we", "what", "when", "whether", "which",
+    "will", "with", "would", "you",
+})
+
+# Words folded together so rephrasings normalize to the same tokens
+SYNONYMS = {
+    "today": "now",
+    "currently": "now",
+    "current": "now",
+    "purchase": "buy",
+    "buying": "buy",
+    "invest": "buy",
+    "investing": "buy",
+    "selling": "sell",
+    "no": "not",
+    "never": "not",
+    "dont": "not",
+    "doesnt": "not",
+    "shouldnt": "not",
+    "holding": "hold",
+    "avoiding": "avoid",
+}
+
+WORD_PATTERN = re.compile(r"[a-z0-9&]+")
+
+# Contractions expanded before tokenizing so "don't" keeps its negation
+CONTRACTIONS = (
+    (re.compile(r"\bcan[’']t\b"), "can not"),
+    (re.compile(r"\bwon[’']t\b"), "will not"),
+    (re.compile(r"n[’']t\b"), " not"),
+)
+
+def normalize_query(financial_query):
+    """
+    Reduce a query to its meaningful, order-independent words.
+
+    Args:
+        financial_query (str): The financial query
+
+    Returns:
+        list: Sorted unique tokens, e.g. 'Should I buy TCS now?' -> ['buy', 'tcs']
+    """
+    text = (financial_query or "").lower()
+    for pattern, replacement in CONTRACTIONS:
+        text = pattern.sub(replacement, text)
+    tokens = set()
+    for word in WORD_PATTERN.findall(text):
+        word = SYNONYMS.get(word, word)
+        if word not in STOPWORDS:
+            tokens.add(word)
+    return sorted(tokens)
@@ -0,0 +1,356 @@
+import contextvars
+import json
+import logging
+import os
+import queue
+import random
+import threading
+import time
+from contextlib import contextmanager
+import requests
+
+logger = logging.getLogger(__name__)
+
+# OTLP span kinds
+KIND_INTERNAL = 1
+KIND_SERVER = 2
+KIND_CLIENT = 3
+
+STATUS_UNSET = 0
+STATUS_OK = 1
+STATUS_ERROR = 2
+
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+# Set by configure(); while None every span is the shared no-op span
+_tracer = None
+
+class _NoopSpan:
+    """Span returned while tracing is off; every method does nothing."""
+
+    sampled = False
+
+    def __bool__(self):
+        return False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    def set_attribute(self, key, value):
+        pass
+
+    def set_attributes(self, attributes):
+        pass
+
+    def add_count(self, key, amount=1):
+        pass
+
+    def set_error(self, message):
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+class Span:
+    """
+    A timed operation within a trace.
+
+    Used as a context manager: entering makes it the current span (so spans
+    opened inside become its children) and exiting ends and exports it.
+    An exception leaving the block marks the span as an error.
+    """
+
+    def __init__(self, tracer, name, parent=None, kind=KIND_INTERNAL, attributes=None):
+        self.tracer = tracer
+        self.name = name
+        self.kind = kind
+        if parent is not None:
+            self.trace_id = parent.trace_id
+            self.parent_span_id = parent.span_id
+            self.sampled = parent.sampled
+        else:
+            self.trace_id = f"{random.getrandbits(128):032x}"
+            self.parent_span_id = ""
+            self.sampled = random.random() < tracer.sample_rate
+        self.span_id = f"{random.getrandbits(64):016x}"
+        self.attributes = dict(attributes or {})
+        self.status = STATUS_UNSET
+        self.status_message = ""
+        self.start_time = 0
+        self.end_time = 0
+        self._token = None
+
+    def __enter__(self):
+        self.start_time = time.time_ns()
+        self._token = _current_span.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.end_time = time.time_ns()
+        _current_span.reset(self._token)
+        if exc is not None:
+            self.set_error(f"{exc_type.__name__}: {exc}")
+        if self.sampled:
+            self.tracer.export(self)
+        return False
+
+    def set_attribute(self, key, value):
+        """Record an attribute (str, bool, int or float); None values are skipped."""
+        if value is not None:
+            self.attributes[key] = value
+
+    def set_attributes(self, attributes):
+        """Record several attributes at once."""
+        for key, value in attributes.items():
+            self.set_attribute(key, value)
+
+    def add_count(self, key, amount=1):
+        """Add to a counter attribute, such as a retry count."""
+        self.attributes[key] = self.attributes.get(key, 0) + amount
+
+    def set_error(self, message):
+        """Mark the span as failed."""
+        self.status = STATUS_ERROR
+        self.status_message = message
+
+    @property
+    def traceparent(self):
+        """W3C traceparent header value for this span."""
+        return f"00-{self.trace_id}-{self.span_id}-{'01' if self.sampled else '00'}"
+
+    def to_otlp(self):
+        """The span in OTLP/JSON form."""
+        span = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": self.kind,
+            "startTimeUnixNano": str(self.start_time),
+            "endTimeUnixNano": str(self.end_time),
+            "attributes": [_otlp_attribute(key, value) for key, value in self.attributes.items()],
+            "status": {"code": self.status, "message": self.status_message} if self.status else {}
+        }
+        if self.parent_span_id:
+            span["parentSpanId"] = self.parent_span_id
+        return span
+
+
+class _RemoteParent:
+    """Parent span from an incoming traceparent header."""
+
+    def __init__(self, trace_id, span_id, sampled):
+        self.trace_id = trace_id
+        self.span_id = span_id
+        self.sampled = sampled
+
+
+class Tracer:
+    """
+    Collects finished spans and exports them in batches from a background thread.
+
+    Spans wait in a bounded queue; when it is full new spans are dropped
+    (and counted) rather than slowing requests down.
+    """
+
+    def __init__(self, exporter, service_name="financial-analyzer", sample_rate=1.0, batch_size=256,
+                 flush_interval=2.0, max_queue=4096):
+        """
+        Args:
+            exporter: Object with export(payload) taking an OTLP/JSON traces payload
+            service_name (str): service.name resource attribute
+            sample_rate (float): Fraction of traces recorded (decided at the root span)
+            batch_size (int): Most spans per export
+            flush_interval (float): Seconds between exports
+            max_queue (int): Spans held before new ones are dropped
+        """
+        self.exporter = exporter
+        self.service_name = service_name
+        self.sample_rate = sample_rate
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.dropped = 0
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._wake = threading.Event()
+        self._send_lock = threading.Lock()
+        threading.Thread(target=self._export_loop, name="trace-exporter", daemon=True).start()
+
+    def export(self, span):
+        """Queue a finished span for export."""
+        try:
+            self._queue.put_nowait(span)
+        except queue.Full:
+            self.dropped += 1
+            return
+        if self._queue.qsize() >= self.batch_size:
+            self._wake.set()
+
+    def flush(self):
+        """Export every queued span now."""
+        with self._send_lock:
+            while True:
+                spans = []
+                while len(spans) < self.batch_size:
+                    try:
+                        spans.append(self._queue.get_nowait())
+                    except queue.Empty:
+                        break
+                if not spans:
+                    return
+                self._send(spans)
+
+    def _export_loop(self):
+        while True:
+            # Every flush_interval, or sooner once a full batch is waiting
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self.flush()
+
+    def _send(self, spans):
+        payload = {
+            "resourceSpans": [{
+                "resource": {"attributes": [_otlp_attribute("service.name", self.service_name)]},
+                "scopeSpans": [{
+                    "scope": {"name": "financial-analyzer.tracing"},
+                    "spans": [span.to_otlp() for span in spans]
+                }]
+            }]
+        }
+        try:
+            self.exporter.export(payload)
+        except Exception as e:
+            logger.warning(f"Could not export {len(spans)} spans: {str(e)}")
+
+
+class FileExporter:
+    """Appends each batch as one line of OTLP/JSON (the collector's otlpjsonfile format)."""
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._lock = threading.Lock()
+
+    def export(self, payload):
+        line = json.dumps(payload, separators=(",", ":")) + "\n"
+        with self._lock, open(self.path, "a", encoding="utf-8") as f:
+            f.write(line)
+
+
+class OTLPHttpExporter:
+    """Posts each batch to an OpenTelemetry collector's OTLP/HTTP JSON endpoint."""
+
+    def __init__(self, endpoint, timeout=5):
+        self.url = endpoint.rstrip("/") + "/v1/traces"
+        self.timeout = timeout
+        self.session = requests.Session()
+
+    def export(self, payload):
+        response = self.session.post(self.url, json=payload, timeout=self.timeout)
+        if response.status_code >= 300:
+            raise RuntimeError(f"Collector returned {response.status_code}")
+
+
+def configure(exporter, service_name="financial-analyzer", sample_rate=1.0):
+    """
+    Turn tracing on for this process.
+
+    Args:
+        exporter: FileExporter, OTLPHttpExporter or any object with export(payload)
+        service_name (str): service.name resource attribute
+        sample_rate (float): Fraction of traces recorded
+
+    Returns:
+        Tracer: The process tracer
+    """
+    global _tracer
+    _tracer = Tracer(exporter, service_name=service_name, sample_rate=sample_rate)
+    logger.info(f"Tracing enabled ({type(exporter).__name__}, sample rate {sample_rate})")
+    return _tracer
+
+
+def enabled():
+    """Return True if tracing is on."""
+    return _tracer is not None
+
+
+def span(name, kind=KIND_INTERNAL, parent=None, **attributes):
+    """
+    Open a span as a child of the current one (or of `parent`).
+
+    While tracing is off this returns a shared no-op span, so instrumented
+    code pays one global lookup.
+
+    Args:
+        name (str): Operation name, e.g. 'groq.chat_completion'
+        kind (int): KIND_INTERNAL, KIND_SERVER or KIND_CLIENT
+        parent: Span (or remote parent) to attach to instead of the current span
+        attributes: Initial attributes
+
+    Returns:
+        Span: Use as a context manager
+    """
+    if _tracer is None:
+        return NOOP_SPAN
+    return Span(_tracer, name, parent or _current_span.get(), kind, attributes)
+
+
+def current_span():
+    """The active span, or the no-op span if there is none."""
+    return _current_span.get() or NOOP_SPAN
+
+
+def parent_from_traceparent(header):
+    """
+    Parse a W3C traceparent header into a parent for span().
+
+    Returns:
+        The remote parent, or None if the header is missing or malformed
+    """
+    parts = (header or "").split("-")
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+    try:
+        return _RemoteParent(parts[1], parts[2], bool(int(parts[3], 16) & 1))
+    except ValueError:
+        return None
+
+
+def bind(fn):
+    """
+    Wrap fn to run in the caller's tracing context, for handing work to another thread.
+
+    Returns:
+        callable: fn itself while tracing is off
+    """
+    if _tracer is None or _current_span.get() is None:
+        return fn
+    context = contextvars.copy_context()
+    return lambda *args, **kwargs: context.run(fn, *args, **kwargs)
+
+
+@contextmanager
+def activate(parent):
+    """Make parent the current span for the block (without ending it), e.g. in a worker thread."""
+    if parent is None or parent is NOOP_SPAN:
+        yield
+        return
+    token = _current_span.set(parent)
+    try:
+        yield
+    finally:
+        _current_span.reset(token)
+
+
+def _otlp_attribute(key, value):
+    if isinstance(value, bool):
+        typed = {"boolValue": value}
+    elif isinstance(value, int):
+        typed = {"intValue": str(value)}
+    elif isinstance(value, float):
+        typed = {"doubleValue": value}
+    else:
+        typed = {"stringValue": str(value)}
+    return {"key": key, "value": typed}
@@ -1,11 +1,71 @@
 import yfinance as yf
+import numpy as np
+import pandas as pd
 import logging
+import threading
 from datetime import datetime
+from services import tracing
 
 logger = logging.getLogger(__name__)
 
-class YFinanceService:
+class TickerInfoMemo:
+    """
+    Request-scoped memo of ticker.info keyed by normalized symbol.
+
+    Create one per request and pass it to the YFinanceService getters so a
+    symbol is fetched from Yahoo at most once, even when several threads of
+    the same request ask for it at the same time.
+    """
+
     def __init__(self):
+        self._values = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+
+    def get_or_fetch(self, key, fetch):
+        """
+        Return the memoized value for key, calling fetch() on the first request.
+
+        Args:
+            key (str): Normalized stock symbol
+            fetch (callable): Zero-argument function that fetches the value
+
+        Returns:
+            The memoized value
+        """
+        with self._lock:
+            if key in self._values:
+                return self._values[key]
+            key_lock = self._locks.setdefault(key, threading.Lock())
+
+        with key_lock:
+            with self._lock:
+                if key in self._values:
+                    return self._values[key]
+            value = fetch()
+            with self._lock:
+                self._values[key] = value
+            return value
+
+def _finite(value):
+    """Return value as a float, or None if it is missing or NaN."""
+    if value is None:
+        return None
+    value = float(value)
+    return None if np.isnan(value) else value
+
+
+class YFinanceService:
+    # Columns of the frame returned by get_stock_data_many
+    BATCH_COLUMNS = [
+        "normalized_symbol", "name", "price", "change", "change_percent", "previous_close",
+        "sector", "industry", "market_cap", "pe_ratio", "dividend_yield"
+    ]
+    NUMERIC_COLUMNS = ["price", "change", "change_percent", "previous_close", "market_cap", "pe_ratio", "dividend_yield"]
+
+    def __init__(self, cache=None):
+        # Optional MarketDataCache shared across requests (and workers, with a shared backend)
+        self.cache = cache
         logger.info("Yahoo Finance service initialized")
 
     def _normalize_symbol(self, symbol):
@@ -17,38 +77,137 @@ class YFinanceService:
             return f"{symbol}.NS"
         return symbol
 
-    def get_stock_quote(self, symbol):
+    def _fetch_info(self, symbol, memo=None):
+        """
+        Fetch the raw ticker.info mapping for a symbol, once per memo.
+
+        Args:
+            symbol (str): Stock symbol, with or without exchange suffix
+            memo (TickerInfoMemo): Optional request-scoped memo to reuse earlier fetches
+
+        Returns:
+            dict: The ticker.info mapping (may be empty)
+        """
+        normalized_symbol = self._normalize_symbol(symbol)
+        if memo is not None:
+            return memo.get_or_fetch(normalized_symbol, lambda: self._load_info(normalized_symbol))
+        return self._load_info(normalized_symbol)
+
+    def _load_info(self, normalized_symbol):
+        """
+        Load ticker.info from the shared cache, falling back to Yahoo on a miss.
+
+        When only the price has expired, just the price fields are refetched
+        (through the lighter fast_info lookup) and merged with the cached
+        fundamentals; the full ticker.info is fetched only when the
+        fundamentals are missing too.
+
+        Args:
+            normalized_symbol (str): Symbol with exchange suffix
+
+        Returns:
+            dict: The ticker.info mapping, or the cached subset of it
+        """
+        with tracing.span("yfinance.ticker_info", kind=tracing.KIND_CLIENT, symbol=normalized_symbol) as span:
+            if self.cache is not None:
+                fundamentals = self.cache.get_fundamentals(normalized_symbol)
+                quote = self.cache.get_quote(normalized_symbol)
+                span.set_attributes({"cache.hit": quote is not None and fundamentals is not None,
+                                     "cache.fundamentals_hit": fundamentals is not None})
+                if fundamentals is not None:
+                    if quote is not None:
+                        logger.debug("Market data cache hit for %s", normalized_symbol)
+                        return {**fundamentals, **quote}
+                    quote = self._fetch_quote(normalized_symbol)
+                    if quote is not None:
+                        self.cache.set_quote(normalized_symbol, quote)
+                        return {**fundamentals, **quote}
+
+            info = yf.Ticker(normalized_symbol).info
+            if self.cache is not None:
+                self.cache.set_info(normalized_symbol, info)
+            return info
+
+    def _fetch_quote(self, normalized_symbol):
+        """
+        Fetch only the price fields of a symbol, in ticker.info form.
+
+        Args:
+            normalized_symbol (str): Symbol with exchange suffix
+
+        Returns:
+            dict: The QUOTE_FIELDS keys, or None if Yahoo has no price for the symbol
+        """
+        try:
+            fast_info = yf.Ticker(normalized_symbol).fast_info
+            price = _finite(fast_info["last_price"])
+            previous_close = _finite(fast_info["previous_close"])
+        except Exception as e:
+            logger.warning("Could not refresh the price of %s: %s", normalized_symbol, str(e))
+            return None
+        if price is None:
+            return None
+
+        quote = {"symbol": normalized_symbol, "regularMarketPrice": price}
+        if previous_close:
+            quote.update({
+                "regularMarketChange": price - previous_close,
+                "regularMarketChangePercent": (price - previous_close) / previous_close * 100,
+                "previousClose": previous_close
+            })
+        return quote
+
+    def cache_stats(self):
+        """Get market data cache counters, or None if caching is disabled."""
+        return self.cache.stats() if self.cache is not None else None
+
+    def _project_quote(self, info, symbol):
+        """Build the quote fields from a ticker.info mapping."""
+        return {
+            "symbol": info.get("symbol", symbol),
+            "price": info.get("regularMarketPrice", "N/A"),
+            "change": info.get("regularMarketChange", "N/A"),
+            "change_percent": info.get("regularMarketChangePercent", "N/A"),
+            "previous_close": info.get("previousClose", "N/A"),
+            "timestamp": datetime.now().strftime("%Y-%m-%d")
+        }
+
+    def _project_overview(self, info, symbol):
+        """Build the fundamental company fields from a ticker.info mapping."""
+        return {
+            "symbol": info.get("symbol", symbol),
+            "name": info.get("shortName", "N/A"),
+            "sector": info.get("sector", "N/A"),
+            "industry": info.get("industry", "N/A"),
+            "market_cap": info.get("marketCap", "N/A"),
+            "pe_ratio": info.get("trailingPE", "N/A"),
+            "dividend_yield": info.get("dividendYield", "N/A"),
+            "previous_close": info.get("previousClose", "N/A"),
+            "timestamp": datetime.now().strftime("%Y-%m-%d")
+        }
+
+    def get_stock_quote(self, symbol, memo=None):
         """
         Get current stock quote information using yfinance.
         
         Args:
             symbol (str): Stock symbol (e.g., 'INFY' for Infosys, will be normalized to 'INFY.NS')
+            memo (TickerInfoMemo): Optional request-scoped memo to reuse earlier fetches
             
         Returns:
             dict: Quote data containing symbol, price, change, change percent, previous close, timestamp
         """
         try:
-            normalized_symbol = self._normalize_symbol(symbol)
-            ticker = yf.Ticker(normalized_symbol)
-            info = ticker.info
+            info = self._fetch_info(symbol, memo)
             if not info:
-                logger.error("No quote data available for %s", normalized_symbol)
+                logger.error("No quote data available for %s", self._normalize_symbol(symbol))
                 return {"error": "No quote data available", "symbol": symbol}
-            
-            quote = {
-                "symbol": info.get("symbol", symbol),
-                "price": info.get("regularMarketPrice", "N/A"),
-                "change": info.get("regularMarketChange", "N/A"),
-                "change_percent": info.get("regularMarketChangePercent", "N/A"),
-                "previous_close": info.get("previousClose", "N/A"),
-                "timestamp": datetime.now().strftime("%Y-%m-%d")
-            }
-            return quote
+            return self._project_quote(info, symbol)
         except Exception as e:
             logger.error("Exception in get_stock_quote: %s", str(e))
             return {"error": str(e), "symbol": symbol}
     
-    def get_company_overview(self, symbol):
+    def get_company_overview(self, symbol, memo=None):
         """
         Get fundamental company data using yfinance.
         
@@ -62,41 +221,39 @@ class YFinanceService:
           - previous_close (for redundancy)
         """
         try:
-            normalized_symbol = self._normalize_symbol(symbol)
-            ticker = yf.Ticker(normalized_symbol)
-            info = ticker.info
+            info = self._fetch_info(symbol, memo)
             if not info:
-                logger.error("No profile data available for %s", normalized_symbol)
+                logger.error("No profile data available for %s", self._normalize_symbol(symbol))
                 return {"error": "Unable to fetch company data", "symbol": symbol}
-            
-            overview = {
-                "symbol": info.get("symbol", symbol),
-                "name": info.get("shortName", "N/A"),
-                "sector": info.get("sector", "N/A"),
-                "industry": info.get("industry", "N/A"),
-                "market_cap": info.get("marketCap", "N/A"),
-                "pe_ratio": info.get("trailingPE", "N/A"),
-                "dividend_yield": info.get("dividendYield", "N/A"),
-                "previous_close": info.get("previousClose", "N/A"),
-                "timestamp": datetime.now().strftime("%Y-%m-%d")
-            }
-            return overview
+            return self._project_overview(info, symbol)
         except Exception as e:
             logger.error("Exception in get_company_overview: %s", str(e))
             return {"error": str(e), "symbol": symbol}
     
-    def get_stock_data(self, symbol):
+    def get_stock_data(self, symbol, memo=None):
         """
         Get combined stock data including quote and fundamental data.
+
+        ticker.info is fetched once and both projections are derived from it.
         
         Args:
             symbol (str): Stock symbol (e.g., 'INFY' or 'RELIANCE')
+            memo (TickerInfoMemo): Optional request-scoped memo to reuse earlier fetches
             
         Returns:
             dict: Combined stock data with the requested fields.
         """
-        quote = self.get_stock_quote(symbol)
-        overview = self.get_company_overview(symbol)
+        try:
+            info = self._fetch_info(symbol, memo)
+            if not info:
+                logger.error("No quote data available for %s", self._normalize_symbol(symbol))
+                return {"error": "No quote data available", "symbol": symbol}
+        except Exception as e:
+            logger.error("Exception in get_stock_data: %s", str(e))
+            return {"error": str(e), "symbol": symbol}
+
+        quote = self._project_quote(info, symbol)
+        overview = self._project_overview(info, symbol)
         
         # Combine data giving precedence to the fundamental data where available.
         stock_data = {
@@ -111,3 +268,121 @@ class YFinanceService:
             "timestamp": datetime.now().strftime("%Y-%m-%d")
         }
         return stock_data
+
+    def get_stock_data_many(self, symbols):
+        """
+        Get price snapshots for many symbols with one multi-ticker download.
+
+        Prices for symbols still fresh in the market data cache are reused;
+        the rest are fetched in a single yf.download call. Fundamental
+        columns are filled from the cache only, since they are not part of
+        the bulk price download.
+        
+        Args:
+            symbols (list): Stock symbols (e.g., ['INFY', 'TCS', 'RELIANCE'])
+            
+        Returns:
+            pandas.DataFrame: One row per symbol, indexed by the symbol as given
+        """
+        symbols = list(dict.fromkeys(symbols))
+        normalized = pd.Series([self._normalize_symbol(symbol) for symbol in symbols], index=symbols)
+
+        frame = pd.DataFrame(index=pd.Index(symbols, name="symbol"), columns=self.BATCH_COLUMNS)
+        frame["normalized_symbol"] = normalized
+        frame[["price", "change", "change_percent", "previous_close"]] = np.nan
+
+        cached_quotes = {}
+        if self.cache is not None:
+            for symbol, normalized_symbol in normalized.items():
+                quote = self.cache.get_quote(normalized_symbol)
+                if quote is not None:
+                    cached_quotes[symbol] = quote
+                fundamentals = self.cache.get_fundamentals(normalized_symbol)
+                if fundamentals:
+                    frame.loc[symbol, ["name", "sector", "industry", "market_cap", "pe_ratio", "dividend_yield"]] = [
+                        fundamentals.get("shortName"),
+                        fundamentals.get("sector"),
+                        fundamentals.get("industry"),
+                        fundamentals.get("marketCap"),
+                        fundamentals.get("trailingPE"),
+                        fundamentals.get("dividendYield")
+                    ]
+
+        for symbol, quote in cached_quotes.items():
+            frame.loc[symbol, ["price", "change", "change_percent", "previous_close"]] = [
+                quote.get("regularMarketPrice", np.nan),
+                quote.get("regularMarketChange", np.nan),
+                quote.get("regularMarketChangePercent", np.nan),
+                quote.get("previousClose", np.nan)
+            ]
+
+        missing = [symbol for symbol in symbols if symbol not in cached_quotes]
+        if missing:
+            prices = self._download_prices(normalized[missing].tolist())
+            if prices is not None:
+                prices = prices.reindex(normalized[missing].values)
+                prices.index = missing
+                frame.loc[missing, prices.columns] = prices
+
+                if self.cache is not None:
+                    for symbol, row in prices.dropna(subset=["price"]).iterrows():
+                        # A symbol with one day of history has a price but no change; leave those fields out
+                        quote = {
+                            "regularMarketPrice": _finite(row["price"]),
+                            "regularMarketChange": _finite(row["change"]),
+                            "regularMarketChangePercent": _finite(row["change_percent"]),
+                            "previousClose": _finite(row["previous_close"])
+                        }
+                        self.cache.set_quote(normalized[symbol], {
+                            "symbol": normalized[symbol],
+                            **{field: value for field, value in quote.items() if value is not None}
+                        })
+
+        logger.info(f"Fetched batch snapshot for {len(symbols)} symbols ({len(missing)} from Yahoo)")
+        return frame.astype({column: "float64" for column in self.NUMERIC_COLUMNS})
+
+    def _download_prices(self, normalized_symbols):
+        """
+        Download recent daily closes for many tickers in one call.
+
+        Args:
+            normalized_symbols (list): Symbols with exchange suffix
+
+        Returns:
+            pandas.DataFrame: price, change, change_percent and previous_close
+            indexed by normalized symbol, or None if the download failed
+        """
+        try:
+            data = yf.download(
+                normalized_symbols,
+                period="5d",
+                interval="1d",
+                group_by="column",
+                auto_adjust=False,
+                threads=True,
+                progress=False
+            )
+        except Exception as e:
+            logger.error("Exception in batch download: %s", str(e))
+            return None
+
+        if data is None or data.empty:
+            logger.error("No batch price data available for %s", ", ".join(normalized_symbols))
+            return None
+
+        closes = data["Close"]
+        if isinstance(closes, pd.Series):
+            closes = closes.to_frame(normalized_symbols[0])
+
+        # Last two valid sessions per ticker, skipping bars where a ticker did not trade
+        last_two = closes.stack().dropna().groupby(level=1).tail(2).groupby(level=1)
+        price = last_two.last()
+        previous_close = last_two.first().where(last_two.size() > 1)
+        change = price - previous_close
+
+        return pd.DataFrame({
+            "price": price,
+            "change": change,
+            "change_percent": change / previous_close * 100,
+            "previous_close": previous_close
+        })
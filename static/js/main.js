@@ -40,6 +40,35 @@ document.addEventListener('DOMContentLoaded', function() {
         analysisContent.innerHTML = formattedContent;
     }
 
+    // Analyzer page - queue the analysis and poll until it is ready, or
+    // stream it in as it is generated (ANALYZER_DELIVERY picks which URL the form carries)
+    const analyzerForm = document.getElementById('analyzer-form');
+    if (analyzerForm && analyzerForm.dataset.jobsUrl && window.fetch) {
+        analyzerForm.addEventListener('submit', function(event) {
+            event.preventDefault();
+            submitAnalysisJob(analyzerForm);
+        });
+    } else if (analyzerForm && analyzerForm.dataset.streamUrl && window.fetch && window.ReadableStream && window.TextDecoder) {
+        analyzerForm.addEventListener('submit', function(event) {
+            event.preventDefault();
+            streamAnalysis(analyzerForm);
+        });
+    }
+
+    // History page - point the shared delete dialog at the clicked row
+    const deleteModal = document.getElementById('deleteModal');
+    if (deleteModal) {
+        deleteModal.addEventListener('show.bs.modal', function(event) {
+            document.getElementById('deleteModalForm').action = event.relatedTarget.dataset.deleteUrl;
+        });
+    }
+
+    // History page - load older analyses as the user scrolls
+    const historyMore = document.getElementById('history-more');
+    if (historyMore && window.fetch && window.IntersectionObserver) {
+        setupHistoryScroll(historyMore);
+    }
+
     // History page - enhance table with sorting and searching
     const historyTable = document.querySelector('.history-card table');
     if (historyTable) {
@@ -66,3 +95,322 @@ document.addEventListener('DOMContentLoaded', function() {
         });
     }
 });
+
+function setupHistoryScroll(sentinel) {
+    const tbody = document.querySelector('.history-card table tbody');
+    let nextUrl = sentinel.dataset.nextUrl;
+    let loading = false;
+
+    sentinel.innerHTML = '<span class="text-muted small">Loading older analyses...</span>';
+
+    const observer = new IntersectionObserver(function(entries) {
+        if (!entries[0].isIntersecting || loading || !nextUrl) {
+            return;
+        }
+        loading = true;
+        fetch(nextUrl, {headers: {'Accept': 'application/json'}}).then(function(response) {
+            if (!response.ok) {
+                throw new Error('Request failed');
+            }
+            return response.json();
+        }).then(function(page) {
+            page.analyses.forEach(function(analysis) {
+                tbody.appendChild(renderHistoryRow(analysis));
+            });
+            nextUrl = page.next_url;
+            if (!nextUrl) {
+                observer.disconnect();
+                sentinel.remove();
+            }
+        }).catch(function() {
+            observer.disconnect();
+            sentinel.innerHTML = '<span class="text-muted small">Could not load older analyses.</span>';
+        }).finally(function() {
+            loading = false;
+        });
+    }, {rootMargin: '200px'});
+    observer.observe(sentinel);
+}
+
+function renderHistoryRow(analysis) {
+    const row = document.createElement('tr');
+
+    const date = document.createElement('td');
+    date.textContent = analysis.created_at;
+    row.appendChild(date);
+
+    const query = document.createElement('td');
+    const text = analysis.query || '';
+    query.textContent = text.length > 70 ? text.slice(0, 67) + '...' : text;
+    row.appendChild(query);
+
+    const actions = document.createElement('td');
+    const group = document.createElement('div');
+    group.className = 'btn-group';
+    group.setAttribute('role', 'group');
+
+    const view = document.createElement('a');
+    view.href = analysis.url;
+    view.className = 'btn btn-sm btn-outline-primary';
+    view.innerHTML = '<i class="fas fa-eye me-1"></i>View';
+    group.appendChild(view);
+
+    const remove = document.createElement('button');
+    remove.type = 'button';
+    remove.className = 'btn btn-sm btn-outline-danger';
+    remove.dataset.bsToggle = 'modal';
+    remove.dataset.bsTarget = '#deleteModal';
+    remove.dataset.deleteUrl = analysis.delete_url;
+    remove.innerHTML = '<i class="fas fa-trash-alt me-1"></i>Delete';
+    group.appendChild(remove);
+
+    actions.appendChild(group);
+    row.appendChild(actions);
+    return row;
+}
+
+function submitAnalysisJob(form) {
+    const results = document.getElementById('stream-results');
+    const status = document.getElementById('stream-status');
+    const submitButton = form.querySelector('button[type="submit"]');
+
+    // Hide any previously rendered result and show the status line
+    document.querySelectorAll('.results-section').forEach(function(section) {
+        if (section !== results) {
+            section.classList.add('d-none');
+        }
+    });
+    results.classList.remove('d-none');
+    document.getElementById('stream-stock-data').innerHTML = '';
+    document.getElementById('stream-news-summary').textContent = '';
+    document.getElementById('stream-articles').innerHTML = '';
+    document.getElementById('stream-analysis').innerHTML = '';
+    document.getElementById('stream-footer').textContent = '';
+    status.textContent = 'Submitting your query...';
+    submitButton.disabled = true;
+
+    function fail(message) {
+        status.textContent = message || 'An error occurred while processing your query. Please try again.';
+        submitButton.disabled = false;
+    }
+
+    function poll(statusUrl, delay) {
+        setTimeout(function() {
+            fetch(statusUrl, {headers: {'Accept': 'application/json'}}).then(function(response) {
+                return response.json().then(function(data) {
+                    if (!response.ok) {
+                        throw new Error(data.error);
+                    }
+                    return data;
+                });
+            }).then(function(data) {
+                if (data.status === 'done' && data.url) {
+                    window.location.href = data.url;
+                } else if (data.status === 'failed') {
+                    fail(data.error);
+                } else {
+                    status.textContent = data.stage;
+                    // Back off gently while the job waits or runs
+                    poll(statusUrl, Math.min(delay * 1.5, 5000));
+                }
+            }).catch(function(error) {
+                fail(error.message);
+            });
+        }, delay);
+    }
+
+    fetch(form.dataset.jobsUrl, {
+        method: 'POST',
+        body: new FormData(form),
+        headers: {'Accept': 'application/json'}
+    }).then(function(response) {
+        return response.json().then(function(data) {
+            if (!response.ok) {
+                throw new Error(data.error);
+            }
+            status.textContent = data.stage;
+            poll(data.status_url, 1000);
+        });
+    }).catch(function(error) {
+        fail(error.message);
+    });
+}
+
+function streamAnalysis(form) {
+    const results = document.getElementById('stream-results');
+    const status = document.getElementById('stream-status');
+    const analysis = document.getElementById('stream-analysis');
+    const footer = document.getElementById('stream-footer');
+    const submitButton = form.querySelector('button[type="submit"]');
+    let analysisHtml = '';
+
+    // Hide any previously rendered result and reset the streaming panel
+    document.querySelectorAll('.results-section').forEach(function(section) {
+        if (section !== results) {
+            section.classList.add('d-none');
+        }
+    });
+    results.classList.remove('d-none');
+    document.getElementById('stream-stock-data').innerHTML = '';
+    document.getElementById('stream-news-summary').textContent = '';
+    document.getElementById('stream-articles').innerHTML = '';
+    analysis.innerHTML = '';
+    footer.textContent = '';
+    submitButton.disabled = true;
+
+    const handlers = {
+        status: function(data) {
+            status.textContent = data.message;
+        },
+        context: function(data) {
+            status.textContent = 'Generating analysis...';
+            renderStreamContext(data);
+        },
+        token: function(data) {
+            analysisHtml += data.text;
+            analysis.innerHTML = analysisHtml;
+        },
+        done: function(data) {
+            status.textContent = 'Analysis performed at: ' + data.timestamp;
+            footer.textContent = 'Analysis provided by ' + data.model + ' AI model';
+            if (data.url) {
+                footer.appendChild(document.createTextNode(' | '));
+                const link = document.createElement('a');
+                link.href = data.url;
+                link.textContent = 'Permalink';
+                footer.appendChild(link);
+            }
+        },
+        error: function(data) {
+            status.textContent = data.message;
+        }
+    };
+
+    fetch(form.dataset.streamUrl, {
+        method: 'POST',
+        body: new FormData(form),
+        headers: {'Accept': 'text/event-stream'}
+    }).then(function(response) {
+        if (!response.ok || !response.body) {
+            return response.json().then(function(data) {
+                throw new Error(data.error || 'Request failed');
+            });
+        }
+
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+
+        function read() {
+            return reader.read().then(function(chunk) {
+                if (chunk.done) {
+                    return;
+                }
+                buffer += decoder.decode(chunk.value, {stream: true});
+
+                // Server-sent events are separated by a blank line
+                let boundary = buffer.indexOf('\n\n');
+                while (boundary !== -1) {
+                    dispatchStreamEvent(buffer.slice(0, boundary), handlers);
+                    buffer = buffer.slice(boundary + 2);
+                    boundary = buffer.indexOf('\n\n');
+                }
+                return read();
+            });
+        }
+        return read();
+    }).catch(function(error) {
+        status.textContent = error.message || 'An error occurred while processing your query. Please try again.';
+    }).finally(function() {
+        submitButton.disabled = false;
+    });
+}
+
+function dispatchStreamEvent(rawEvent, handlers) {
+    let eventName = 'message';
+    let data = '';
+    rawEvent.split('\n').forEach(function(line) {
+        if (line.startsWith('event:')) {
+            eventName = line.slice(6).trim();
+        } else if (line.startsWith('data:')) {
+            data += line.slice(5).trim();
+        }
+    });
+    if (handlers[eventName] && data) {
+        handlers[eventName](JSON.parse(data));
+    }
+}
+
+function renderStreamContext(data) {
+    document.getElementById('stream-news-summary').textContent = data.news_summary || '';
+
+    const stockContainer = document.getElementById('stream-stock-data');
+    Object.keys(data.stock_data || {}).forEach(function(symbol) {
+        const stock = data.stock_data[symbol];
+        const card = document.createElement('div');
+        card.className = 'stock-data-card mb-4';
+
+        const heading = document.createElement('h4');
+        heading.textContent = 'Stock Information for ' + (stock.name || symbol);
+        card.appendChild(heading);
+
+        [
+            ['Price', '₹' + stock.price],
+            ['Change', stock.change + ' (' + stock.change_percent + ')'],
+            ['Sector', stock.sector],
+            ['Industry', stock.industry],
+            ['Market Cap', stock.market_cap],
+            ['P/E Ratio', stock.pe_ratio],
+            ['Dividend Yield', stock.dividend_yield]
+        ].forEach(function(field) {
+            const line = document.createElement('p');
+            line.className = 'mb-1';
+            const label = document.createElement('strong');
+            label.textContent = field[0] + ': ';
+            line.appendChild(label);
+            line.appendChild(document.createTextNode(field[1]));
+            card.appendChild(line);
+        });
+        stockContainer.appendChild(card);
+    });
+
+    const articleContainer = document.getElementById('stream-articles');
+    if (data.articles && data.articles.length) {
+        const title = document.createElement('h5');
+        title.className = 'mt-4';
+        title.textContent = 'Related Articles';
+        articleContainer.appendChild(title);
+
+        const list = document.createElement('div');
+        list.className = 'article-list';
+        data.articles.forEach(function(article) {
+            const item = document.createElement('div');
+            item.className = 'article-item';
+
+            const heading = document.createElement('h6');
+            heading.textContent = article.title;
+            item.appendChild(heading);
+
+            const meta = document.createElement('p');
+            meta.className = 'text-muted small';
+            meta.textContent = 'Source: ' + article.source + ' | ' + article.published_date;
+            item.appendChild(meta);
+
+            const excerpt = document.createElement('p');
+            excerpt.className = 'article-excerpt';
+            const content = article.content || '';
+            excerpt.textContent = content.length > 150 ? content.slice(0, 147) + '...' : content;
+            item.appendChild(excerpt);
+
+            const link = document.createElement('a');
+            link.href = article.url;
+            link.target = '_blank';
+            link.className = 'btn btn-sm btn-outline-primary';
+            link.textContent = 'Read More';
+            item.appendChild(link);
+
+            list.appendChild(item);
+        });
+        articleContainer.appendChild(list);
+    }
+}
@@ -0,0 +1,50 @@
+from services.alias_index import AliasIndex, bounded_edit_distance
+from test_symbol_extractor import EXTRACTOR
+
+def make_index():
+    index = AliasIndex()
+    index.add("RELIANCE INDUSTRIES", "RELIANCE")
+    index.add("INFOSYS", "INFY")
+    index.add("ASIAN PAINTS", "ASIANPAINT")
+    index.add("TATA CONSULTANCY SERVICES", "TCS")
+    return index
+
+def test_exact_alias():
+    assert make_index().lookup("INFOSYS", 0) == ("INFY", "INFOSYS", 0)
+
+def test_typo_tolerance():
+    index = make_index()
+    assert index.lookup("INFOSIS", 1) == ("INFY", "INFOSYS", 1)
+    # An adjacent transposition is one edit
+    assert index.lookup("RELAINCE INDUSTRIES", 1)[0] == "RELIANCE"
+    assert index.lookup("TATA CONSULTANCY SERVCES", 2)[0] == "TCS"
+
+def test_threshold_cutoff():
+    index = make_index()
+    assert index.lookup("INFOSIS", 0) is None
+    assert index.lookup("INFOSSIS", 1) is None
+    assert index.lookup("ASAIN PIANTS", 1) is None
+    assert index.lookup("ASAIN PIANTS", 2)[0] == "ASIANPAINT"
+    assert index.lookup("HINDUSTAN", 2) is None
+
+def test_bounded_edit_distance():
+    assert bounded_edit_distance("RELAINCE", "RELIANCE", 2) == 1
+    assert bounded_edit_distance("INFOSYS", "INFOSYS", 0) == 0
+    assert bounded_edit_distance("ABC", "XYZ", 2) is None
+    assert bounded_edit_distance("AB", "ABCDE", 2) is None
+
+def test_extractor_fuzzy_matches_capitalised_names_only():
+    assert EXTRACTOR.extract("Infosis results") == ["INFY"]
+    assert EXTRACTOR.extract("Relaince Industries outlook") == ["RELIANCE"]
+    assert EXTRACTOR.extract("Relaince results") == ["RELIANCE"]
+    assert EXTRACTOR.extract("infosis results") == []
+    # Phrases shorter than FUZZY_MIN_LENGTH are never fuzzy matched
+    assert EXTRACTOR.extract("Infu results") == []
+
+if __name__ == "__main__":
+    test_exact_alias()
+    test_typo_tolerance()
+    test_threshold_cutoff()
+    test_bounded_edit_distance()
+    test_extractor_fuzzy_matches_capitalised_names_only()
+    print("ok")
@@ -0,0 +1,93 @@
+import asyncio
+import time
+import httpx
+from services.async_services import AsyncTavilyService
+from services.resilience import CircuitBreaker, Deadline
+from services.tavily_service import TavilyService
+
+class FakeResponse:
+    def __init__(self, status_code, body=None):
+        self.status_code = status_code
+        self.text = ""
+        self._body = body or {}
+
+    def json(self):
+        return self._body
+
+class FakeSession:
+    """Stands in for the HTTP session; answers each post with the next queued status code."""
+
+    def __init__(self, *status_codes):
+        self.status_codes = list(status_codes)
+
+    def post(self, *args, **kwargs):
+        return FakeResponse(self.status_codes.pop(0), {"results": [], "answer": "ok"})
+
+def make_service(breaker, *status_codes):
+    service = TavilyService("test-key", circuit_breaker=breaker, backoff_base=0)
+    service.session = FakeSession(*status_codes)
+    return service
+
+def test_expired_deadline_does_not_hold_half_open_probe():
+    """A search whose deadline is already spent must not take the half-open probe slot."""
+    breaker = CircuitBreaker("tavily", min_calls=1, cooldown_seconds=0.05)
+    service = make_service(breaker, 500, 200)
+
+    result = service._search_uncached("nifty", 5, max_retries=1)
+    assert result["error"] == "API Error: 500"
+    assert breaker.state == CircuitBreaker.OPEN
+
+    time.sleep(0.1)
+    result = service._search_uncached("nifty", 5, max_retries=1, deadline=Deadline(0.0))
+    assert result["error"] == "Deadline exceeded"
+
+    result = service._search_uncached("nifty", 5, max_retries=1)
+    assert "error" not in result
+    assert breaker.state == CircuitBreaker.CLOSED
+
+def test_async_expired_deadline_does_not_hold_half_open_probe():
+    """The async client shares the same attempt logic and must give the probe back too."""
+    breaker = CircuitBreaker("tavily", min_calls=1, cooldown_seconds=0.05)
+    status_codes = [500, 200]
+    async_service = AsyncTavilyService(make_service(breaker))
+    async_service.client = httpx.AsyncClient(
+        base_url="https://api.tavily.com",
+        transport=httpx.MockTransport(lambda request: httpx.Response(status_codes.pop(0), json={"results": []}))
+    )
+
+    async def run():
+        result = await async_service._search_uncached("nifty", 5, max_retries=1)
+        assert result["error"] == "API Error: 500"
+        await asyncio.sleep(0.1)
+        result = await async_service._search_uncached("nifty", 5, max_retries=1, deadline=Deadline(0.0))
+        assert result["error"] == "Deadline exceeded"
+        return await async_service._search_uncached("nifty", 5, max_retries=1)
+
+    assert "error" not in asyncio.run(run())
+    assert breaker.state == CircuitBreaker.CLOSED
+
+def test_open_breaker_fails_fast():
+    breaker = CircuitBreaker("tavily", min_calls=1, cooldown_seconds=60)
+    service = make_service(breaker, 500)
+    service._search_uncached("nifty", 5, max_retries=1)
+
+    result = service._search_uncached("nifty", 5, max_retries=3)
+    assert result["error"] == "Circuit open"
+    assert result["summary"] == "Financial news is temporarily unavailable."
+
+def test_sync_retries_sleep_at_most_max_sync_backoff():
+    service = TavilyService("test-key", circuit_breaker=CircuitBreaker("tavily", min_calls=10),
+                            backoff_base=10, max_sync_backoff=0.1)
+    service.session = FakeSession(500, 500, 500)
+
+    started = time.monotonic()
+    result = service._search_uncached("nifty", 5, max_retries=3, deadline=Deadline(30))
+    assert result["error"] == "API Error: 500"
+    assert time.monotonic() - started < 0.5
+
+if __name__ == "__main__":
+    test_expired_deadline_does_not_hold_half_open_probe()
+    test_async_expired_deadline_does_not_hold_half_open_probe()
+    test_open_breaker_fails_fast()
+    test_sync_retries_sleep_at_most_max_sync_backoff()
+    print("ok")
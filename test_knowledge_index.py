@@ -0,0 +1,72 @@
+import os
+import struct
+import tempfile
+from services.knowledge_index import INDEX_VERSION, KnowledgeIndex
+
+CORPUS = {
+    "diversification.md": """# Diversification
+
+### Spread your risk
+Holding many stocks across sectors lowers the risk that one company sinks the portfolio.
+
+### Rebalancing
+Rebalance once a year so the allocation drifts back to its target.
+""",
+    "debt.txt": """# Debt
+
+### Avoid expensive debt
+Credit card debt compounds against you faster than most investments grow.
+""",
+}
+
+def write_corpus(source_dir):
+    for name, text in CORPUS.items():
+        with open(os.path.join(source_dir, name), "w", encoding="utf-8") as f:
+            f.write(text)
+
+def test_search_ranks_matching_passages_first():
+    with tempfile.TemporaryDirectory() as source_dir:
+        write_corpus(source_dir)
+        index_path = os.path.join(source_dir, "index", "knowledge.idx")
+        index = KnowledgeIndex.load_or_build(source_dir, index_path)
+
+        assert len(index) == 3
+        results = index.search("How do I lower portfolio risk across sectors?", top_k=2)
+        assert [result["heading"] for result in results][0] == "Spread your risk"
+        assert results[0]["score"] >= results[-1]["score"]
+        assert index.search("credit card debt", top_k=3)[0]["source"] == "debt.txt"
+        assert index.search("zzz unknown words") == []
+
+def test_rebuilds_on_version_mismatch():
+    with tempfile.TemporaryDirectory() as source_dir:
+        write_corpus(source_dir)
+        index_path = os.path.join(source_dir, "knowledge.idx")
+        assert KnowledgeIndex.compile(source_dir, index_path)
+        assert not KnowledgeIndex.compile(source_dir, index_path)
+
+        # Rewrite the header as if an older release had built the file
+        with open(index_path, "r+b") as f:
+            f.seek(4)
+            f.write(struct.pack("<I", INDEX_VERSION - 1))
+        assert KnowledgeIndex.stored_checksum(index_path) is None
+
+        index = KnowledgeIndex.load_or_build(source_dir, index_path)
+        assert KnowledgeIndex.stored_checksum(index_path) is not None
+        assert index.search("rebalance allocation")[0]["heading"] == "Rebalancing"
+
+def test_rebuilds_when_sources_change():
+    with tempfile.TemporaryDirectory() as source_dir:
+        write_corpus(source_dir)
+        index_path = os.path.join(source_dir, "knowledge.idx")
+        KnowledgeIndex.compile(source_dir, index_path)
+        with open(os.path.join(source_dir, "gold.md"), "w", encoding="utf-8") as f:
+            f.write("# Gold\n\n### Hedging\nGold can hedge against inflation.\n")
+
+        assert KnowledgeIndex.compile(source_dir, index_path)
+        assert KnowledgeIndex.load(index_path).search("inflation hedge")[0]["title"] == "Gold"
+
+if __name__ == "__main__":
+    test_search_ranks_matching_passages_first()
+    test_rebuilds_on_version_mismatch()
+    test_rebuilds_when_sources_change()
+    print("ok")
@@ -0,0 +1,59 @@
+import time
+from services.model_router import ModelRouter, ModelTier
+
+def make_router(**kwargs):
+    return ModelRouter(
+        [ModelTier("deep", "deep-model", max_tokens=1000, latency_slo=20),
+         ModelTier("fast", "fast-model", max_tokens=600, latency_slo=5)],
+        **kwargs
+    )
+
+def tier_names(tiers):
+    return [tier.name for tier in tiers]
+
+def test_tier_ordering():
+    router = make_router()
+    assert tier_names(router.route("What is the current price of TCS?", {"stock_data": {"TCS": {}}})) == ["fast"]
+    assert tier_names(router.route("Should I invest in TCS for the long-term?", {})) == ["deep", "fast"]
+    # A price question about several stocks still goes to the deep tier
+    context = {"stock_data": {"TCS": {}, "INFY": {}}}
+    assert tier_names(router.route("What is the current price of TCS and INFY?", context)) == ["deep", "fast"]
+
+def test_rate_limited_tier_is_skipped_until_retry_after():
+    router = make_router()
+    deep = router.tiers[0]
+    router.record_failure(deep, "rate_limited", retry_after=0.05)
+    assert tier_names(router.route("Explain the risks of TCS", {})) == ["fast"]
+    assert router.stats()["tiers"]["deep"]["rate_limited"] == 1
+
+    time.sleep(0.1)
+    assert tier_names(router.route("Explain the risks of TCS", {})) == ["deep", "fast"]
+
+def test_only_tier_is_still_tried_while_rate_limited():
+    router = make_router()
+    router.record_failure(router.tiers[1], "rate_limited", retry_after=60)
+    assert tier_names(router.route("What is the current price of TCS?", {})) == ["fast"]
+
+def test_tier_over_latency_slo_falls_back():
+    router = make_router(min_samples=3, degraded_seconds=60)
+    deep = router.tiers[0]
+    for _ in range(3):
+        router.record_success(deep, 25.0, {"prompt_tokens": 100, "completion_tokens": 50})
+    assert router.stats()["tiers"]["deep"]["unavailable"]
+    assert tier_names(router.route("Explain the risks of TCS", {})) == ["fast"]
+
+def test_null_usage_counts_as_zero_tokens():
+    router = make_router()
+    fast = router.tiers[1]
+    router.record_success(fast, 1.0, {"prompt_tokens": None, "completion_tokens": None})
+    router.record_success(fast, 1.0, {"prompt_tokens": 10, "completion_tokens": 5})
+    stats = router.stats()["tiers"]["fast"]
+    assert (stats["prompt_tokens"], stats["completion_tokens"], stats["requests"]) == (10, 5, 2)
+
+if __name__ == "__main__":
+    test_tier_ordering()
+    test_rate_limited_tier_is_skipped_until_retry_after()
+    test_only_tier_is_still_tried_while_rate_limited()
+    test_tier_over_latency_slo_falls_back()
+    test_null_usage_counts_as_zero_tokens()
+    print("ok")
@@ -0,0 +1,102 @@
+import base64
+from datetime import datetime, timedelta
+import bson
+from services.mongodb_service import MongoDBService, decode_page_cursor, encode_page_cursor
+
+def matches(document, query_filter):
+    """Evaluate the equality, $lt and $or filters get_user_analysis_page builds."""
+    for field, condition in query_filter.items():
+        if field == "$or":
+            if not any(matches(document, clause) for clause in condition):
+                return False
+        elif isinstance(condition, dict):
+            if not document[field] < condition["$lt"]:
+                return False
+        elif document[field] != condition:
+            return False
+    return True
+
+class FakeCursor:
+    def __init__(self, documents):
+        self.documents = documents
+
+    def sort(self, keys):
+        for field, direction in reversed(keys):
+            self.documents.sort(key=lambda document: document[field], reverse=direction < 0)
+        return self
+
+    def limit(self, count):
+        return self.documents[:count]
+
+class FakeCollection:
+    def __init__(self, documents):
+        self.documents = documents
+
+    def find(self, query_filter, projection):
+        return FakeCursor([document for document in self.documents if matches(document, query_filter)])
+
+class FakeDatabase:
+    def __init__(self, documents):
+        self.financial_analyses = FakeCollection(documents)
+
+def test_round_trip():
+    created_at = datetime(2024, 3, 5, 14, 30, 15, 123000)
+    last_id = bson.ObjectId()
+    cursor = encode_page_cursor(created_at, last_id)
+    assert "=" not in cursor
+    assert decode_page_cursor(cursor) == (created_at, last_id)
+
+def test_pages_tie_break_on_id_for_equal_created_at():
+    same_time = datetime(2024, 3, 5, 14, 30)
+    documents = [
+        {"_id": bson.ObjectId(), "user_id": "u1", "query": f"query {i}", "created_at": same_time}
+        for i in range(5)
+    ]
+    documents.append({"_id": bson.ObjectId(), "user_id": "u1", "query": "older",
+                      "created_at": same_time - timedelta(days=1)})
+    documents.append({"_id": bson.ObjectId(), "user_id": "u2", "query": "other user", "created_at": same_time})
+    service = MongoDBService(FakeDatabase(documents), compression="none")
+
+    seen = []
+    page, cursor = service.get_user_analysis_page("u1", limit=2)
+    seen.extend(page)
+    while cursor:
+        page, cursor = service.get_user_analysis_page("u1", limit=2, cursor=cursor)
+        seen.extend(page)
+
+    expected = sorted(documents[:5], key=lambda document: document["_id"], reverse=True)
+    assert [summary.id for summary in seen] == [str(document["_id"]) for document in expected] + [str(documents[5]["_id"])]
+
+def test_rejects_garbage_and_tampered_cursors():
+    cursor = encode_page_cursor(datetime(2024, 3, 5, 14, 30), bson.ObjectId())
+    raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+    tampered = [
+        "not a cursor!",
+        "",
+        cursor[:-6],
+        base64.urlsafe_b64encode(raw.replace(b"|", b"#")).decode("ascii"),
+        base64.urlsafe_b64encode(raw + b"|extra").decode("ascii"),
+        base64.urlsafe_b64encode(b"yesterday|" + raw.partition(b"|")[2]).decode("ascii"),
+        base64.urlsafe_b64encode(b"\xff\xfe").decode("ascii"),
+    ]
+    for bad_cursor in tampered:
+        try:
+            decode_page_cursor(bad_cursor)
+        except ValueError:
+            continue
+        raise AssertionError(f"cursor {bad_cursor!r} was accepted")
+
+def test_history_page_rejects_bad_cursor():
+    service = MongoDBService(FakeDatabase([]), compression="none")
+    try:
+        service.get_user_analysis_page("u1", cursor="not a cursor!")
+    except ValueError:
+        return
+    raise AssertionError("a bad cursor was accepted")
+
+if __name__ == "__main__":
+    test_round_trip()
+    test_pages_tie_break_on_id_for_equal_created_at()
+    test_rejects_garbage_and_tampered_cursors()
+    test_history_page_rejects_bad_cursor()
+    print("ok")
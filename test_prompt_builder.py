@@ -0,0 +1,50 @@
+from services.prompt_builder import PromptBuilder, TokenCounter
+
+LONG_TEXT = "Reliance Industries reported strong quarterly earnings driven by retail and telecom growth. " * 400
+
+def make_context(**overrides):
+    context = {
+        "news_summary": LONG_TEXT,
+        "articles": [
+            {"title": "Reliance results", "content": LONG_TEXT},
+            {"title": "Market wrap", "content": LONG_TEXT},
+            {"title": "No body"},
+            {"title": None, "content": None},
+            {"content": "Untitled but present. " * 50},
+            "not an article",
+        ],
+        "stock_data": {
+            "RELIANCE.NS": {"name": "Reliance Industries", "price": 2900.5, "change": "N/A", "sector": None},
+            "TCS.NS": {"error": "Not found"},
+        },
+    }
+    context.update(overrides)
+    return context
+
+def test_build_stays_within_budget_with_oversized_articles():
+    builder = PromptBuilder(budget=1500, max_article_tokens=400)
+    prompt = builder.build("Should I buy Reliance after its results? " * 50, make_context())
+    assert builder.prompt_tokens(prompt) <= 1500
+    assert "Reliance results" in prompt
+    assert "TCS.NS" not in prompt
+
+def test_build_handles_missing_content():
+    builder = PromptBuilder(budget=1500)
+    prompt = builder.build("Outlook for Reliance", {"articles": [{"title": "Empty"}, {}], "stock_data": None})
+    assert builder.prompt_tokens(prompt) <= 1500
+    assert "No news summary available" in prompt
+    assert "Article 1" not in prompt
+
+def test_build_stays_within_budget_at_every_size():
+    counter = TokenCounter()
+    passages = [{"title": "Diversification", "heading": "Basics", "text": LONG_TEXT}]
+    for budget in (1000, 1200, 2000, 3000):
+        builder = PromptBuilder(budget=budget, counter=counter)
+        prompt = builder.build("Compare Reliance and TCS", make_context(), passages=passages)
+        assert builder.prompt_tokens(prompt) <= budget
+
+if __name__ == "__main__":
+    test_build_stays_within_budget_with_oversized_articles()
+    test_build_handles_missing_content()
+    test_build_stays_within_budget_at_every_size()
+    print("ok")
@@ -0,0 +1,56 @@
+import threading
+import time
+from services.cache import SingleFlight, create_cache_backend
+from services.resilience import Deadline
+from services.tavily_service import TavilyService
+
+def start_hung_leader(single_flight, key, release):
+    started = threading.Event()
+
+    def leader():
+        started.set()
+        release.wait()
+        return "leader"
+
+    thread = threading.Thread(target=lambda: single_flight.do(key, leader))
+    thread.start()
+    started.wait()
+    return thread
+
+def test_follower_shares_the_leaders_result():
+    single_flight = SingleFlight()
+    release = threading.Event()
+    thread = start_hung_leader(single_flight, "key", release)
+    threading.Timer(0.05, release.set).start()
+    assert single_flight.do("key", lambda: "follower", timeout=1) == "leader"
+    thread.join()
+
+def test_follower_falls_back_when_the_leader_hangs():
+    single_flight = SingleFlight()
+    release = threading.Event()
+    thread = start_hung_leader(single_flight, "key", release)
+
+    started = time.monotonic()
+    assert single_flight.do("key", lambda: "follower", timeout=0.05, fallback=lambda: "fallback") == "fallback"
+    assert time.monotonic() - started < 0.5
+    release.set()
+    thread.join()
+
+def test_tavily_follower_keeps_to_its_deadline():
+    service = TavilyService("test-key", cache=create_cache_backend("memory", "tavily"))
+    key = service._cache_key(service._search_params("nifty", 5))
+    release = threading.Event()
+    thread = start_hung_leader(service._single_flight, key, release)
+
+    started = time.monotonic()
+    result = service.search_financial_news("nifty", deadline=Deadline(0.05))
+    assert result["error"] == "Deadline exceeded"
+    assert time.monotonic() - started < 0.5
+    release.set()
+    thread.join()
+
+if __name__ == "__main__":
+    test_follower_shares_the_leaders_result()
+    test_follower_falls_back_when_the_leader_hangs()
+    test_tavily_follower_keeps_to_its_deadline()
+    print("ok")
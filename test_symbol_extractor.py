@@ -0,0 +1,52 @@
+import os
+from services.symbol_extractor import SymbolExtractor, company_name_aliases
+
+SYMBOLS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "symbols")
+
+def make_extractor():
+    return SymbolExtractor.from_csv(
+        os.path.join(SYMBOLS_DIR, "nse_equity.csv"),
+        aliases_path=os.path.join(SYMBOLS_DIR, "nse_aliases.csv")
+    )
+
+EXTRACTOR = make_extractor()
+
+def test_plain_tickers():
+    assert EXTRACTOR.extract("Should I buy TCS and INFY?") == ["TCS", "INFY"]
+    assert EXTRACTOR.extract("Compare M&M with BAJAJ-AUTO") == ["M&M", "BAJAJ-AUTO"]
+    # Repeats are reported once, in order of first mention
+    assert EXTRACTOR.extract("INFY or TCS? INFY looks cheaper") == ["INFY", "TCS"]
+
+def test_exchange_suffixes():
+    assert EXTRACTOR.extract("tcs.ns vs RELIANCE.BO") == ["TCS", "RELIANCE.BO"]
+
+def test_company_names():
+    assert EXTRACTOR.extract("How is Reliance Industries doing?") == ["RELIANCE"]
+    assert EXTRACTOR.extract("Tata Consultancy Services outlook") == ["TCS"]
+    assert EXTRACTOR.extract("HDFC Bank vs ICICI Bank") == ["HDFCBANK", "ICICIBANK"]
+
+def test_common_words_are_not_tickers():
+    assert EXTRACTOR.extract("Is now a good time to buy gold?") == []
+    assert EXTRACTOR.extract("yes, I think so") == []
+    # Written in capitals the same words are tickers
+    assert EXTRACTOR.extract("What about YES bank") == ["YESBANK"]
+
+def test_unknown_and_partial_tokens_are_ignored():
+    assert EXTRACTOR.extract("TCSXYZ is not listed") == []
+    assert EXTRACTOR.extract("Tell me about Apple") == []
+    assert EXTRACTOR.extract("") == []
+
+def test_company_name_aliases():
+    assert company_name_aliases("Tata Power Company Limited") == [
+        "TATA POWER COMPANY LIMITED", "TATA POWER COMPANY", "TATA POWER"
+    ]
+    assert company_name_aliases("ABB India (Private) Limited") == ["ABB INDIA LIMITED", "ABB INDIA"]
+
+if __name__ == "__main__":
+    test_plain_tickers()
+    test_exchange_suffixes()
+    test_company_names()
+    test_common_words_are_not_tickers()
+    test_unknown_and_partial_tokens_are_ignored()
+    test_company_name_aliases()
+    print("ok")